@@ -0,0 +1,79 @@
+"""
+Multi-image analysis for POST /upload/batch.
+
+Both YOLO models run once per chunk of images (true batched forward passes
+instead of one call per photo). Each image then continues through the regular
+analysis pipeline on a thread pool, so the per-pepper CV work of different
+images overlaps, and the history rows of every image are written in a single
+transaction at the end.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from models import db
+from analysis_stages import add_analysis_records, run_detection_models_batch, working_image
+from python_modules import timing
+
+
+def analyze_batch(pipeline, models, contexts, config, skip=()):
+    """
+    Run a list of AnalysisContexts through a batch pipeline (build_batch_pipeline).
+    Must be called inside the Flask app context. Returns one error message (None on
+    success) per context; successful contexts carry their response and analysis_id.
+    Raises if the final database commit fails (nothing is written in that case).
+    """
+    errors = [None] * len(contexts)
+    if not contexts:
+        return errors
+
+    # The models see the working images; the pipeline's ingest stage keeps them
+    with timing.stage('ingest'):
+        for ctx in contexts:
+            ctx.work_image, ctx.work_scale = working_image(ctx, config)
+
+    start = time.perf_counter()
+    with timing.stage('inference.batch'):
+        detections = run_detection_models_batch(
+            models, [ctx.work_image for ctx in contexts],
+            mode=config.get('INFERENCE_MODE', 'sequential'),
+            batch_size=config.get('BATCH_INFERENCE_SIZE', 8),
+            config=config,
+            source_shapes=[ctx.source_shape for ctx in contexts],
+            load_originals=[ctx.original_image for ctx in contexts]
+        )
+    print(f"⏱️ Batched detection: {len(contexts)} images in {(time.perf_counter() - start) * 1000:.0f}ms")
+    for ctx, detection in zip(contexts, detections):
+        ctx.precomputed_detections = detection
+
+    def analyze(i):
+        try:
+            pipeline.run(contexts[i], skip=skip)
+        except Exception as e:
+            print(f"Batch image {i + 1} processing error: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            errors[i] = f'Processing error: {str(e)}'
+
+    # Post-detection stages per image; the workers only touch files and numpy, never the db session
+    with ThreadPoolExecutor(max_workers=config.get('BATCH_MAX_WORKERS', 4),
+                            thread_name_prefix='batch-image') as pool:
+        list(pool.map(analyze, range(len(contexts))))
+
+    # One transaction for the whole batch
+    analyses = []
+    try:
+        for ctx, error in zip(contexts, errors):
+            if error is None:
+                analyses.append((ctx, add_analysis_records(ctx)))
+        with timing.stage('db_commit'):
+            db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    for ctx, analysis in analyses:
+        ctx.analysis_id = analysis.id
+        ctx.response['analysis_id'] = analysis.id
+    print(f"✅ Saved {sum(len(ctx.bell_peppers) for ctx, _ in analyses)} peppers from {len(analyses)} images to database")
+    return errors
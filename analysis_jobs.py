@@ -0,0 +1,223 @@
+"""
+Asynchronous analysis jobs for /upload.
+
+The web process saves the upload, inserts an AnalysisJob row and answers 202
+with the job ID. Worker processes (each holding its own models) claim queued
+rows from the same database, run the analysis pipeline, write the history rows
+and store the response JSON on the job. The database table is the broker, so no
+external queue service is needed.
+
+Run the workers next to the web server:
+
+    python analysis_jobs.py --workers 2
+
+or set JOB_WORKERS=<n> to have `python app.py` start them.
+"""
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from models import db, AnalysisJob
+from python_modules import timing
+
+FINISHED_STATUSES = ('done', 'failed')
+
+
+def enqueue_job(user_id, params):
+    """Insert a queued job; params must be JSON-serializable"""
+    job = AnalysisJob(id=uuid.uuid4().hex, user_id=user_id, status='queued', params=json.dumps(params))
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def requeue_stale_jobs(stale_after_s, max_attempts):
+    """Return jobs whose worker died mid-run to the queue (or fail them after max_attempts)"""
+    cutoff = datetime.utcnow() - timedelta(seconds=stale_after_s)
+    stale = AnalysisJob.query.filter(AnalysisJob.status == 'running', AnalysisJob.started_at < cutoff).all()
+    for job in stale:
+        if (job.attempts or 0) >= max_attempts:
+            job.status = 'failed'
+            job.error = f'Worker did not finish the job after {job.attempts} attempt(s)'
+            job.finished_at = datetime.utcnow()
+        else:
+            job.status = 'queued'
+            job.worker = None
+    if stale:
+        db.session.commit()
+        print(f"♻️ Requeued/failed {len(stale)} stale analysis job(s)")
+
+
+def claim_next_job(worker_name):
+    """
+    Atomically move the oldest queued job to 'running' for this worker.
+    The conditional UPDATE only succeeds for one worker when several race for the same row.
+    """
+    for _ in range(5):
+        candidate = db.session.query(AnalysisJob.id).filter_by(status='queued') \
+            .order_by(AnalysisJob.created_at).first()
+        if candidate is None:
+            return None
+        claimed = AnalysisJob.query.filter_by(id=candidate.id, status='queued').update({
+            'status': 'running',
+            'worker': worker_name,
+            'started_at': datetime.utcnow(),
+            'attempts': AnalysisJob.attempts + 1
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed == 1:
+            return AnalysisJob.query.get(candidate.id)
+    return None
+
+
+def run_job(job, pipeline, decode_image, config):
+    """Run one claimed job through the analysis pipeline and store its result"""
+    from analysis_pipeline import AnalysisContext
+    from python_modules import image_quality
+
+    params = json.loads(job.params)
+    timer = timing.StageTimer()
+    previous_timer = timing.activate(timer)
+    try:
+        with open(params['upload_path'], 'rb') as f:
+            image_bytes = f.read()
+        with timer.stage('decode'):
+            decoded = decode_image(image_bytes)
+        if decoded is None:
+            raise ValueError('Could not decode image')
+
+        precheck_mode = params.get('precheck', 'off')
+        quality_report = None
+        if precheck_mode != 'off':
+            with timer.stage('precheck'):
+                quality_report = image_quality.assess(decoded.image, decoded.original_shape or decoded.image.shape, config)
+            if not quality_report['passed'] and precheck_mode == 'reject':
+                job.status = 'failed'
+                job.error = image_quality.rejection_message(quality_report)
+                job.result = json.dumps({'rejected': True, 'image_quality': quality_report})
+                job.finished_at = datetime.utcnow()
+                db.session.commit()
+                print(f"🔎 Job {job.id} rejected by the image pre-check")
+                return
+
+        ctx = AnalysisContext(
+            image=decoded.image,
+            original_shape=decoded.original_shape,
+            load_original=decoded.load_original,
+            timestamp=params['timestamp'],
+            upload_filename=params['upload_filename'],
+            upload_path=params['upload_path'],
+            user_id=job.user_id,
+            overlay_mode=params.get('overlay_mode', 'server'),
+            inference_mode=config['INFERENCE_MODE'],
+            timer=timer
+        )
+        pipeline.run(ctx, skip=params.get('skip', ()))
+        response_data = ctx.response
+        if quality_report is not None and not quality_report['passed']:
+            response_data['image_quality'] = quality_report
+
+        timing.HISTOGRAMS.record(timer)
+        if params.get('include_timings'):
+            response_data['timings'] = {'total_ms': round(timer.total_ms(), 2), 'stages': timer.as_dict()}
+
+        job.status = 'done'
+        job.result = json.dumps(response_data)
+        job.analysis_id = ctx.analysis_id
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        print(f"✅ Job {job.id} done in {timer.total_ms():.0f}ms")
+    except Exception as e:
+        print(f"Job {job.id} failed: {e}")
+        import traceback
+        traceback.print_exc()
+        db.session.rollback()
+        job = AnalysisJob.query.get(job.id)
+        job.status = 'failed'
+        job.error = f'Processing error: {str(e)}'
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+    finally:
+        timing.deactivate(previous_timer)
+
+
+def worker_main(worker_name, poll_interval=0.5):
+    """Worker process loop: load the app (and its models) once, then claim and run jobs"""
+    # Workers run the pipeline themselves, also next to INFERENCE_BACKEND=ipc web processes
+    os.environ['INFERENCE_BACKEND'] = 'local'
+    from app import app, ANALYSIS_PIPELINE, decode_upload
+
+    stale_after = app.config['JOB_STALE_AFTER']
+    max_attempts = app.config['JOB_MAX_ATTEMPTS']
+    print(f"👷 Analysis worker {worker_name} ready (pid {os.getpid()})")
+    last_stale_check = 0.0
+    while True:
+        with app.app_context():
+            if time.time() - last_stale_check > stale_after / 4:
+                requeue_stale_jobs(stale_after, max_attempts)
+                last_stale_check = time.time()
+            job = claim_next_job(worker_name)
+            if job is not None:
+                run_job(job, ANALYSIS_PIPELINE, decode_upload, app.config)
+            db.session.remove()
+        if job is None:
+            time.sleep(poll_interval)
+
+
+def run_worker_pool(workers, poll_interval=0.5):
+    """Start `workers` worker processes and restart any that exit until SIGTERM/SIGINT"""
+    import multiprocessing
+    # spawn: every worker imports torch/ultralytics and loads the models itself
+    context = multiprocessing.get_context('spawn')
+
+    def start(index):
+        process = context.Process(target=worker_main, args=(f'worker-{index}', poll_interval),
+                                  name=f'analysis-worker-{index}')
+        process.start()
+        return process
+
+    processes = {index: start(index) for index in range(workers)}
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"🚀 Started {workers} analysis worker process(es)")
+    try:
+        while not stopping:
+            for index, process in list(processes.items()):
+                if not process.is_alive():
+                    print(f"⚠️ Analysis worker {index} exited ({process.exitcode}); restarting")
+                    processes[index] = start(index)
+            time.sleep(1.0)
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(timeout=10)
+
+
+def spawn_worker_pool(workers, poll_interval=0.5):
+    """Launch the worker pool as a child process of the web server (JOB_WORKERS)"""
+    return subprocess.Popen([
+        sys.executable, os.path.abspath(__file__),
+        '--workers', str(workers), '--poll-interval', str(poll_interval)
+    ])
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run PepperAI analysis job workers')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('JOB_WORKERS', 0)) or 1)
+    parser.add_argument('--poll-interval', type=float, default=float(os.getenv('JOB_POLL_INTERVAL', 0.5)))
+    args = parser.parse_args()
+    run_worker_pool(args.workers, args.poll_interval)
@@ -0,0 +1,324 @@
+"""
+Composable analysis pipeline engine.
+
+A pipeline is a set of named stages. Each stage declares the AnalysisContext
+fields it reads (`requires`) and the fields it produces (`provides`); the engine
+orders stages by those dependencies, runs independent stages of the same level
+concurrently (optional), and lets callers skip optional stages per request.
+Stage implementations are pluggable: replace() swaps a stage for any other
+implementation that provides the same fields.
+
+The default /upload stages live in analysis_stages.py.
+"""
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field, fields
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from python_modules import timing
+from python_modules.mask_index import MaskIndex
+
+
+class PipelineError(Exception):
+    """Invalid stage graph, unknown stage, or a stage returning undeclared outputs"""
+
+
+@dataclass
+class PepperCandidate:
+    """A bell pepper detection that passed validation"""
+    pepper_id: str                   # 'pepper_<n>' in acceptance order
+    index: int                       # 1-based position among the NMS-filtered detections (used in file names)
+    variety: str
+    confidence: float
+    bbox: List[float]                # xyxy in working-image coordinates
+    class_id: int
+    box_index: Optional[int] = None  # position in the model output (masks share this order)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'variety': self.variety,
+            'confidence': self.confidence,
+            'bbox': self.bbox,
+            'class_id': self.class_id,
+            'pepper_id': self.pepper_id
+        }
+
+
+@dataclass
+class PepperCutout:
+    """Refined mask and crops of one pepper"""
+    crop_box: Tuple[int, int, int, int]    # padded crop (x1, y1, x2, y2) in working-image coordinates
+    crop: np.ndarray                       # padded BGR crop
+    mask_origin: Tuple[int, int]           # (x, y) of the tight mask's top-left corner in the working image
+    mask: np.ndarray                       # tight 0/255 mask
+    tight_crop: np.ndarray                 # BGR crop aligned with mask
+    analysis_input: Optional[np.ndarray]   # masked cutout (background blacked out); None if the mask is too small
+    urls: Dict[str, Optional[str]] = field(default_factory=dict)  # crop_url, transparent_png_url, ...
+
+
+@dataclass
+class AnalysisContext:
+    """
+    State shared by the stages of one analysis.
+    The first block is supplied by the caller; every other field is written by
+    exactly one stage and keeps its default when that stage is skipped.
+    """
+    # Inputs
+    image: np.ndarray                      # decoded BGR image (a DCT-reduced decode when original_shape is set)
+    timestamp: str                         # token used in result file names
+    upload_filename: str
+    upload_path: str
+    user_id: Optional[int] = None
+    overlay_mode: str = 'server'
+    inference_mode: str = 'sequential'
+    original_write: Optional[Future] = None  # pending write of the original upload
+    timer: Optional[timing.StageTimer] = None
+    precomputed_detections: Optional[Tuple[dict, dict, dict]] = None  # (results, latency_ms, offsets) from a batched forward pass
+    original_shape: Optional[Tuple[int, ...]] = None  # full-resolution shape of a reduced decode
+    load_original: Optional[Callable[[], np.ndarray]] = None  # full-resolution decode of a reduced decode, on demand
+
+    # ingest
+    work_image: Optional[np.ndarray] = None  # image the analysis runs on (long edge capped at WORKING_MAX_SIDE)
+    work_scale: float = 1.0                  # work_image size / full-resolution size
+    # detect
+    model_results: Dict[str, Any] = field(default_factory=dict)
+    model_latency_ms: Dict[str, float] = field(default_factory=dict)
+    model_offsets: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+    inference_wall_ms: float = 0.0
+    # general_objects
+    general_detections: List[dict] = field(default_factory=list)
+    forbidden_zones: List[dict] = field(default_factory=list)
+    # pepper_candidates
+    pepper_detections: List[dict] = field(default_factory=list)
+    mask_index: Optional[MaskIndex] = None
+    # validate
+    peppers: List[PepperCandidate] = field(default_factory=list)
+    # cutout
+    cutouts: List[PepperCutout] = field(default_factory=list)
+    # quality / ripeness / recommendations: per-pepper response fragments, aligned with peppers
+    quality: List[dict] = field(default_factory=list)
+    ripeness: List[dict] = field(default_factory=list)
+    recommendations: List[dict] = field(default_factory=list)
+    # assemble
+    bell_peppers: List[dict] = field(default_factory=list)
+    avg_quality: float = 0.0
+    # dedupe
+    general_objects: List[dict] = field(default_factory=list)
+    # annotate
+    result_filename: Optional[str] = None
+    result_path: Optional[str] = None
+    # overlay_polygons
+    mask_polygons: List[list] = field(default_factory=list)
+    # persist
+    analysis_id: Optional[int] = None
+    # respond
+    response: Dict[str, Any] = field(default_factory=dict)
+
+    # Full-resolution decode, shared by the stages that need it (crop files, result image)
+    _original: Optional[np.ndarray] = field(default=None, repr=False)
+    _original_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def source_shape(self) -> Tuple[int, ...]:
+        """Shape of the upload at full resolution"""
+        return self.original_shape or self.image.shape
+
+    def original_image(self) -> np.ndarray:
+        """The upload at full resolution (decoded on first use when image is a reduced decode)"""
+        if self.original_shape is None or self.load_original is None:
+            return self.image
+        with self._original_lock:
+            if self._original is None:
+                with timing.stage('decode.original'):
+                    self._original = self.load_original()
+            return self._original
+
+
+INPUT_FIELDS = ('image', 'timestamp', 'upload_filename', 'upload_path', 'user_id',
+                'overlay_mode', 'inference_mode', 'original_write', 'timer', 'precomputed_detections',
+                'original_shape', 'load_original')
+CONTEXT_FIELDS = frozenset(f.name for f in fields(AnalysisContext))
+
+
+class Stage:
+    """
+    Base class for pipeline stages.
+    Subclasses set name / requires / provides and implement run(ctx), which
+    returns a dict with (a subset of) the provided fields.
+    """
+    name: str = ''
+    requires: Tuple[str, ...] = ()
+    provides: Tuple[str, ...] = ()
+    optional: bool = False  # may be skipped per request
+    inline: bool = False    # must run on the calling thread (e.g. needs the Flask app context)
+
+    def run(self, ctx: AnalysisContext) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class FunctionStage(Stage):
+    """Stage backed by a plain function func(ctx) -> dict"""
+
+    def __init__(self, name: str, func: Callable[[AnalysisContext], Dict[str, Any]],
+                 requires: Sequence[str] = (), provides: Sequence[str] = (),
+                 optional: bool = False, inline: bool = False):
+        self.name = name
+        self.func = func
+        self.requires = tuple(requires)
+        self.provides = tuple(provides)
+        self.optional = optional
+        self.inline = inline
+
+    def run(self, ctx: AnalysisContext) -> Dict[str, Any]:
+        return self.func(ctx)
+
+
+class AnalysisPipeline:
+    """
+    Dependency-ordered stage runner.
+    Stages are grouped into levels (a stage's level is one above the highest
+    level of the stages it depends on); with parallel=True, the stages of a
+    level run concurrently on a shared thread pool.
+    """
+
+    def __init__(self, stages: Iterable[Stage] = (), parallel: bool = False, max_workers: int = 4):
+        self.parallel = parallel
+        self.max_workers = max_workers
+        self._stages: Dict[str, Stage] = {}
+        self._levels: Optional[List[List[Stage]]] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()  # run() may be called from several threads (batch uploads)
+        for stage in stages:
+            self.register(stage)
+
+    @property
+    def stages(self) -> List[Stage]:
+        return list(self._stages.values())
+
+    def optional_stages(self) -> Set[str]:
+        return {name for name, stage in self._stages.items() if stage.optional}
+
+    def register(self, stage: Stage) -> 'AnalysisPipeline':
+        if not stage.name:
+            raise PipelineError(f"Stage {stage!r} has no name")
+        if stage.name in self._stages:
+            raise PipelineError(f"Stage '{stage.name}' is already registered")
+        self._check_fields(stage)
+        for other in self._stages.values():
+            clash = set(stage.provides) & set(other.provides)
+            if clash:
+                raise PipelineError(f"Stages '{stage.name}' and '{other.name}' both provide {sorted(clash)}")
+        self._stages[stage.name] = stage
+        self._levels = None
+        return self
+
+    def replace(self, name: str, stage: Stage) -> 'AnalysisPipeline':
+        """Swap the implementation of a stage; the new one must provide at least the same fields"""
+        old = self._stages.get(name)
+        if old is None:
+            raise PipelineError(f"Unknown stage '{name}'")
+        missing = set(old.provides) - set(stage.provides)
+        if missing:
+            raise PipelineError(f"Replacement for '{name}' does not provide {sorted(missing)}")
+        if stage.name != name and stage.name in self._stages:
+            raise PipelineError(f"Stage '{stage.name}' is already registered")
+        self._check_fields(stage)
+        for other in self._stages.values():
+            clash = set(stage.provides) & set(other.provides)
+            if other is not old and clash:
+                raise PipelineError(f"Stages '{stage.name}' and '{other.name}' both provide {sorted(clash)}")
+        # Keep the stage's position (order within a dependency level)
+        self._stages = {(stage.name if key == name else key): (stage if key == name else value)
+                        for key, value in self._stages.items()}
+        self._levels = None
+        return self
+
+    def remove(self, name: str) -> 'AnalysisPipeline':
+        if self._stages.pop(name, None) is None:
+            raise PipelineError(f"Unknown stage '{name}'")
+        self._levels = None
+        return self
+
+    def _check_fields(self, stage: Stage) -> None:
+        unknown = (set(stage.requires) | set(stage.provides)) - CONTEXT_FIELDS
+        if unknown:
+            raise PipelineError(f"Stage '{stage.name}' uses unknown context fields {sorted(unknown)}")
+        if set(stage.provides) & set(INPUT_FIELDS):
+            raise PipelineError(f"Stage '{stage.name}' must not provide input fields")
+
+    def levels(self) -> List[List[Stage]]:
+        """Stages grouped by dependency level (validated and cached until the stage set changes)"""
+        if self._levels is not None:
+            return self._levels
+
+        producer = {key: stage.name for stage in self._stages.values() for key in stage.provides}
+        deps: Dict[str, Set[str]] = {}
+        for stage in self._stages.values():
+            deps[stage.name] = set()
+            for key in stage.requires:
+                if key in producer:
+                    deps[stage.name].add(producer[key])
+                elif key not in INPUT_FIELDS:
+                    raise PipelineError(f"Stage '{stage.name}' requires '{key}', which no stage provides")
+            deps[stage.name].discard(stage.name)
+
+        levels, placed = [], set()
+        remaining = list(self._stages)  # registration order is kept within a level
+        while remaining:
+            ready = [name for name in remaining if deps[name] <= placed]
+            if not ready:
+                raise PipelineError(f"Dependency cycle between stages {sorted(remaining)}")
+            levels.append([self._stages[name] for name in ready])
+            placed.update(ready)
+            remaining = [name for name in remaining if name not in placed]
+
+        self._levels = levels
+        return levels
+
+    def run(self, ctx: AnalysisContext, skip: Iterable[str] = ()) -> AnalysisContext:
+        """Run every stage not in skip (only optional stages can be skipped); returns ctx"""
+        skip = set(skip)
+        unknown = skip - set(self._stages)
+        if unknown:
+            raise PipelineError(f"Unknown stage(s) {sorted(unknown)}")
+        required = sorted(name for name in skip if not self._stages[name].optional)
+        if required:
+            raise PipelineError(f"Stage(s) {required} cannot be skipped")
+
+        for level in self.levels():
+            active = [stage for stage in level if stage.name not in skip]
+            if self.parallel and len(active) > 1:
+                outputs = self._run_concurrently(active, ctx)
+            else:
+                outputs = [(stage, self._run_stage(stage, ctx)) for stage in active]
+            # Stages of one level never read each other's outputs, so apply them afterwards
+            for stage, values in outputs:
+                for key, value in values.items():
+                    setattr(ctx, key, value)
+        return ctx
+
+    def _run_concurrently(self, stages: List[Stage], ctx: AnalysisContext) -> List[Tuple[Stage, Dict[str, Any]]]:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='pipeline-stage')
+        futures = [(stage, self._executor.submit(self._run_stage, stage, ctx))
+                   for stage in stages if not stage.inline]
+        # Inline stages run here while the others are in flight
+        inline = [(stage, self._run_stage(stage, ctx)) for stage in stages if stage.inline]
+        return [(stage, future.result()) for stage, future in futures] + inline
+
+    def _run_stage(self, stage: Stage, ctx: AnalysisContext) -> Dict[str, Any]:
+        # Worker threads have no active timer of their own
+        previous = timing.activate(ctx.timer or timing.current_timer())
+        try:
+            with timing.stage(f'pipeline.{stage.name}'):
+                values = stage.run(ctx) or {}
+        finally:
+            timing.deactivate(previous)
+        undeclared = set(values) - set(stage.provides)
+        if undeclared:
+            raise PipelineError(f"Stage '{stage.name}' returned undeclared fields {sorted(undeclared)}")
+        return values
@@ -0,0 +1,924 @@
+"""
+Default stage implementations for the /upload analysis pipeline.
+
+    ingest -> detect -> general_objects, pepper_candidates -> validate -> cutout
+           -> quality, annotate, overlay_polygons -> ripeness -> recommendations
+           -> assemble -> dedupe -> persist -> respond
+
+Stages receive the shared MODELS dict and the app config at construction, so
+alternative implementations can be plugged in with AnalysisPipeline.replace().
+
+Everything after ingest works on ctx.work_image (long edge capped at
+WORKING_MAX_SIDE). Boxes and masks are mapped back to the original upload only
+for the saved pepper crops, the annotated result image and the coordinates in
+the response / history.
+"""
+
+import copy
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from analysis_pipeline import AnalysisPipeline, PepperCandidate, PepperCutout, Stage
+from models import db, AnalysisHistory, BellPepperDetection
+from python_modules import box_ops, cv_pool, pepper_cv, resolution, tiling, timing
+from python_modules.annotation import render_pepper_highlight, mask_to_polygons
+from python_modules.mask_index import MaskIndex
+
+# Non-pepper object classes that block pepper detection in their region
+NON_PEPPER_OBJECTS = [
+    'apple', 'orange', 'banana', 'lemon', 'strawberry',
+    'tomato', 'person', 'hand', 'carrot', 'broccoli',
+    'pineapple', 'watermelon', 'grape', 'peach', 'pear'
+]
+
+# Padding (px) around each pepper box for crops and masks
+CROP_PADDING = 35
+
+# Worker threads for running the two YOLO models side by side (INFERENCE_MODE=parallel)
+_inference_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='yolo-inference')
+
+# Per-model keyword arguments used for every detection call
+DETECTION_MODEL_KWARGS = {
+    'general_detection': {},
+    'bell_pepper_detection': {'conf': 0.65, 'iou': 0.5},  # High confidence threshold to reduce false positives
+}
+
+def _timed_inference(model, image, **kwargs):
+    start = time.perf_counter()
+    results = model(image, **kwargs)
+    return results, (time.perf_counter() - start) * 1000.0
+
+def _timed_model_inference(key, model, image, config, source_shape=None, load_original=None):
+    """
+    One model on one image; the bell pepper model switches to tiled inference for
+    large uploads (source_shape: size of the original upload when image is the working copy).
+    Tiles are cut from the full-resolution upload (load_original()) and the merged
+    detections are mapped back to image's coordinates.
+    """
+    if key == 'bell_pepper_detection' and tiling.should_tile(source_shape or image.shape, config):
+        start = time.perf_counter()
+        original = load_original() if load_original is not None else image
+        result = tiling.tiled_predict(
+            model, original,
+            tile_size=config.get('TILE_SIZE', 1024),
+            overlap=config.get('TILE_OVERLAP', 0.2),
+            batch_size=config.get('TILE_BATCH_SIZE', 8),
+            full_image_pass=config.get('TILED_FULL_IMAGE_PASS', True),
+            iou_threshold=DETECTION_MODEL_KWARGS[key].get('iou', 0.5),
+            output_scale=image.shape[1] / float(original.shape[1]),
+            **DETECTION_MODEL_KWARGS[key]
+        )
+        return [result], (time.perf_counter() - start) * 1000.0
+    return _timed_inference(model, image, **DETECTION_MODEL_KWARGS[key])
+
+def _pepper_candidate_boxes(pepper_results, min_confidence):
+    """Return the xyxy boxes (N x 4 ndarray) of pepper detections at or above min_confidence"""
+    xyxy, conf, _ = box_ops.boxes_to_numpy(pepper_results[0].boxes if pepper_results else None)
+    return xyxy[conf >= min_confidence]
+
+def _union_roi(boxes_xyxy, image_shape, pad_ratio=0.15):
+    """Padded union rectangle of all boxes, clipped to the image: (x1, y1, x2, y2) ints"""
+    h, w = image_shape[:2]
+    x1, y1 = boxes_xyxy[:, 0].min(), boxes_xyxy[:, 1].min()
+    x2, y2 = boxes_xyxy[:, 2].max(), boxes_xyxy[:, 3].max()
+    pad_x = max(32, (x2 - x1) * pad_ratio)
+    pad_y = max(32, (y2 - y1) * pad_ratio)
+    return (int(max(0, x1 - pad_x)), int(max(0, y1 - pad_y)),
+            int(min(w, x2 + pad_x)), int(min(h, y2 + pad_y)))
+
+def run_detection_models(models, image, mode='sequential', config=None, source_shape=None, load_original=None):
+    """
+    Run the general and bell pepper YOLO models on the same decoded image.
+    In 'parallel' mode both forward passes are submitted to the inference pool at once.
+    In 'cascade' mode the bell pepper model runs first and the general model only runs
+    on the union ROI of the pepper candidates (not at all when there are none).
+    Returns ({model_key: results}, {model_key: latency_ms}, {model_key: (x_offset, y_offset)});
+    offsets map ROI coordinates back to the full image. load_original returns the
+    full-resolution upload for tiled inference.
+    """
+    config = config or {}
+    jobs = [(key, models[key]) for key in ('general_detection', 'bell_pepper_detection') if models[key]]
+    results, latency_ms, offsets = {}, {}, {}
+    # The same YOLO instance must not run two predictions at once (fallback case)
+    distinct_models = len({id(model) for _, model in jobs}) == len(jobs)
+    if mode == 'cascade' and models['bell_pepper_detection']:
+        key = 'bell_pepper_detection'
+        results[key], latency_ms[key] = _timed_model_inference(key, models[key], image, config, source_shape,
+                                                               load_original)
+        min_confidence = config.get('CASCADE_MIN_CONFIDENCE', DETECTION_MODEL_KWARGS[key]['conf'])
+        candidates = _pepper_candidate_boxes(results[key], min_confidence)
+        if models['general_detection'] and len(candidates) > 0:
+            key = 'general_detection'
+            x1, y1, x2, y2 = _union_roi(candidates, image.shape, config.get('CASCADE_ROI_PADDING', 0.15))
+            roi = image[y1:y2, x1:x2]
+            results[key], latency_ms[key] = _timed_inference(models[key], roi, **DETECTION_MODEL_KWARGS[key])
+            offsets[key] = (x1, y1)
+    elif mode == 'parallel' and len(jobs) > 1 and distinct_models:
+        futures = {
+            key: _inference_pool.submit(_timed_model_inference, key, model, image, config, source_shape, load_original)
+            for key, model in jobs
+        }
+        for key, future in futures.items():
+            results[key], latency_ms[key] = future.result()
+    else:
+        for key, model in jobs:
+            results[key], latency_ms[key] = _timed_model_inference(key, model, image, config, source_shape,
+                                                                   load_original)
+    return results, latency_ms, offsets
+
+def run_detection_models_batch(models, images, mode='sequential', batch_size=8, config=None, source_shapes=None,
+                               load_originals=None):
+    """
+    Batched variant of run_detection_models: each YOLO model runs once per chunk of
+    batch_size images (model([image, ...])) instead of once per image.
+    Returns one (results, latency_ms, offsets) tuple per image in input order; the
+    per-image latency is the chunk latency divided by the chunk size. Cascade mode
+    is not applied here (both models see every full image). Images large enough
+    for tiled inference (by source_shapes, the original upload sizes) get their own
+    tiled bell pepper pass on the full-resolution upload (load_originals[i]()).
+    """
+    config = config or {}
+    source_shapes = source_shapes or [image.shape for image in images]
+    jobs = [(key, models[key]) for key in ('general_detection', 'bell_pepper_detection') if models[key]]
+    distinct_models = len({id(model) for _, model in jobs}) == len(jobs)
+    per_image = [({}, {}, {}) for _ in images]
+    batch_size = max(1, int(batch_size))
+
+    tiled = {i for i, shape in enumerate(source_shapes) if tiling.should_tile(shape, config)}
+    if tiled and models['bell_pepper_detection']:
+        key = 'bell_pepper_detection'
+        for i in sorted(tiled):
+            per_image[i][0][key], per_image[i][1][key] = _timed_model_inference(
+                key, models[key], images[i], config, source_shapes[i],
+                load_originals[i] if load_originals else None
+            )
+
+    for start in range(0, len(images), batch_size):
+        indices = range(start, min(start + batch_size, len(images)))
+        # Images that already had a tiled bell pepper pass only go through the general model
+        chunks = {key: [i for i in indices if key not in per_image[i][0]] for key, _ in jobs}
+        calls = [(key, model) for key, model in jobs if chunks[key]]
+        if mode == 'parallel' and len(calls) > 1 and distinct_models:
+            futures = {
+                key: _inference_pool.submit(_timed_inference, model, [images[i] for i in chunks[key]],
+                                            **DETECTION_MODEL_KWARGS[key])
+                for key, model in calls
+            }
+            outputs = {key: future.result() for key, future in futures.items()}
+        else:
+            outputs = {key: _timed_inference(model, [images[i] for i in chunks[key]], **DETECTION_MODEL_KWARGS[key])
+                       for key, model in calls}
+        for key, (results, ms) in outputs.items():
+            for i, result in zip(chunks[key], results):
+                image_results, image_latency, _ = per_image[i]
+                image_results[key] = [result]
+                image_latency[key] = ms / len(chunks[key])
+    return per_image
+
+def filter_overlapping_detections(boxes, conf_threshold=0.5, iou_threshold=0.3, model_names=None):
+    """Apply custom NMS to filter overlapping detections"""
+    if boxes is None or len(boxes) == 0:
+        return []
+
+    # Single device transfer for all boxes, then vectorized confidence filter + NMS
+    xyxy, conf, cls = box_ops.boxes_to_numpy(boxes)
+    candidates = np.flatnonzero(conf >= conf_threshold)
+    keep = candidates[box_ops.nms(xyxy[candidates], conf[candidates], iou_threshold)]
+
+    filtered = []
+    for idx in keep:
+        cls_id = int(cls[idx])
+        # Get class name from model if available
+        class_name = 'bell_pepper'
+        if model_names and cls_id < len(model_names):
+            class_name = model_names[cls_id]
+        filtered.append({
+            'confidence': float(conf[idx]),
+            'class_id': cls_id,
+            'class_name': class_name,
+            'bbox': xyxy[idx].tolist(),
+            'box_index': int(idx)  # position in the model output (masks share this order)
+        })
+
+    return filtered
+
+def dedupe_general_objects(general_detections, bell_peppers, iou_threshold=0.3):
+    """Drop general detections that overlap accepted bell peppers (vectorized)"""
+    if not general_detections:
+        return []
+    overlapping = box_ops.overlaps_any(
+        [g['bbox'] for g in general_detections], [p['bbox'] for p in bell_peppers], iou_threshold
+    )
+    return [g for g, dup in zip(general_detections, overlapping) if not dup]
+
+def _fragment(fragments, i):
+    """Per-pepper fragment i, or {} when the producing stage was skipped"""
+    return fragments[i] if i < len(fragments) else {}
+
+
+class ModelStage(Stage):
+    """Stage with access to the shared MODELS dict and the app config"""
+
+    def __init__(self, models, config):
+        self.models = models
+        self.config = config
+
+    def results_path(self, filename):
+        return os.path.join(self.config['RESULTS_FOLDER'], filename)
+
+
+def working_image(ctx, config):
+    """(work_image, work_scale) for an upload: long edge capped at WORKING_MAX_SIDE"""
+    work_image, scale = resolution.normalize(ctx.image, config.get('WORKING_MAX_SIDE', 0))
+    source_h, source_w = ctx.source_shape[:2]
+    # ctx.image may itself be a reduced decode of the upload
+    scale *= max(ctx.image.shape[:2]) / float(max(source_h, source_w))
+    if scale != 1.0:
+        reduced = f" (decoded at {ctx.image.shape[1]}x{ctx.image.shape[0]})" if ctx.original_shape else ""
+        print(f"📐 Working resolution: {source_w}x{source_h} -> {work_image.shape[1]}x{work_image.shape[0]}{reduced}")
+    return work_image, scale
+
+
+class IngestStage(ModelStage):
+    """Working copy of the upload for inference and CV (the original is kept for full-resolution crops)"""
+    name = 'ingest'
+    requires = ('image', 'original_shape')
+    provides = ('work_image', 'work_scale')
+
+    def run(self, ctx):
+        if ctx.work_image is not None:
+            # Already normalized before a batched forward pass (analyze_batch)
+            return {}
+        work_image, scale = working_image(ctx, self.config)
+        return {'work_image': work_image, 'work_scale': scale}
+
+
+class DetectStage(ModelStage):
+    """Stages 1 + 2 inference: both YOLO models see the same image"""
+    name = 'detect'
+    requires = ('image', 'original_shape', 'load_original', 'work_image', 'inference_mode', 'precomputed_detections')
+    provides = ('model_results', 'model_latency_ms', 'model_offsets', 'inference_wall_ms')
+
+    def run(self, ctx):
+        if ctx.precomputed_detections is not None:
+            # Already run as part of a batch (run_detection_models_batch); latencies are per-image shares
+            results, latency_ms, offsets = ctx.precomputed_detections
+            return {'model_results': results, 'model_latency_ms': latency_ms,
+                    'model_offsets': offsets, 'inference_wall_ms': sum(latency_ms.values())}
+        start = time.perf_counter()
+        results, latency_ms, offsets = run_detection_models(self.models, ctx.work_image, ctx.inference_mode,
+                                                            self.config, source_shape=ctx.source_shape,
+                                                            load_original=ctx.original_image)
+        wall_ms = (time.perf_counter() - start) * 1000.0
+        timing.add('inference', wall_ms)
+        for key, ms in latency_ms.items():
+            timing.add(f'inference.{key}', ms)
+        print(f"⏱️ Detection ({ctx.inference_mode}): " + ", ".join(
+            f"{key}={ms:.0f}ms" for key, ms in latency_ms.items()
+        ) + f", wall={wall_ms:.0f}ms")
+        return {'model_results': results, 'model_latency_ms': latency_ms,
+                'model_offsets': offsets, 'inference_wall_ms': wall_ms}
+
+
+class GeneralObjectsStage(Stage):
+    """Stage 1: general object detections (80 COCO classes) and forbidden zones"""
+    name = 'general_objects'
+    requires = ('model_results', 'model_offsets')
+    provides = ('general_detections', 'forbidden_zones')
+
+    def run(self, ctx):
+        general_detections = []
+        forbidden_zones = []  # Regions confirmed as non-pepper objects
+        if 'general_detection' not in ctx.model_results:
+            return {'general_detections': general_detections, 'forbidden_zones': forbidden_zones}
+
+        general_result = ctx.model_results['general_detection'][0]
+        if general_result.boxes is not None:
+            # Cascade mode runs on a ROI; shift boxes back to full-image coordinates
+            off_x, off_y = ctx.model_offsets.get('general_detection', (0, 0))
+            general_xyxy, general_conf, general_cls = box_ops.boxes_to_numpy(general_result.boxes)
+            general_xyxy = general_xyxy + np.array([off_x, off_y, off_x, off_y], dtype=np.float32)
+            for box_xyxy, box_conf, box_cls in zip(general_xyxy, general_conf, general_cls):
+                conf = float(box_conf)
+                cls = int(box_cls)
+                class_name = general_result.names[cls]
+                xyxy = box_xyxy.tolist()
+
+                general_detections.append({
+                    'class_name': class_name,
+                    'confidence': conf,
+                    'bbox': xyxy,
+                    'class_id': cls
+                })
+
+                # Mark high-confidence non-pepper detections as forbidden zones
+                if class_name.lower() in NON_PEPPER_OBJECTS and conf > 0.6:
+                    forbidden_zones.append({
+                        'class_name': class_name,
+                        'confidence': conf,
+                        'bbox': xyxy
+                    })
+                    print(f"⛔ Forbidden zone: {class_name} ({conf:.2f}) - will block pepper detection in this region")
+        return {'general_detections': general_detections, 'forbidden_zones': forbidden_zones}
+
+
+class PepperCandidatesStage(Stage):
+    """Stage 2: NMS-filtered bell pepper detections and the per-image mask index"""
+    name = 'pepper_candidates'
+    requires = ('work_image', 'model_results')
+    provides = ('pepper_detections', 'mask_index')
+
+    def run(self, ctx):
+        if 'bell_pepper_detection' not in ctx.model_results:
+            return {}
+        pepper_result = ctx.model_results['bell_pepper_detection'][0]
+        if pepper_result.boxes is None:
+            return {}
+
+        model_names = pepper_result.names if hasattr(pepper_result, 'names') else None
+        with timing.stage('nms'):
+            detections = filter_overlapping_detections(
+                pepper_result.boxes,
+                conf_threshold=0.5,
+                iou_threshold=0.3,
+                model_names=model_names
+            )
+
+        # Per-image segmentation mask index (built once, shared by all peppers);
+        # tiled results bring their own index over the tile masks
+        mask_index = getattr(pepper_result, 'mask_index', None)
+        if mask_index is None and getattr(pepper_result, 'masks', None) is not None:
+            try:
+                with timing.stage('mask.index'):
+                    mask_index = MaskIndex(pepper_result.masks, ctx.work_image.shape)
+            except Exception as e:
+                print(f"Mask index error: {e}")
+        return {'pepper_detections': detections, 'mask_index': mask_index}
+
+
+class ValidateStage(ModelStage):
+    """Forbidden-zone rejection plus the multi-layer validation pipeline (or CV fallbacks)"""
+    name = 'validate'
+    requires = ('image', 'original_shape', 'work_image', 'work_scale', 'pepper_detections', 'forbidden_zones')
+    provides = ('peppers',)
+
+    def run(self, ctx):
+        image = ctx.work_image
+        detections = ctx.pepper_detections
+        forbidden_zones = ctx.forbidden_zones
+
+        # Forbidden-zone check for all candidates at once (first zone above IoU 0.3 wins)
+        with timing.stage('nms'):
+            forbidden_idx, forbidden_iou = box_ops.first_overlap(
+                [p['bbox'] for p in detections], [f['bbox'] for f in forbidden_zones], 0.3
+            )
+
+        peppers = []
+        for i, box_data in enumerate(detections):
+            conf = box_data['confidence']
+            class_name = box_data['class_name']
+            xyxy = box_data['bbox']
+
+            print(f"\n🔍 Validating detection {i+1}: {class_name} ({conf:.2f})")
+
+            # EARLY REJECTION: Check if this detection overlaps with forbidden zones
+            if forbidden_idx[i] >= 0:  # Significant overlap
+                forbidden = forbidden_zones[forbidden_idx[i]]
+                print(f"  ⛔ REJECTED: Overlaps with {forbidden['class_name']} (IoU: {forbidden_iou[i]:.2f})")
+                print(f"     General YOLO identified this as {forbidden['class_name']} with {forbidden['confidence']*100:.1f}% confidence")
+                continue  # Skip this detection entirely
+
+            # Crop for validation
+            x1, y1, x2, y2 = map(int, xyxy)
+            h, w = image.shape[:2]
+            temp_crop = image[max(0, y1):min(h, y2), max(0, x1):min(w, x2)]
+            if temp_crop.size == 0:
+                continue
+            # Size limits of the shape check are in original-upload pixels
+            shape_bbox = resolution.box_to_original(xyxy, ctx.work_scale)
+
+            # Use enhanced validation pipeline if available
+            if self.models['validation_pipeline']:
+                is_valid, failed_stage = self.models['validation_pipeline'].full_validation(
+                    temp_crop, shape_bbox, ctx.source_shape
+                )
+                if not is_valid:
+                    print(f"  ❌ Validation failed at stage: {failed_stage}")
+                    continue
+            else:
+                # Fallback to original validation
+                with timing.stage('validation.fallback'):
+                    is_valid = (pepper_cv.validate_pepper_shape(shape_bbox, ctx.source_shape)
+                                and pepper_cv.validate_pepper_color(temp_crop)
+                                and pepper_cv.validate_pepper_texture(temp_crop))
+                if not is_valid:
+                    continue
+
+            print(f"  ✅ Valid bell pepper detected!")
+            peppers.append(PepperCandidate(
+                pepper_id=f'pepper_{len(peppers) + 1}',
+                index=i + 1,
+                variety=class_name,
+                confidence=conf,
+                bbox=xyxy,
+                class_id=box_data['class_id'],
+                box_index=box_data.get('box_index')
+            ))
+        return {'peppers': peppers}
+
+
+class CutoutStage(ModelStage):
+    """Stage 3 prep: refined mask, tight cutout and the crop / transparent PNG files per pepper"""
+    name = 'cutout'
+    requires = ('image', 'original_shape', 'load_original', 'work_image', 'work_scale',
+                'timestamp', 'peppers', 'mask_index')
+    provides = ('cutouts',)
+
+    def run(self, ctx):
+        image = ctx.work_image
+        crop_boxes = [self.crop_box(image, pepper) for pepper in ctx.peppers]
+        segmentation_masks = [self.segmentation_mask(ctx, pepper, crop_box)
+                              for pepper, crop_box in zip(ctx.peppers, crop_boxes)]
+        # Mask refinement (and the GrabCut fallback) per pepper, fanned out to the CV pool for crowded images
+        tasks = []
+        for (x1, y1, x2, y2), mask_crop in zip(crop_boxes, segmentation_masks):
+            if mask_crop is None:
+                # GrabCut works on the full image
+                tasks.append({'image': image, 'crop_box': (x1, y1, x2, y2), 'mask_crop': None, 'padding': CROP_PADDING})
+            else:
+                # Refinement only needs the crop itself
+                tasks.append({'image': image[y1:y2, x1:x2], 'crop_box': (0, 0, x2 - x1, y2 - y1),
+                              'mask_crop': mask_crop, 'padding': CROP_PADDING})
+        masks = cv_pool.run_tasks(pepper_cv.cutout_mask, tasks)
+        # Crop files are cut from the full-resolution upload (decoded only now for reduced decodes)
+        original = ctx.original_image() if ctx.peppers else None
+        return {'cutouts': [self.cutout(ctx, original, pepper, crop_box, mask_crop)
+                            for pepper, crop_box, mask_crop in zip(ctx.peppers, crop_boxes, masks)]}
+
+    def crop_box(self, image, pepper):
+        """Pepper box with padding to avoid edge effects and show more context, clipped to the image"""
+        h, w = image.shape[:2]
+        bx1, by1, bx2, by2 = map(int, pepper.bbox)
+        return (max(0, bx1 - CROP_PADDING), max(0, by1 - CROP_PADDING),
+                min(w, bx2 + CROP_PADDING), min(h, by2 + CROP_PADDING))
+
+    def segmentation_mask(self, ctx, pepper, crop_box):
+        """The pepper's segmentation mask inside crop_box, or None (GrabCut fallback)"""
+        try:
+            if ctx.mask_index is not None:
+                # Direct detection -> mask mapping, upsampled only inside the padded crop
+                with timing.stage('mask.segmentation'):
+                    m_idx = ctx.mask_index.index_for(pepper.box_index, pepper.bbox)
+                    if m_idx >= 0:
+                        return ctx.mask_index.roi_mask(m_idx, crop_box)
+        except Exception:
+            pass
+        return None
+
+    def original_crop(self, ctx, original, crop_box, mask=None):
+        """Crop of the original upload covering crop_box of the working image, and mask upsampled to it"""
+        if ctx.work_scale == 1.0:
+            x1, y1, x2, y2 = crop_box
+            return original[y1:y2, x1:x2], mask
+        x1, y1, x2, y2 = resolution.crop_box_to_original(crop_box, ctx.work_scale, original.shape)
+        if mask is not None:
+            mask = resolution.mask_to_original(mask, (x2 - x1, y2 - y1))
+        return original[y1:y2, x1:x2], mask
+
+    def cutout(self, ctx, original, pepper, crop_box, mask_crop):
+        x1, y1, x2, y2 = crop_box
+        pepper_crop = ctx.work_image[y1:y2, x1:x2]
+
+        # Tight crop around the refined mask to fit the object
+        bounds = pepper_cv.tight_mask_bounds(mask_crop)
+        if bounds is not None:
+            min_x, min_y, max_x, max_y = bounds
+            mask_tight = mask_crop[min_y:max_y+1, min_x:max_x+1]
+            crop_tight = pepper_crop[min_y:max_y+1, min_x:max_x+1]
+            mask_origin = (x1 + min_x, y1 + min_y)
+        else:
+            mask_tight, crop_tight, mask_origin = mask_crop, pepper_crop, (x1, y1)
+
+        analysis_input, binary_alpha = pepper_cv.masked_cutout(crop_tight, mask_tight)
+        urls = {}
+
+        # Masked (transparent) PNG with feathered alpha edges, at the original resolution
+        transparent_name = f'crop_{ctx.timestamp}_{pepper.index}_transparent.png'
+        try:
+            mask_h, mask_w = mask_tight.shape[:2]
+            file_tight, file_mask = self.original_crop(
+                ctx, original, (mask_origin[0], mask_origin[1], mask_origin[0] + mask_w, mask_origin[1] + mask_h), mask_tight
+            )
+            b, g, r = cv2.split(file_tight)
+            rgba = cv2.merge((b, g, r, pepper_cv.feather_alpha(file_mask)))
+            with timing.stage('file_writes'):
+                cv2.imwrite(self.results_path(transparent_name), rgba)
+            urls['transparent_png_url'] = f'/results/{transparent_name}'
+        except Exception as _:
+            urls['transparent_png_url'] = None
+
+        # Save cropped pepper image (original resolution)
+        crop_name = f'crop_{ctx.timestamp}_{pepper.index}.jpg'
+        file_crop, _ = self.original_crop(ctx, original, crop_box)
+        with timing.stage('file_writes'):
+            cv2.imwrite(self.results_path(crop_name), file_crop, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        urls['crop_url'] = f'/results/{crop_name}'
+
+        # Save a tiny preview of the analysis input beside the transparent PNG for verification
+        if analysis_input is not None:
+            try:
+                preview_name = f'crop_{ctx.timestamp}_{pepper.index}_analysis_input_preview.png'
+                b_p, g_p, r_p = cv2.split(analysis_input)
+                with timing.stage('file_writes'):
+                    cv2.imwrite(self.results_path(preview_name), cv2.merge((b_p, g_p, r_p, binary_alpha)))
+                urls['analysis_input_preview_url'] = f'/results/{preview_name}'
+            except Exception:
+                pass
+
+        return PepperCutout(
+            crop_box=(x1, y1, x2, y2),
+            crop=pepper_crop,
+            mask_origin=mask_origin,
+            mask=mask_tight,
+            tight_crop=crop_tight,
+            analysis_input=analysis_input,
+            urls=urls
+        )
+
+
+# Returned by ANFIS when even the fallback analysis fails
+UNKNOWN_QUALITY = {
+    'quality_score': 50.0,
+    'quality_category': "Unknown",
+    'color_uniformity': 50.0,
+    'size_consistency': 50.0,
+    'surface_quality': 50.0,
+    'ripeness_level': 50.0,
+    'recommendations': ["Unable to analyze quality"]
+}
+
+
+class QualityStage(ModelStage):
+    """Stage 3A/3B: CV quality analysis on the masked cutout, ANFIS as fallback"""
+    name = 'quality'
+    requires = ('cutouts',)
+    provides = ('quality',)
+
+    def run(self, ctx):
+        inputs = [cutout.analysis_input for cutout in ctx.cutouts]
+        analyzer = self.models['cv_quality_analyzer']
+        if analyzer:
+            # KMeans / GLCM per pepper, fanned out to the CV pool for crowded images
+            fragments = cv_pool.run_tasks(pepper_cv.cv_quality, [
+                {'analysis_input': analysis_input} for analysis_input in inputs
+            ], shared={'analyzer': analyzer})
+        else:
+            fragments = [{'quality_analysis': None} for _ in inputs]
+        return {'quality': [self.with_fallback(fragment, analysis_input)
+                            for fragment, analysis_input in zip(fragments, inputs)]}
+
+    def with_fallback(self, fragment, analysis_input):
+        quality_analysis = fragment['quality_analysis']
+
+        # Fallback to ANFIS if CV analyzer fails
+        if quality_analysis is None and self.models['anfis_quality']:
+            try:
+                # Keep consistency: analyze masked cutout when available
+                if analysis_input is None:
+                    raise ValueError("Empty/invalid mask for ANFIS analysis")
+                with timing.stage('quality.anfis'):
+                    quality_analysis = self.models['anfis_quality'].analyze_pepper_image(analysis_input)
+            except Exception as e:
+                print(f"ANFIS Quality Analysis error: {e}")
+                quality_analysis = dict(UNKNOWN_QUALITY)
+
+        fragment['quality_analysis'] = quality_analysis
+        return fragment
+
+
+class RipenessStage(Stage):
+    """Stage 3C: CV-based ripeness prediction (consistent with the LAB estimator)"""
+    name = 'ripeness'
+    requires = ('cutouts', 'quality')
+    provides = ('ripeness',)
+    optional = True
+
+    def run(self, ctx):
+        # Only peppers with a quality analysis and a usable cutout get a prediction
+        eligible = [i for i, cutout in enumerate(ctx.cutouts)
+                    if _fragment(ctx.quality, i).get('quality_analysis') and cutout.analysis_input is not None]
+        predictions = dict(zip(eligible, cv_pool.run_tasks(
+            pepper_cv.predict_ripeness,
+            [{'analysis_input': ctx.cutouts[i].analysis_input} for i in eligible],
+            return_exceptions=True
+        )))
+
+        fragments = []
+        for i in range(len(ctx.cutouts)):
+            fragment = {}
+            prediction = predictions.get(i)
+            if isinstance(prediction, Exception):
+                print(f"CV-based ripeness prediction error: {prediction}")
+            elif prediction is not None:
+                fragment['ripeness_prediction'] = prediction
+                # Debug: compare bar vs prediction
+                try:
+                    bar_val = float(_fragment(ctx.quality, i)['quality_analysis'].get('ripeness_level', 0.0))
+                except Exception:
+                    bar_val = -1
+                print(f"   [DBG] Ripeness bar={bar_val:.1f} vs prediction={prediction['ripeness_percentage']:.1f} ({prediction['current_stage']})")
+            fragments.append(fragment)
+        return {'ripeness': fragments}
+
+
+class RecommendationsStage(Stage):
+    """Stage 3D/3E: CV-only secondary estimates (nutrition, shelf life, market) and usage recommendations"""
+    name = 'recommendations'
+    requires = ('peppers', 'cutouts', 'work_scale', 'quality', 'ripeness')
+    provides = ('recommendations',)
+    optional = True
+
+    def run(self, ctx):
+        # Secondary estimates per pepper, fanned out to the CV pool for crowded images
+        estimates, tasks = {}, []
+        for i, cutout in enumerate(ctx.cutouts):
+            quality_analysis = _fragment(ctx.quality, i).get('quality_analysis')
+            try:
+                tasks.append((i, {
+                    'ripeness_pct': float(quality_analysis.get('ripeness_level', 0.0)),
+                    'surface_quality': float(quality_analysis.get('surface_quality', 0.0)),
+                    'size_consistency': float(quality_analysis.get('size_consistency', 0.0)),
+                    'bgr_cutout': cutout.analysis_input,
+                    'area_scale': 1.0 / ctx.work_scale ** 2
+                }))
+            except Exception as e:
+                estimates[i] = e
+        estimates.update(zip([i for i, _ in tasks], cv_pool.run_tasks(
+            pepper_cv.secondary_estimates, [kwargs for _, kwargs in tasks], return_exceptions=True
+        )))
+
+        fragments = []
+        for i, pepper in enumerate(ctx.peppers):
+            fragment = {}
+            quality_analysis = _fragment(ctx.quality, i).get('quality_analysis')
+
+            estimate = estimates.get(i)
+            if isinstance(estimate, Exception):
+                print(f"Secondary CV estimates error: {estimate}")
+            else:
+                nutrition, shelf, market = estimate
+                fragment['nutrition'] = nutrition
+                fragment['shelf_life'] = shelf
+                fragment['market_analysis'] = market
+                print(f"   [DBG] Secondary: weight={nutrition['estimated_weight_g']}g, room={shelf['room_temperature']['days']}d, grade={market['grade']}")
+
+            # Use the SAME ripeness percentage source as ripeness_prediction
+            try:
+                ripeness_pred = _fragment(ctx.ripeness, i).get('ripeness_prediction', {})
+                ripeness_pct = float(ripeness_pred.get('ripeness_percentage', 0.0))
+                # Fallback to quality_analysis if ripeness_prediction not available
+                if ripeness_pct == 0.0:
+                    ripeness_pct = float(quality_analysis.get('ripeness_level', 0.0))
+                surface_quality = float(quality_analysis.get('surface_quality', 0.0))
+                usage = pepper_cv.usage_recommendations(pepper.variety, ripeness_pct, surface_quality)
+                fragment['usage_recommendations'] = usage
+                print(f"   [DBG] Usage: ripeness={ripeness_pct:.1f}%, surface={surface_quality:.1f}%, salad={usage['suitable_for_salad']}, tags={usage['usage_tags']}")
+            except Exception as e:
+                print(f"Usage recommendations error: {e}")
+                fragment['usage_recommendations'] = copy.deepcopy(pepper_cv.DEFAULT_USAGE_RECOMMENDATIONS)
+            fragments.append(fragment)
+        return {'recommendations': fragments}
+
+
+class AssembleStage(Stage):
+    """Merge the per-pepper fragments into the response / history records"""
+    name = 'assemble'
+    requires = ('peppers', 'cutouts', 'work_scale', 'quality', 'ripeness', 'recommendations')
+    provides = ('bell_peppers', 'avg_quality')
+
+    def run(self, ctx):
+        bell_peppers = []
+        for i, (pepper, cutout) in enumerate(zip(ctx.peppers, ctx.cutouts)):
+            data = pepper.as_dict()
+            data['bbox'] = resolution.box_to_original(pepper.bbox, ctx.work_scale)
+            data['transparent_png_url'] = cutout.urls.get('transparent_png_url')
+            if cutout.urls.get('analysis_input_preview_url'):
+                data['analysis_input_preview_url'] = cutout.urls['analysis_input_preview_url']
+            for fragments in (ctx.quality, ctx.ripeness, ctx.recommendations):
+                data.update(_fragment(fragments, i))
+            data.setdefault('quality_analysis', None)
+            data['crop_url'] = cutout.urls.get('crop_url')
+            bell_peppers.append(data)
+
+        avg_quality = float(np.mean([(p.get('quality_analysis') or {}).get('quality_score', 0)
+                                     for p in bell_peppers])) if bell_peppers else 0.0
+        return {'bell_peppers': bell_peppers, 'avg_quality': avg_quality}
+
+
+class DedupeStage(Stage):
+    """Filter general objects to remove bell pepper regions (avoid duplicates)"""
+    name = 'dedupe'
+    requires = ('general_detections', 'bell_peppers', 'work_scale')
+    provides = ('general_objects',)
+
+    def run(self, ctx):
+        # bell_peppers already carry original-image boxes
+        general_detections = [dict(d, bbox=resolution.box_to_original(d['bbox'], ctx.work_scale))
+                              for d in ctx.general_detections]
+        return {'general_objects': dedupe_general_objects(general_detections, ctx.bell_peppers)}
+
+
+class AnnotateStage(ModelStage):
+    """Server overlay: render pepper highlights into res_<timestamp>.jpg (original resolution)"""
+    name = 'annotate'
+    requires = ('image', 'original_shape', 'load_original', 'work_image', 'work_scale', 'timestamp', 'cutouts')
+    provides = ('result_filename', 'result_path')
+    optional = True
+
+    def run(self, ctx):
+        # Same coordinate system as the boxes, polygons and image_size of the response
+        original = ctx.original_image()
+        annotated_image = original.copy()
+        with timing.stage('annotation'):
+            for cutout in ctx.cutouts:
+                # Reuse the refined cutout mask (same region that was analyzed; no second GrabCut)
+                # and render body tint + glow inside the pepper's padded ROI only
+                if cutout.mask is None or cutout.mask.size == 0:
+                    continue
+                mask_h, mask_w = cutout.mask.shape[:2]
+                ox, oy = cutout.mask_origin
+                x1, y1, x2, y2 = resolution.crop_box_to_original(
+                    (ox, oy, ox + mask_w, oy + mask_h), ctx.work_scale, original.shape)
+                if x2 <= x1 or y2 <= y1:
+                    continue
+                mask = resolution.mask_to_original(cutout.mask, (x2 - x1, y2 - y1))
+                render_pepper_highlight(annotated_image, (x1, y1), mask)
+
+        out_name = f'res_{ctx.timestamp}.jpg'
+        out_path = self.results_path(out_name)
+        # Save with high quality (95% JPEG quality)
+        with timing.stage('file_writes'):
+            cv2.imwrite(out_path, annotated_image, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        return {'result_filename': out_name, 'result_path': out_path}
+
+
+class OverlayPolygonsStage(Stage):
+    """Client overlay: vector masks for the browser (response only, not stored in history)"""
+    name = 'overlay_polygons'
+    requires = ('cutouts', 'work_scale')
+    provides = ('mask_polygons',)
+    optional = True
+
+    def run(self, ctx):
+        # The browser draws them over the original upload
+        with timing.stage('mask.polygons'):
+            return {'mask_polygons': [
+                resolution.polygons_to_original(mask_to_polygons(c.mask_origin, c.mask), ctx.work_scale)
+                for c in ctx.cutouts
+            ]}
+
+
+class PersistStage(Stage):
+    """Write AnalysisHistory + BellPepperDetection rows (needs the Flask app context)"""
+    name = 'persist'
+    requires = ('user_id', 'upload_path', 'original_write', 'bell_peppers', 'avg_quality', 'result_path')
+    provides = ('analysis_id',)
+    inline = True
+
+    def run(self, ctx):
+        analysis = add_analysis_records(ctx)
+        with timing.stage('db_commit'):
+            db.session.commit()
+        print(f"✅ Saved {len(ctx.bell_peppers)} peppers to database")
+        return {'analysis_id': analysis.id}
+
+
+class DeferredPersistStage(Stage):
+    """
+    Persist replacement for batch analysis: rows are written later on the request
+    thread with add_analysis_records(), all images in one transaction
+    """
+    name = 'persist'
+    requires = ('bell_peppers', 'avg_quality', 'result_path')
+    provides = ('analysis_id',)
+
+    def run(self, ctx):
+        return {}
+
+
+def add_analysis_records(ctx):
+    """Add the AnalysisHistory + BellPepperDetection rows of one analysis to the session (flushed, not committed)"""
+    # Make sure the original is on disk before history rows reference it
+    if ctx.original_write is not None:
+        with timing.stage('file_writes.original_wait'):
+            ctx.original_write.result()
+
+    bell_peppers = ctx.bell_peppers
+    analysis = AnalysisHistory(
+        user_id=ctx.user_id,
+        image_path=ctx.upload_path,
+        result_path=ctx.result_path,
+        peppers_found=len(bell_peppers),
+        avg_quality=float(ctx.avg_quality),
+        analysis_data=json.dumps(bell_peppers[:3])  # Store first 3 peppers summary
+    )
+    db.session.add(analysis)
+    db.session.flush()  # Get analysis.id before saving peppers
+
+    # Save each individual bell pepper detection to database
+    for pepper_data in bell_peppers:
+        qa = pepper_data.get('quality_analysis') or {}
+
+        # Extract crop filename from crop_url
+        crop_filename = None
+        if pepper_data.get('crop_url'):
+            crop_filename = pepper_data['crop_url'].replace('/results/', '')
+
+        db.session.add(BellPepperDetection(
+            analysis_id=analysis.id,
+            user_id=ctx.user_id,
+            pepper_id=pepper_data.get('pepper_id', 'unknown'),
+            variety=pepper_data.get('variety', 'Bell Pepper'),
+            confidence=float(pepper_data.get('confidence', 0)),
+            crop_path=crop_filename,
+            quality_score=float(qa.get('quality_score', 0)),
+            quality_category=qa.get('quality_category', 'Unknown'),
+            color_uniformity=float(qa.get('color_uniformity', 0)),
+            size_consistency=float(qa.get('size_consistency', 0)),
+            surface_quality=float(qa.get('surface_quality', 0)),
+            ripeness_level=float(qa.get('ripeness_level', 0)),
+            advanced_analysis=json.dumps(pepper_data.get('advanced_analysis', {})),
+            disease_analysis=json.dumps(pepper_data.get('disease_analysis', {})),
+            recommendations=json.dumps(qa.get('recommendations', [])),
+            health_status=pepper_data.get('health_status', 'Unknown'),
+            overall_health_score=float(pepper_data.get('overall_health_score', 0))
+        ))
+    return analysis
+
+
+class RespondStage(ModelStage):
+    """Build the /upload JSON response"""
+    name = 'respond'
+    requires = ('image', 'original_shape', 'upload_filename', 'overlay_mode', 'inference_mode', 'model_results',
+                'model_latency_ms', 'inference_wall_ms', 'bell_peppers', 'avg_quality',
+                'general_objects', 'result_filename', 'mask_polygons', 'analysis_id')
+    provides = ('response',)
+
+    def run(self, ctx):
+        bell_peppers = ctx.bell_peppers
+        if ctx.mask_polygons:
+            bell_peppers = [dict(p, mask_polygons=polygons) for p, polygons in zip(bell_peppers, ctx.mask_polygons)]
+        general_objects = ctx.general_objects
+        return {'response': {
+            'result_url': f'/results/{ctx.result_filename}' if ctx.result_filename else f'/uploads/{ctx.upload_filename}',
+            'overlay_mode': ctx.overlay_mode,
+            'image_size': {'width': int(ctx.source_shape[1]), 'height': int(ctx.source_shape[0])},
+            'analysis_id': ctx.analysis_id,
+            'general_objects': general_objects,
+            'bell_peppers': bell_peppers,
+            'summary': {
+                'total_objects': len(general_objects),
+                'bell_peppers_found': len(bell_peppers),
+                'avg_quality_score': ctx.avg_quality
+            },
+            'inference': {
+                'mode': ctx.inference_mode,
+                'model_latency_ms': {key: round(ms, 1) for key, ms in ctx.model_latency_ms.items()},
+                'general_model_skipped': bool(self.models['general_detection']) and 'general_detection' not in ctx.model_results,
+                'pepper_tiles': getattr((ctx.model_results.get('bell_pepper_detection') or [None])[0], 'tile_count', 0),
+                'wall_ms': round(ctx.inference_wall_ms, 1)
+            },
+            'message': f"Found {len(general_objects)} objects, {len(bell_peppers)} bell peppers"
+        }}
+
+
+def build_default_pipeline(models, config):
+    """The /upload pipeline with the default stage implementations"""
+    return AnalysisPipeline([
+        IngestStage(models, config),
+        DetectStage(models, config),
+        GeneralObjectsStage(),
+        PepperCandidatesStage(),
+        ValidateStage(models, config),
+        CutoutStage(models, config),
+        QualityStage(models, config),
+        AnnotateStage(models, config),
+        OverlayPolygonsStage(),
+        RipenessStage(),
+        RecommendationsStage(),
+        AssembleStage(),
+        DedupeStage(),
+        PersistStage(),
+        RespondStage(models, config),
+    ], parallel=config.get('PIPELINE_PARALLEL_STAGES', False),
+       max_workers=config.get('PIPELINE_MAX_WORKERS', 4))
+
+
+def build_batch_pipeline(models, config):
+    """The default pipeline for /upload/batch: detections come precomputed, persistence is deferred"""
+    return build_default_pipeline(models, config).replace('persist', DeferredPersistStage())
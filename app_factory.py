@@ -0,0 +1,225 @@
+"""
+Application factory.
+
+create_app() builds the Flask app without the ML stack: configuration from the
+environment (.env), the database, the blueprints and the upload/result folders.
+Maintenance scripts and tests start from it in well under a second, without
+importing ultralytics or torch:
+
+    from app_factory import create_app
+    app = create_app()
+
+app.py builds the inference server on the same factory and adds the analysis
+routes and the models; create_app(load_models=True) returns that app.
+"""
+
+import os
+from datetime import timedelta
+
+from dotenv import load_dotenv
+from flask import Flask
+
+from models import db
+
+# Load environment variables from .env file (for local development)
+load_dotenv()
+
+# Resolve absolute base paths to avoid SQLite path issues
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+INSTANCE_DIR = os.path.join(BASE_DIR, 'instance')
+DEFAULT_DB_PATH = os.path.join(INSTANCE_DIR, 'pepperai.db')
+
+
+def configure(app):
+    """Configuration from environment variables with safe absolute fallbacks"""
+    # Ensure instance directory exists before DB init
+    os.makedirs(INSTANCE_DIR, exist_ok=True)
+
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
+
+    # Resolve DATABASE_URL, forcing sqlite paths to absolute if provided relative
+    env_db_url = os.getenv('DATABASE_URL')
+    if env_db_url and env_db_url.startswith('sqlite:///'):
+        _path = env_db_url.replace('sqlite:///', '', 1)
+        if not os.path.isabs(_path):
+            _path = os.path.join(BASE_DIR, _path)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{_path}'
+    else:
+        app.config['SQLALCHEMY_DATABASE_URI'] = env_db_url or f'sqlite:///{DEFAULT_DB_PATH}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
+    _upload_env = os.getenv('UPLOAD_FOLDER', os.path.join(BASE_DIR, 'uploads'))
+    _results_env = os.getenv('RESULTS_FOLDER', os.path.join(BASE_DIR, 'results'))
+    app.config['UPLOAD_FOLDER'] = _upload_env if os.path.isabs(_upload_env) else os.path.join(BASE_DIR, _upload_env)
+    app.config['RESULTS_FOLDER'] = _results_env if os.path.isabs(_results_env) else os.path.join(BASE_DIR, _results_env)
+    app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 16777216))  # 16MB default
+    app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
+
+    # Working resolution: uploads are analyzed (inference, GrabCut, color analysis, annotation) on a
+    # copy whose long edge is capped at WORKING_MAX_SIDE px; pepper crops are still saved from the
+    # original. 0 analyzes at native resolution
+    app.config['WORKING_MAX_SIDE'] = int(os.getenv('WORKING_MAX_SIDE', 2048))
+    # JPEGs about twice that size or larger are decoded at 1/2, 1/4 or 1/8 scale by libjpeg; the
+    # full-resolution decode then only happens when pepper crops are saved
+    app.config['REDUCED_DECODE'] = os.getenv('REDUCED_DECODE', '1') == '1'
+
+    # Detection execution mode: 'sequential' runs the general and bell pepper YOLO models
+    # one after another, 'parallel' runs them concurrently on the same decoded image,
+    # 'cascade' runs the bell pepper model first and the general model only on the
+    # union ROI of pepper candidates (skipped entirely when there are none). Candidates below
+    # CASCADE_MIN_CONFIDENCE do not widen the ROI; the default is the bell pepper model's own
+    # threshold, so the ROI covers exactly the peppers that are reported
+    app.config['INFERENCE_MODE'] = os.getenv('INFERENCE_MODE', 'sequential').lower()
+    app.config['CASCADE_MIN_CONFIDENCE'] = float(os.getenv('CASCADE_MIN_CONFIDENCE', 0.65))
+    app.config['CASCADE_ROI_PADDING'] = float(os.getenv('CASCADE_ROI_PADDING', 0.15))  # fraction of ROI size
+    # Tiled inference (opt-in, trades latency for small-pepper recall): images whose long side reaches
+    # TILED_MIN_SIZE are detected on overlapping full-resolution tiles (TILE_BATCH_SIZE tiles per forward
+    # pass) plus one full-image pass; a 12MP photo takes about 20 tiles, i.e. many times the detection cost
+    app.config['TILED_INFERENCE'] = os.getenv('TILED_INFERENCE', '0') == '1'
+    app.config['TILED_MIN_SIZE'] = int(os.getenv('TILED_MIN_SIZE', 2500))
+    app.config['TILE_SIZE'] = int(os.getenv('TILE_SIZE', 1024))
+    app.config['TILE_OVERLAP'] = float(os.getenv('TILE_OVERLAP', 0.2))
+    app.config['TILE_BATCH_SIZE'] = int(os.getenv('TILE_BATCH_SIZE', 8))
+    app.config['TILED_FULL_IMAGE_PASS'] = os.getenv('TILED_FULL_IMAGE_PASS', '1') == '1'
+
+    # Cross-request micro-batching: single-image forward passes of concurrent requests (YOLO, MobileNetV2
+    # validation, EfficientNet disease model) are collected for up to MICRO_BATCH_WINDOW_MS or
+    # MICRO_BATCH_MAX_SIZE items and run as one batch. Adds up to one window of latency per call
+    app.config['MICRO_BATCHING'] = os.getenv('MICRO_BATCHING', '0') == '1'
+    app.config['MICRO_BATCH_WINDOW_MS'] = float(os.getenv('MICRO_BATCH_WINDOW_MS', 10))
+    app.config['MICRO_BATCH_MAX_SIZE'] = int(os.getenv('MICRO_BATCH_MAX_SIZE', 8))
+
+    # Per-pepper CV work (mask refinement, quality, ripeness, secondary estimates) of one image runs in
+    # CV_POOL_WORKERS processes (0 = in the request thread) once an image has CV_POOL_MIN_PEPPERS peppers
+    app.config['CV_POOL_WORKERS'] = int(os.getenv('CV_POOL_WORKERS', 0))
+    app.config['CV_POOL_MIN_PEPPERS'] = int(os.getenv('CV_POOL_MIN_PEPPERS', 4))
+
+    # Run independent analysis pipeline stages (e.g. annotation alongside quality analysis) concurrently.
+    # Off by default: the stages share torch/OpenCV thread pools, so it only pays off with spare cores
+    app.config['PIPELINE_PARALLEL_STAGES'] = os.getenv('PIPELINE_PARALLEL_STAGES', '0') == '1'
+    app.config['PIPELINE_MAX_WORKERS'] = int(os.getenv('PIPELINE_MAX_WORKERS', 4))
+
+    # Multi-image uploads (/upload/batch): images per request, images per YOLO forward pass,
+    # and images analyzed concurrently after detection. Large batches also need a bigger MAX_CONTENT_LENGTH
+    app.config['BATCH_MAX_IMAGES'] = int(os.getenv('BATCH_MAX_IMAGES', 50))
+    app.config['BATCH_INFERENCE_SIZE'] = int(os.getenv('BATCH_INFERENCE_SIZE', 8))
+    app.config['BATCH_MAX_WORKERS'] = int(os.getenv('BATCH_MAX_WORKERS', 4))
+
+    # Asynchronous analysis (/upload?async=1 -> 202 + job ID). Jobs are queued in the app database and
+    # run by worker processes: `python analysis_jobs.py --workers N`, or JOB_WORKERS=N with `python app.py`
+    app.config['ASYNC_JOBS'] = os.getenv('ASYNC_JOBS', '0') == '1'
+    app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', 0))
+    app.config['JOB_POLL_INTERVAL'] = float(os.getenv('JOB_POLL_INTERVAL', 0.5))  # seconds
+    app.config['JOB_STALE_AFTER'] = int(os.getenv('JOB_STALE_AFTER', 900))  # seconds before a running job is requeued
+    app.config['JOB_MAX_ATTEMPTS'] = int(os.getenv('JOB_MAX_ATTEMPTS', 2))
+    app.config['JOB_EVENTS_TIMEOUT'] = int(os.getenv('JOB_EVENTS_TIMEOUT', 300))  # max SSE stream duration (seconds)
+
+    # Content-addressed result cache: a re-upload of the same bytes (same options, models and config)
+    # re-links the earlier analysis instead of recomputing it (?cache=0 forces a new analysis)
+    app.config['RESULT_CACHE'] = os.getenv('RESULT_CACHE', '1') == '1'
+    app.config['RESULT_CACHE_MAX_ENTRIES'] = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', 1000))
+    app.config['RESULT_CACHE_TTL'] = int(os.getenv('RESULT_CACHE_TTL', 7 * 24 * 3600))  # seconds
+    # Burst coalescing: an upload whose perceptual hash (64-bit dHash) is within BURST_MAX_DISTANCE bits
+    # of one analyzed for the same user in the last BURST_WINDOW seconds reuses that analysis; frames
+    # arriving while such an analysis is still running wait up to BURST_WAIT_TIMEOUT seconds for it.
+    # Off by default: a reused result is never re-graded, so only enable it for burst-shooting clients
+    app.config['BURST_COALESCING'] = os.getenv('BURST_COALESCING', '0') == '1'
+    app.config['BURST_MAX_DISTANCE'] = int(os.getenv('BURST_MAX_DISTANCE', 3))
+    app.config['BURST_WINDOW'] = int(os.getenv('BURST_WINDOW', 30))
+    app.config['BURST_WAIT_TIMEOUT'] = float(os.getenv('BURST_WAIT_TIMEOUT', 60))
+    # Image-quality pre-check before inference: 'reject' answers blurry, badly exposed or tiny photos
+    # with 422 and retake advice, 'warn' analyzes them and flags the response, 'off' skips the check
+    app.config['IMAGE_PRECHECK'] = os.getenv('IMAGE_PRECHECK', 'reject').lower()
+    app.config['PRECHECK_MIN_SIDE'] = int(os.getenv('PRECHECK_MIN_SIDE', 320))  # px, short side of the upload
+    app.config['PRECHECK_MIN_SHARPNESS'] = float(os.getenv('PRECHECK_MIN_SHARPNESS', 25))  # Laplacian variance
+    app.config['PRECHECK_MIN_BRIGHTNESS'] = float(os.getenv('PRECHECK_MIN_BRIGHTNESS', 35))  # mean gray level
+    app.config['PRECHECK_MAX_BRIGHTNESS'] = float(os.getenv('PRECHECK_MAX_BRIGHTNESS', 225))
+    app.config['PRECHECK_MAX_CLIPPED'] = float(os.getenv('PRECHECK_MAX_CLIPPED', 0.6))  # share of black or white pixels
+
+    # Model loading: 'background' builds the models on a warm-up thread after startup, 'lazy' on first use,
+    # 'eager' before the app serves requests (the old behavior). /health/ready answers 503 until all are loaded
+    app.config['MODEL_WARMUP'] = os.getenv('MODEL_WARMUP', 'background').lower()
+    # Warm-up self-test (background and eager loading): once loaded, every model runs WARMUP_ROUNDS dummy inferences
+    # at production input sizes before the process reports ready; /health/warmup shows cold vs warm latency per model
+    app.config['WARMUP_SELF_TEST'] = os.getenv('WARMUP_SELF_TEST', '1') == '1'
+    app.config['WARMUP_ROUNDS'] = int(os.getenv('WARMUP_ROUNDS', 3))
+
+    # Split deployment: with INFERENCE_BACKEND=ipc this process only serves pages and APIs and never loads a
+    # model; /upload and /upload/batch are sent over Unix sockets in INFERENCE_SOCKET_DIR to the inference
+    # processes (`python inference_server.py --workers N`, or INFERENCE_WORKERS=N with `python app.py`),
+    # each analyzing up to INFERENCE_THREADS requests at a time
+    app.config['INFERENCE_BACKEND'] = os.getenv('INFERENCE_BACKEND', 'local').lower()
+    app.config['INFERENCE_WORKERS'] = int(os.getenv('INFERENCE_WORKERS', 0))
+    app.config['INFERENCE_SOCKET_DIR'] = os.getenv('INFERENCE_SOCKET_DIR', os.path.join(INSTANCE_DIR, 'inference'))
+    app.config['INFERENCE_THREADS'] = int(os.getenv('INFERENCE_THREADS', 4))
+    app.config['INFERENCE_TIMEOUT'] = float(os.getenv('INFERENCE_TIMEOUT', 300))  # seconds per request
+
+    # Always include the per-stage 'timings' block in /upload responses (otherwise only with ?timings=1)
+    app.config['RETURN_TIMINGS'] = os.getenv('RETURN_TIMINGS', '0') == '1'
+
+    # Redis configuration (for Docker environment)
+    app.config['REDIS_URL'] = os.getenv('REDIS_URL', None)
+
+    # Flask environment settings
+    app.config['ENV'] = os.getenv('FLASK_ENV', 'development')
+    app.config['DEBUG'] = os.getenv('FLASK_DEBUG', '0') == '1'
+
+
+def print_config(app):
+    """Print configuration info on startup (hide sensitive data)"""
+    print("\n" + "="*60)
+    print("🔧 PepperAI Configuration Loaded")
+    print("="*60)
+    print(f"📍 Environment: {app.config['ENV']}")
+    print(f"🐛 Debug Mode: {app.config['DEBUG']}")
+    print(f"🗄️  Database: {app.config['SQLALCHEMY_DATABASE_URI']}")
+    print(f"📁 Upload Folder: {app.config['UPLOAD_FOLDER']}")
+    print(f"📊 Results Folder: {app.config['RESULTS_FOLDER']}")
+    print(f"📦 Max Upload Size: {app.config['MAX_CONTENT_LENGTH'] / (1024*1024):.1f}MB")
+    print(f"📐 Working Resolution: {str(app.config['WORKING_MAX_SIDE']) + 'px long edge' if app.config['WORKING_MAX_SIDE'] else 'native'}")
+    print(f"⚡ Inference Mode: {app.config['INFERENCE_MODE']}")
+    print(f"🔥 Model Loading: {app.config['MODEL_WARMUP'] if app.config['INFERENCE_BACKEND'] != 'ipc' else 'inference processes'}")
+    print(f"🔎 Image Pre-check: {app.config['IMAGE_PRECHECK']}")
+    print(f"🔴 Redis: {app.config['REDIS_URL'] if app.config['REDIS_URL'] else 'Not configured'}")
+    print(f"🔑 Secret Key: {'Set (secured)' if app.config['SECRET_KEY'] != 'dev-secret-key-change-in-production' else '⚠️  Using default (INSECURE!)'}")
+    print("="*60 + "\n")
+
+
+def register_blueprints(app):
+    from routes import history_bp, statistics_bp, export_bp, pepper_database_bp, notifications_bp, jobs_bp
+    from routes.settings import settings_bp
+    app.register_blueprint(history_bp)
+    app.register_blueprint(statistics_bp)
+    app.register_blueprint(export_bp)
+    app.register_blueprint(pepper_database_bp)
+    app.register_blueprint(notifications_bp)
+    app.register_blueprint(jobs_bp)
+    app.register_blueprint(settings_bp)
+
+
+def create_app(load_models=False, import_name=__name__):
+    """
+    Flask app with config, database and blueprints. load_models=True returns the
+    inference server from app.py instead (analysis routes, models loaded per MODEL_WARMUP).
+    """
+    if load_models:
+        from app import app
+        return app
+
+    app = Flask(import_name)
+    configure(app)
+
+    # Initialize database with app
+    db.init_app(app)
+
+    # Create directories if they don't exist
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['RESULTS_FOLDER'], exist_ok=True)
+
+    register_blueprints(app)
+
+    # Create database tables
+    with app.app_context():
+        db.create_all()
+        print("✅ Database tables created")
+    return app
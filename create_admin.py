@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
-from app import app, db
-from models import User
+from app_factory import create_app
+from models import db, User
+
+app = create_app()  # config and database only, no ML models
 
 with app.app_context():
     admin = User.query.filter_by(username='admin').first()
@@ -86,6 +86,26 @@ class BellPepperDiseaseDetector:
         # Setup image preprocessing
         self.transform = self._get_transforms()
         
+        # Cross-request micro-batching of forward passes (see enable_micro_batching)
+        self._batcher = None
+        
+    def enable_micro_batching(self, max_batch_size: int = 8, max_wait_ms: float = 10.0):
+        """Coalesce concurrent detect_disease() forward passes into batched ones"""
+        from python_modules.micro_batch import MicroBatcher
+        self._batcher = MicroBatcher('efficientnet_b4', self._predict_batch, max_batch_size, max_wait_ms)
+    
+    def _predict_batch(self, input_tensors: List[torch.Tensor]) -> List[torch.Tensor]:
+        """Class probabilities (1 x num_classes each) for a list of preprocessed 1-image batches"""
+        with torch.no_grad():
+            outputs = self.model(torch.cat(input_tensors, dim=0))
+            return list(F.softmax(outputs, dim=1).split(1, dim=0))
+    
+    def predict_probabilities(self, input_tensor: torch.Tensor) -> torch.Tensor:
+        """Class probabilities for one preprocessed image (1 x num_classes)"""
+        if self._batcher is not None:
+            return self._batcher.submit(input_tensor)
+        return self._predict_batch([input_tensor])[0]
+    
     def _get_device(self, device: str) -> torch.device:
         """Automatically detect best available device"""
         if device == 'auto':
@@ -174,9 +194,8 @@ class BellPepperDiseaseDetector:
             # Preprocess image
             input_tensor = self.preprocess_image(image)
             
-            # Get prediction
-            outputs = self.model(input_tensor)
-            probabilities = F.softmax(outputs, dim=1)
+            # Get prediction (batched with other requests when micro-batching is enabled)
+            probabilities = self.predict_probabilities(input_tensor)
             
             # Get top prediction
             confidence, predicted_class = torch.max(probabilities, 1)
@@ -0,0 +1,142 @@
+"""
+Pre-fork server profile (gunicorn):
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The master imports app.py and loads every model once (MODEL_WARMUP=eager,
+preload_app) before forking WEB_WORKERS workers, so the model weights (YOLO,
+MobileNetV2, EfficientNet-B4) are shared copy-on-write instead of being loaded
+once per worker. To keep those pages shared:
+
+- the YOLO models are fused in the master (ultralytics would otherwise fuse,
+  i.e. rewrite, the weights in every worker on its first prediction)
+- gc.freeze() moves everything loaded so far out of the garbage collector's
+  reach, so collections in the workers do not write to those objects' pages
+- torch runs single-threaded in the master: an OpenMP thread pool started
+  before fork does not exist in the children and can deadlock them. Each
+  worker sets its own torch/OpenCV thread count after the fork (TORCH_THREADS,
+  default: CPU cores / WEB_WORKERS)
+- each worker drops the database connections inherited from the master
+
+The warm-up self-test (WARMUP_SELF_TEST) runs in each worker after the fork,
+before it accepts requests: the allocations it warms (thread pools, buffers)
+belong to the process that serves.
+
+Every worker logs its memory split (RSS = shared + private) at startup;
+/api/memory reports it for the master and all workers at runtime.
+"""
+
+import gc
+import os
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Models have to be in memory before the fork to be shared; a background warm-up thread would not
+# survive it. MODEL_WARMUP=lazy loads them per worker instead (nothing shared)
+if os.getenv('MODEL_WARMUP', 'eager').lower() != 'lazy':
+    os.environ['MODEL_WARMUP'] = 'eager'
+# Read by torch/OpenMP on first use in the master; the workers set their own thread count in post_fork
+_inherited_env = {name: os.environ.get(name) for name in ('OMP_NUM_THREADS', 'WARMUP_SELF_TEST')}
+os.environ['OMP_NUM_THREADS'] = '1'
+# The master only loads; each worker runs the self-test itself in post_worker_init
+_worker_self_test = os.getenv('WARMUP_SELF_TEST', '1') == '1'
+os.environ['WARMUP_SELF_TEST'] = '0'
+
+bind = os.getenv('WEB_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_WORKERS', 2))
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', 4))
+timeout = int(os.getenv('WEB_TIMEOUT', 300))  # seconds; analyses of large images take a while on CPU
+preload_app = True
+accesslog = '-'
+
+_background_pools = []
+
+
+def _torch_threads():
+    configured = int(os.getenv('TORCH_THREADS', 0))
+    return configured or max(1, (os.cpu_count() or 1) // workers)
+
+
+def _fuse_detection_models(models):
+    from python_modules.micro_batch import BatchedPredictor
+
+    for key in ('general_detection', 'bell_pepper_detection'):
+        model = models.loaded(key)
+        if isinstance(model, BatchedPredictor):
+            model = model.model
+        if model is None or not hasattr(model, 'fuse'):
+            continue
+        try:
+            model.fuse()
+        except Exception as e:
+            print(f"⚠️ Could not fuse {key} before forking: {e}")
+
+
+def when_ready(server):
+    """Master, app loaded: prepare the shared memory, then start the background pools like `python app.py`"""
+    from app import app, MODELS, result_cache_version
+    from python_modules import memory
+
+    # Processes started from here (job and inference pools) load and warm up on their own
+    for name, value in _inherited_env.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+
+    if app.config['INFERENCE_BACKEND'] != 'ipc' and app.config['MODEL_WARMUP'] == 'eager':
+        _fuse_detection_models(MODELS)
+        if app.config['RESULT_CACHE']:
+            result_cache_version()  # stats the weight files once instead of once per worker
+    app.config['PREFORK_MASTER_PID'] = os.getpid()
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"Master {os.getpid()} ready to fork {workers} worker(s): "
+                    f"{memory.describe(memory.process_memory())}")
+
+    if app.config['JOB_WORKERS'] > 0:
+        from analysis_jobs import spawn_worker_pool
+        _background_pools.append(spawn_worker_pool(app.config['JOB_WORKERS'], app.config['JOB_POLL_INTERVAL']))
+    if app.config['INFERENCE_BACKEND'] == 'ipc' and app.config['INFERENCE_WORKERS'] > 0:
+        import inference_server
+        _background_pools.append(inference_server.spawn_server_pool(app.config['INFERENCE_WORKERS']))
+
+
+def post_fork(server, worker):
+    """Worker, right after the fork: own thread pools and database connections"""
+    threads_per_worker = _torch_threads()
+    torch = sys.modules.get('torch')
+    if torch is not None:
+        torch.set_num_threads(threads_per_worker)
+    cv2 = sys.modules.get('cv2')
+    if cv2 is not None:
+        cv2.setNumThreads(threads_per_worker)
+
+    from app import app
+    from models import db
+    with app.app_context():
+        try:
+            # Leave the master's pooled connections open for the master, just forget them here
+            db.engine.dispose(close=False)
+        except TypeError:  # SQLAlchemy < 1.4.33
+            db.engine.dispose()
+
+
+def post_worker_init(worker):
+    """Worker, before it accepts requests: warm-up self-test and memory report"""
+    from app import app, MODELS
+    from python_modules import memory
+
+    if _worker_self_test and app.config['INFERENCE_BACKEND'] != 'ipc' and app.config['MODEL_WARMUP'] == 'eager':
+        with app.app_context():
+            MODELS.self_test(app.config['WARMUP_ROUNDS'])
+    worker.log.info(f"Worker {worker.pid}: {memory.describe(memory.process_memory())}")
+
+
+def on_exit(server):
+    for pool in _background_pools:
+        pool.terminate()
@@ -0,0 +1,195 @@
+"""
+Inference processes for the split deployment (INFERENCE_BACKEND=ipc).
+
+Web processes then only serve pages and APIs: they import no ML stack and
+never load a model. /upload and /upload/batch send the upload bytes and the
+request options over a local Unix socket to one of a small pool of inference
+processes. Each inference process owns the models (loaded per MODEL_WARMUP),
+runs the same analysis code as a single-process deployment (analyze_upload /
+analyze_upload_batch in app.py) on a few threads and sends the response back.
+
+Every inference process listens on its own socket in INFERENCE_SOCKET_DIR
+(multiprocessing.connection, authenticated with a key derived from SECRET_KEY);
+web processes pick one round-robin and skip sockets nobody listens on. Run the
+pool next to the web server:
+
+    python inference_server.py --workers 2
+
+or set INFERENCE_WORKERS=<n> to have `python app.py` start it.
+"""
+
+import glob
+import hashlib
+import itertools
+import os
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import AuthenticationError, Client, Listener
+
+SOCKET_PATTERN = 'inference-*.sock'
+
+_round_robin = itertools.count()
+
+
+class InferenceUnavailable(Exception):
+    """No inference process answered the request"""
+
+
+def _authkey(config):
+    return hashlib.sha256(f"pepperai-inference:{config['SECRET_KEY']}".encode('utf-8')).digest()
+
+
+def socket_path(socket_dir, index):
+    return os.path.join(socket_dir, SOCKET_PATTERN.replace('*', str(index)))
+
+
+def _connect(config):
+    """Connection to the next reachable inference process (round-robin)"""
+    paths = sorted(glob.glob(os.path.join(config['INFERENCE_SOCKET_DIR'], SOCKET_PATTERN)))
+    if not paths:
+        raise InferenceUnavailable(f"no inference sockets in {config['INFERENCE_SOCKET_DIR']}")
+    start = next(_round_robin)
+    last_error = None
+    for k in range(len(paths)):
+        path = paths[(start + k) % len(paths)]
+        try:
+            return Client(path, family='AF_UNIX', authkey=_authkey(config))
+        except (OSError, EOFError, AuthenticationError) as e:
+            last_error = e  # stale socket of a stopped process
+    raise InferenceUnavailable(f'no inference process reachable: {last_error}')
+
+
+def call(config, operation, **kwargs):
+    """
+    Run an operation (see serve()) in an inference process and return its result.
+    Raises InferenceUnavailable when no process is reachable, it dies or it times out;
+    the request is not retried elsewhere since it may already have written history rows.
+    """
+    conn = _connect(config)
+    try:
+        conn.send((operation, kwargs))
+        if not conn.poll(config['INFERENCE_TIMEOUT']):
+            raise InferenceUnavailable(f"no answer within {config['INFERENCE_TIMEOUT']:.0f}s")
+        ok, result = conn.recv()
+    except (OSError, EOFError) as e:
+        raise InferenceUnavailable(f'inference process connection lost: {e}')
+    finally:
+        conn.close()
+    if not ok:
+        raise RuntimeError(result)
+    return result
+
+
+def broadcast(config, operation, **kwargs):
+    """Run an operation in every reachable inference process; returns the results (for status pages)"""
+    results = []
+    for path in sorted(glob.glob(os.path.join(config['INFERENCE_SOCKET_DIR'], SOCKET_PATTERN))):
+        try:
+            conn = Client(path, family='AF_UNIX', authkey=_authkey(config))
+        except (OSError, EOFError, AuthenticationError):
+            continue
+        try:
+            conn.send((operation, kwargs))
+            if conn.poll(5):
+                ok, result = conn.recv()
+                if ok:
+                    results.append(result)
+        except (OSError, EOFError):
+            pass
+        finally:
+            conn.close()
+    return results
+
+
+def _handle(conn, operations, app):
+    try:
+        operation, kwargs = conn.recv()
+        try:
+            # The app context ends the request's database session, like a Flask request would
+            with app.app_context():
+                reply = (True, operations[operation](**kwargs))
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            reply = (False, f'{type(e).__name__}: {e}')
+        conn.send(reply)
+    except (OSError, EOFError):
+        pass  # client went away
+    finally:
+        conn.close()
+
+
+def serve(index):
+    """Inference process: load the app (models per MODEL_WARMUP) and answer requests on its socket"""
+    # This process runs the analysis itself
+    os.environ['INFERENCE_BACKEND'] = 'local'
+    from app import app, INFERENCE_OPERATIONS
+
+    config = app.config
+    os.makedirs(config['INFERENCE_SOCKET_DIR'], exist_ok=True)
+    path = socket_path(config['INFERENCE_SOCKET_DIR'], index)
+    if os.path.exists(path):
+        os.unlink(path)  # left behind by a previous run of this slot
+    listener = Listener(path, family='AF_UNIX', authkey=_authkey(config))
+    os.chmod(path, 0o600)
+
+    pool = ThreadPoolExecutor(max_workers=config['INFERENCE_THREADS'], thread_name_prefix='inference')
+    print(f"🧠 Inference process {index} listening on {path} (pid {os.getpid()})")
+    while True:
+        try:
+            conn = listener.accept()
+        except (OSError, EOFError, AuthenticationError) as e:
+            print(f"⚠️ Rejected inference connection: {e}")
+            continue
+        pool.submit(_handle, conn, INFERENCE_OPERATIONS, app)
+
+
+def run_server_pool(workers):
+    """Start `workers` inference processes and restart any that exit until SIGTERM/SIGINT"""
+    import multiprocessing
+    # spawn: every inference process imports the ML stack and loads the models itself
+    context = multiprocessing.get_context('spawn')
+
+    def start(index):
+        process = context.Process(target=serve, args=(index,), name=f'inference-{index}')
+        process.start()
+        return process
+
+    processes = {index: start(index) for index in range(workers)}
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"🚀 Started {workers} inference process(es)")
+    try:
+        while not stopping:
+            for index, process in list(processes.items()):
+                if not process.is_alive():
+                    print(f"⚠️ Inference process {index} exited ({process.exitcode}); restarting")
+                    processes[index] = start(index)
+            time.sleep(1.0)
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(timeout=10)
+
+
+def spawn_server_pool(workers):
+    """Launch the inference pool as a child process of the web server (INFERENCE_WORKERS)"""
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__), '--workers', str(workers)])
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run PepperAI inference processes for INFERENCE_BACKEND=ipc web servers')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('INFERENCE_WORKERS', 0)) or 1)
+    args = parser.parse_args()
+    run_server_pool(args.workers)
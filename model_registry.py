@@ -0,0 +1,187 @@
+"""
+On-demand model registry.
+
+MODELS used to be a dict filled at import time: both YOLO models, the
+MobileNetV2 validation pipeline, the disease analyzer and the CV analyzers were
+built before the process could answer even /login. ModelRegistry keeps the
+dict interface the analysis stages use (models['general_detection']) but only
+registers a loader per key; the model is built on first access, or ahead of
+time by warm_up() on a background thread.
+
+Each key loads at most once (concurrent first accesses wait for the same load).
+A loader that raises leaves the key at None, like the old startup code did
+when a model failed to load. state() reports per-model load state and load time
+for /health; ready is True once every model has finished loading (or failed),
+so load balancers can hold back inference traffic until then.
+
+A model can also register a probe: one dummy inference at production input
+sizes. self_test() runs every loaded model's probe a few times, which performs
+the lazy allocations of torch and ultralytics (fused layers, thread pools,
+buffers) before real uploads arrive, and records the first (cold) and the
+following (warm) latencies. While a requested self-test has not finished,
+ready stays False.
+"""
+
+import statistics
+import threading
+import time
+from collections.abc import Mapping
+
+PENDING, LOADING, READY, FAILED, UNAVAILABLE = 'pending', 'loading', 'ready', 'failed', 'unavailable'
+# Self-test states (of the whole registry)
+NOT_REQUESTED, RUNNING, DONE = 'not_requested', 'running', 'done'
+
+
+class _Entry:
+    def __init__(self, loader, description, probe):
+        self.loader = loader
+        self.description = description
+        self.probe = probe
+        self.model = None
+        self.state = PENDING
+        self.load_ms = None
+        self.error = None
+        self.cold_ms = None
+        self.warm_ms = None
+        self.probe_error = None
+        self.lock = threading.Lock()
+
+
+class ModelRegistry(Mapping):
+    """Mapping of model key -> loaded model (or None), loading each model on first access"""
+
+    def __init__(self):
+        self._entries = {}
+        self._warm_up_thread = None
+        self.self_test_state = NOT_REQUESTED
+        self.self_test_ms = None
+
+    def register(self, key, loader, description='', probe=None):
+        """
+        Add a model. loader() returns the model, or None when it is not available
+        (missing optional dependency); exceptions mark the model as failed.
+        probe(model), if given, runs one dummy inference for self_test().
+        """
+        self._entries[key] = _Entry(loader, description, probe)
+        return self
+
+    def __getitem__(self, key):
+        entry = self._entries[key]
+        if entry.state in (PENDING, LOADING):
+            self._load(key, entry)
+        return entry.model
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def loaded(self, key):
+        """Model of key if it has already been loaded, without triggering a load"""
+        return self._entries[key].model
+
+    def _load(self, key, entry):
+        with entry.lock:
+            if entry.state not in (PENDING, LOADING):
+                return  # loaded by another thread while this one waited
+            entry.state = LOADING
+            start = time.perf_counter()
+            try:
+                model = entry.loader()
+            except Exception as e:
+                print(f"❌ Failed to load {key}: {e}")
+                entry.model, entry.state, entry.error = None, FAILED, str(e)
+            else:
+                entry.model, entry.state = model, READY if model is not None else UNAVAILABLE
+            entry.load_ms = (time.perf_counter() - start) * 1000
+            if entry.state == READY:
+                print(f"✅ {entry.description or key} loaded in {entry.load_ms:.0f}ms")
+
+    def load_all(self, self_test_rounds=0):
+        """Load every registered model in registration order (blocking), then self-test them if rounds > 0"""
+        if self_test_rounds > 0 and self.self_test_state == NOT_REQUESTED:
+            self.self_test_state = RUNNING  # not ready until the self-test below has run
+        for key in self._entries:
+            self[key]
+        if self_test_rounds > 0:
+            self.self_test(self_test_rounds)
+        return self
+
+    def self_test(self, rounds=3):
+        """
+        Run each loaded model's probe `rounds` times: the first run is the cold latency,
+        the median of the others the warm one. Failing probes are reported, not raised.
+        """
+        self.self_test_state = RUNNING
+        start = time.perf_counter()
+        for key, entry in self._entries.items():
+            if entry.probe is None or entry.state != READY:
+                continue
+            latencies = []
+            try:
+                for _ in range(max(2, rounds)):
+                    probe_start = time.perf_counter()
+                    entry.probe(entry.model)
+                    latencies.append((time.perf_counter() - probe_start) * 1000)
+            except Exception as e:
+                print(f"⚠️ Warm-up of {key} failed: {e}")
+                entry.probe_error = str(e)
+                continue
+            entry.cold_ms, entry.warm_ms = latencies[0], statistics.median(latencies[1:])
+            entry.probe_error = None
+            print(f"🔥 {key}: cold {entry.cold_ms:.0f}ms, warm {entry.warm_ms:.0f}ms")
+        self.self_test_ms = (time.perf_counter() - start) * 1000
+        self.self_test_state = DONE
+        return self
+
+    def warm_up(self, self_test_rounds=0):
+        """Load (and optionally self-test) every model on a background thread; returns the thread"""
+        if self._warm_up_thread is None:
+            if self_test_rounds > 0:
+                self.self_test_state = RUNNING
+
+            def run():
+                start = time.perf_counter()
+                self.load_all(self_test_rounds)
+                print(f"🔥 Model warm-up finished in {(time.perf_counter() - start):.1f}s")
+
+            self._warm_up_thread = threading.Thread(target=run, name='model-warm-up', daemon=True)
+            self._warm_up_thread.start()
+        return self._warm_up_thread
+
+    @property
+    def ready(self):
+        """Every model has finished loading (successfully or not) and a requested self-test has run"""
+        return self.self_test_state != RUNNING and \
+            all(entry.state not in (PENDING, LOADING) for entry in self._entries.values())
+
+    def state(self):
+        """Per-model load state for /health"""
+        return {
+            key: {
+                'state': entry.state,
+                'load_ms': round(entry.load_ms, 1) if entry.load_ms is not None else None,
+                **({'error': entry.error} if entry.error else {}),
+            }
+            for key, entry in self._entries.items()
+        }
+
+    def self_test_report(self):
+        """Cold vs warm latency per probed model"""
+        models = {}
+        for key, entry in self._entries.items():
+            if entry.probe is None:
+                continue
+            report = {'state': entry.state}
+            if entry.cold_ms is not None:
+                report.update(cold_ms=round(entry.cold_ms, 1), warm_ms=round(entry.warm_ms, 1),
+                              cold_overhead_ms=round(entry.cold_ms - entry.warm_ms, 1))
+            if entry.probe_error:
+                report['error'] = entry.probe_error
+            models[key] = report
+        return {
+            'state': self.self_test_state,
+            'duration_ms': round(self.self_test_ms, 1) if self.self_test_ms is not None else None,
+            'models': models,
+        }
@@ -359,3 +359,68 @@ class NotificationRead(db.Model):
     # Relationships
     user = db.relationship('User', backref=db.backref('notification_reads', lazy=True))
 
+
+class AnalysisJob(db.Model):
+    """Asynchronous /upload analysis; the table doubles as the local job queue (no external broker)"""
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    status = db.Column(db.String(20), default='queued', index=True)  # queued, running, done, failed
+    params = db.Column(db.Text)  # JSON: saved upload, timestamp, overlay mode, skipped stages
+    result = db.Column(db.Text)  # JSON: same payload as a synchronous /upload response
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, default=0)
+    worker = db.Column(db.String(50))  # worker that claimed the job
+    analysis_id = db.Column(db.Integer, db.ForeignKey('analysis_history.id'))
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    user = db.relationship('User', backref=db.backref('analysis_jobs', lazy=True))
+    
+    def to_dict(self, include_result=True):
+        """Convert to dictionary for JSON serialization"""
+        import json
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'analysis_id': self.analysis_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+        if self.status == 'failed':
+            data['error'] = self.error
+        # Done jobs carry the /upload response; jobs rejected by the image pre-check carry its report
+        if include_result and self.result:
+            data['result'] = json.loads(self.result)
+        return data
+
+class AnalysisCacheEntry(db.Model):
+    """Completed /upload analysis keyed by the SHA-256 of the upload bytes (content-addressed result cache)"""
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False, index=True)  # SHA-256 hex of the upload
+    options = db.Column(db.String(200), nullable=False)  # overlay mode and skipped stages of the request
+    version = db.Column(db.String(64), nullable=False, index=True)  # model weights + analysis config fingerprint
+    analysis_id = db.Column(db.Integer, db.ForeignKey('analysis_history.id'), nullable=False)
+    response = db.Column(db.Text)  # JSON: the /upload response (without analysis_id / timings)
+    hits = db.Column(db.Integer, default=0)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    analysis = db.relationship('AnalysisHistory')
+
+class UploadFingerprint(db.Model):
+    """Perceptual hash of a recent /upload per user, for coalescing bursts of near-identical camera frames"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    perceptual_hash = db.Column(db.String(16), nullable=False)  # 64-bit dHash, hex
+    options = db.Column(db.String(200), nullable=False)  # overlay mode and skipped stages of the request
+    version = db.Column(db.String(64), nullable=False)  # model weights + analysis config fingerprint
+    analysis_id = db.Column(db.Integer, db.ForeignKey('analysis_history.id'), nullable=False)
+    response = db.Column(db.Text)  # JSON: the /upload response (without analysis_id / timings)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    analysis = db.relationship('AnalysisHistory')
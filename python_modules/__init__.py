@@ -4,9 +4,19 @@
 __version__ = "1.0.0"
 __author__ = "PepperAI Team"
 
-# Import main classes for easy access
-from .pepper_quality_analyzer import BellPepperQualityAnalyzer
-from .advanced_ai_analyzer import AdvancedPepperAnalyzer
+# Main classes for easy access, imported on first use: they pull in scikit-learn and
+# scikit-image, which code that only needs the light helpers (timing, ...) should not pay for
+_LAZY_EXPORTS = {
+    'BellPepperQualityAnalyzer': 'pepper_quality_analyzer',
+    'AdvancedPepperAnalyzer': 'advanced_ai_analyzer',
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        import importlib
+        return getattr(importlib.import_module(f'.{_LAZY_EXPORTS[name]}', __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 __all__ = [
     'BellPepperQualityAnalyzer',
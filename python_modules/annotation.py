@@ -0,0 +1,113 @@
+"""
+ROI-local annotation rendering for analysis result images.
+All drawing happens inside each pepper's padded region of interest, so the cost
+scales with pepper area instead of pepper count x image size.
+"""
+
+import cv2
+import numpy as np
+from typing import Sequence, Tuple
+
+# Default highlight look (BGR); matches rgba(105,108,255) used by the CSS overlays (approx)
+HIGHLIGHT_COLOR = (255, 108, 105)
+BODY_ALPHA = 0.25
+GLOW_ALPHA = 0.6
+GLOW_SIGMA = 8.0
+GLOW_KERNEL = 9
+GLOW_ITERATIONS = 2
+
+
+def _glow_padding(sigma: float, kernel: int, iterations: int) -> int:
+    """Pixels the glow can reach beyond the mask: dilation radius + Gaussian support"""
+    dilate_radius = (kernel // 2) * iterations
+    # OpenCV 8-bit Gaussian kernel size for sigma-only calls: round(sigma * 6 + 1) | 1
+    blur_radius = (int(round(sigma * 6 + 1)) | 1) // 2
+    return dilate_radius + blur_radius + 1
+
+
+def render_pepper_highlight(image: np.ndarray, origin: Tuple[int, int], mask: np.ndarray,
+                            color: Sequence[float] = HIGHLIGHT_COLOR,
+                            body_alpha: float = BODY_ALPHA, glow_alpha: float = GLOW_ALPHA,
+                            glow_sigma: float = GLOW_SIGMA) -> None:
+    """
+    Draw the soft body tint and outer glow for one pepper, in place.
+
+    Args:
+        image: BGR image to annotate (modified in place)
+        origin: (x, y) of the mask's top-left corner in image coordinates
+        mask: ROI mask (non-zero = pepper)
+        color: BGR highlight color
+    """
+    if mask is None or mask.size == 0 or not mask.any():
+        return
+
+    img_h, img_w = image.shape[:2]
+    ox, oy = int(origin[0]), int(origin[1])
+    pad = _glow_padding(glow_sigma, GLOW_KERNEL, GLOW_ITERATIONS)
+
+    # Padded ROI clipped to the image
+    rx1, ry1 = max(0, ox - pad), max(0, oy - pad)
+    rx2, ry2 = min(img_w, ox + mask.shape[1] + pad), min(img_h, oy + mask.shape[0] + pad)
+    if rx2 <= rx1 or ry2 <= ry1:
+        return
+
+    # Place the mask inside the padded ROI (clipping any part outside the image)
+    roi_mask = np.zeros((ry2 - ry1, rx2 - rx1), dtype=np.uint8)
+    mx1, my1 = max(ox, 0), max(oy, 0)
+    mx2, my2 = min(ox + mask.shape[1], img_w), min(oy + mask.shape[0], img_h)
+    roi_mask[my1 - ry1:my2 - ry1, mx1 - rx1:mx2 - rx1] = np.where(
+        mask[my1 - oy:my2 - oy, mx1 - ox:mx2 - ox] > 0, 255, 0
+    ).astype(np.uint8)
+
+    roi = image[ry1:ry2, rx1:rx2]
+    color_f = np.asarray(color, dtype=np.float32)
+
+    # Body tint: all channels blended in one vectorized op
+    body = roi_mask > 0
+    roi[body] = ((1.0 - body_alpha) * roi[body].astype(np.float32) + body_alpha * color_f).astype(np.uint8)
+
+    # Outer glow from the dilated + blurred mask, restricted to the ROI
+    kernel = np.ones((GLOW_KERNEL, GLOW_KERNEL), np.uint8)
+    dilated = cv2.dilate(roi_mask, kernel, iterations=GLOW_ITERATIONS)
+    glow = cv2.GaussianBlur(dilated, (0, 0), sigmaX=glow_sigma, sigmaY=glow_sigma)
+    alpha = (glow.astype(np.float32) / 255.0 * glow_alpha)[:, :, None]  # 0..glow_alpha
+    roi[:] = np.clip((1.0 - alpha) * roi.astype(np.float32) + alpha * color_f, 0, 255).astype(np.uint8)
+
+
+def draw_label_with_alpha(img: np.ndarray, x: float, y: float, w: float, h: float,
+                          color: Sequence[float], alpha: float = 0.7) -> None:
+    """
+    Composite a filled, semi-transparent label rectangle in place.
+    Only the rectangle's pixels are touched (no whole-image copy).
+    """
+    img_h, img_w = img.shape[:2]
+    # cv2.rectangle fills inclusive of the far corner
+    x1, y1 = max(0, int(x)), max(0, int(y))
+    x2, y2 = min(img_w, int(x + w) + 1), min(img_h, int(y + h) + 1)
+    if x2 <= x1 or y2 <= y1:
+        return
+    region = img[y1:y2, x1:x2]
+    fill = np.empty_like(region)
+    fill[:] = color
+    img[y1:y2, x1:x2] = cv2.addWeighted(fill, alpha, region, 1 - alpha, 0)
+
+
+def mask_to_polygons(origin: Tuple[int, int], mask: np.ndarray,
+                     epsilon_ratio: float = 0.005, min_area: float = 16.0) -> list:
+    """
+    Simplified outer polygons of a ROI mask in image coordinates, for client-side overlays.
+    Returns a list of polygons, each a list of [x, y] integer points.
+    """
+    if mask is None or mask.size == 0:
+        return []
+    contours, _ = cv2.findContours((mask > 0).astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    offset = np.array([int(origin[0]), int(origin[1])])
+    polygons = []
+    for contour in contours:
+        if cv2.contourArea(contour) < min_area:
+            continue
+        epsilon = max(1.0, epsilon_ratio * cv2.arcLength(contour, True))
+        approx = cv2.approxPolyDP(contour, epsilon, True).reshape(-1, 2)
+        if len(approx) >= 3:
+            polygons.append((approx + offset).tolist())
+    return polygons
@@ -0,0 +1,118 @@
+"""
+Vectorized bounding-box operations for detection post-processing.
+All boxes are float arrays in xyxy format (x1, y1, x2, y2), shape (N, 4).
+"""
+
+import numpy as np
+from typing import Tuple
+
+
+def boxes_to_numpy(boxes) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Pull an ultralytics Boxes object to NumPy in a single device transfer
+    (NumPy-backed boxes, e.g. merged tile detections, are used as is).
+    Returns (xyxy (N, 4) float32, conf (N,) float32, cls (N,) int64).
+    """
+    if boxes is None or len(boxes) == 0:
+        return (np.zeros((0, 4), dtype=np.float32),
+                np.zeros((0,), dtype=np.float32),
+                np.zeros((0,), dtype=np.int64))
+
+    # Boxes.data columns: x1, y1, x2, y2, [track_id], conf, cls
+    data = boxes.data
+    if hasattr(data, 'cpu'):
+        data = data.cpu().numpy()
+    data = np.asarray(data).astype(np.float32, copy=False)
+    return data[:, :4], data[:, -2], data[:, -1].astype(np.int64)
+
+
+def as_xyxy_array(boxes) -> np.ndarray:
+    """Convert a list of xyxy boxes (or an existing array) to a (N, 4) float32 array"""
+    if len(boxes) == 0:
+        return np.zeros((0, 4), dtype=np.float32)
+    return np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+
+
+def box_areas(xyxy: np.ndarray) -> np.ndarray:
+    """Areas of (N, 4) boxes; degenerate boxes have area 0"""
+    return np.clip(xyxy[:, 2] - xyxy[:, 0], 0, None) * np.clip(xyxy[:, 3] - xyxy[:, 1], 0, None)
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Pairwise Intersection over Union between (N, 4) and (M, 4) boxes.
+    Returns an (N, M) float32 matrix.
+    """
+    a = as_xyxy_array(a)
+    b = as_xyxy_array(b)
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+
+    inter_x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    inter_y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    inter_x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    inter_y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(inter_x2 - inter_x1, 0, None) * np.clip(inter_y2 - inter_y1, 0, None)
+
+    union = box_areas(a)[:, None] + box_areas(b)[None, :] - inter
+    iou = np.zeros_like(inter, dtype=np.float32)
+    np.divide(inter, union, out=iou, where=union > 0)
+    return iou
+
+
+def nms(xyxy: np.ndarray, scores: np.ndarray, iou_threshold: float = 0.3) -> np.ndarray:
+    """
+    Greedy non-maximum suppression.
+    A box is kept when its IoU with every previously kept (higher scoring) box is
+    <= iou_threshold. Returns kept indices ordered by descending score.
+    """
+    xyxy = as_xyxy_array(xyxy)
+    if len(xyxy) == 0:
+        return np.zeros((0,), dtype=np.int64)
+
+    # Stable sort keeps input order for equal scores
+    order = np.argsort(-np.asarray(scores), kind='stable')
+    iou = iou_matrix(xyxy[order], xyxy[order])
+
+    suppressed = np.zeros(len(order), dtype=bool)
+    keep = []
+    for i in range(len(order)):
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        suppressed |= iou[i] > iou_threshold
+    return order[np.asarray(keep, dtype=np.int64)]
+
+
+def best_overlap(a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    For each box in a, the highest IoU against any box in b and the index of that box.
+    When b is empty the IoU is 0 and the index is -1.
+    """
+    iou = iou_matrix(a, b)
+    if iou.shape[1] == 0:
+        return np.zeros((iou.shape[0],), dtype=np.float32), np.full((iou.shape[0],), -1, dtype=np.int64)
+    idx = np.argmax(iou, axis=1)
+    return iou[np.arange(iou.shape[0]), idx], idx
+
+
+def first_overlap(a: np.ndarray, b: np.ndarray, iou_threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    For each box in a, the index of the first box in b whose IoU exceeds iou_threshold
+    (-1 if none) and that IoU value. Mirrors a sequential "break on first hit" scan.
+    """
+    iou = iou_matrix(a, b)
+    if iou.shape[1] == 0:
+        return np.full((iou.shape[0],), -1, dtype=np.int64), np.zeros((iou.shape[0],), dtype=np.float32)
+    hits = iou > iou_threshold
+    idx = np.where(hits.any(axis=1), np.argmax(hits, axis=1), -1)
+    values = np.where(idx >= 0, iou[np.arange(iou.shape[0]), np.clip(idx, 0, None)], 0.0)
+    return idx, values.astype(np.float32)
+
+
+def overlaps_any(a: np.ndarray, b: np.ndarray, iou_threshold: float = 0.3) -> np.ndarray:
+    """Boolean mask over a: True where the box overlaps any box in b above iou_threshold"""
+    iou = iou_matrix(a, b)
+    if iou.shape[1] == 0:
+        return np.zeros((iou.shape[0],), dtype=bool)
+    return (iou > iou_threshold).any(axis=1)
@@ -0,0 +1,233 @@
+"""
+Process pool for the per-pepper CV work of one image.
+
+Mask refinement, quality analysis (KMeans, GLCM), ripeness and secondary
+estimates are pure NumPy/OpenCV functions (pepper_cv), so the crops of one image
+can be analyzed in parallel worker processes. The arrays of a call are copied
+once into a single shared-memory block; workers attach to it and build NumPy
+views instead of receiving pickled copies. Results come back in task order.
+
+Heavy objects every task needs (e.g. the quality analyzer) are built once per
+worker by the pool initializer from the factories given to configure(); tasks
+only name them. Stage timings recorded inside a worker travel back with its
+result and are merged into the calling request's timer.
+
+The pool is disabled until configure(workers > 0) and starts on first use.
+"""
+
+import importlib
+import importlib.machinery
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+
+from . import timing
+
+_settings = {'workers': 0, 'min_tasks': 4, 'worker_objects': {}}
+_pool = None
+_pool_lock = threading.Lock()
+_spawn_lock = threading.Lock()  # submits from several request threads share the __main__ override
+
+# Worker processes only: objects built by the pool initializer (name -> instance)
+_worker_objects = {}
+
+
+def configure(workers, min_tasks=4, worker_objects=None):
+    """
+    Set the pool size (0 disables fan-out), the smallest task count worth sending to it and
+    the objects each worker builds once at startup: {name: 'package.module:factory'}
+    """
+    global _pool
+    with _pool_lock:
+        _settings['workers'] = max(0, int(workers))
+        _settings['min_tasks'] = max(1, int(min_tasks))
+        _settings['worker_objects'] = dict(worker_objects or {})
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def enabled(task_count):
+    return _settings['workers'] > 0 and task_count >= _settings['min_tasks']
+
+
+def shutdown():
+    configure(0, _settings['min_tasks'], _settings['worker_objects'])
+
+
+def _init_worker(factories):
+    """Pool initializer: build the configured worker objects once per process"""
+    for name, path in factories.items():
+        module_name, _, attribute = path.partition(':')
+        _worker_objects[name] = getattr(importlib.import_module(module_name), attribute)()
+
+
+@contextmanager
+def _without_main_reimport():
+    """
+    Spawned workers normally re-import the parent's __main__ script (app.py loads
+    every model at import). Workers only need python_modules, so __main__ is
+    reported as a plain '__main__' module while worker processes start.
+    """
+    main = sys.modules.get('__main__')
+    with _spawn_lock:
+        original = getattr(main, '__spec__', None)
+        if main is not None:
+            main.__spec__ = importlib.machinery.ModuleSpec('__main__', None)
+        try:
+            yield
+        finally:
+            if main is not None:
+                main.__spec__ = original
+
+
+class SharedArrays:
+    """Several ndarrays packed into one SharedMemory block (the same array object is stored once)"""
+
+    def __init__(self, arrays):
+        unique = {}
+        for array in arrays:
+            unique.setdefault(id(array), array)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, sum(a.nbytes for a in unique.values())))
+        self._specs = {}
+        offset = 0
+        for key, array in unique.items():
+            np.ndarray(array.shape, dtype=array.dtype, buffer=self.shm.buf, offset=offset)[...] = array
+            self._specs[key] = (offset, array.shape, array.dtype.str)
+            offset += array.nbytes
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def spec(self, array):
+        """(offset, shape, dtype) of an array packed in this block"""
+        return self._specs[id(array)]
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _run_task(func, shm_name, array_specs, object_names, kwargs):
+    """
+    Worker side: rebuild the array arguments as views of the shared block, add the named
+    worker objects and call func. Returns (ok, result or exception, stage timings)
+    """
+    shm = shared_memory.SharedMemory(name=shm_name) if array_specs else None
+    timer = timing.StageTimer()
+    previous = timing.activate(timer)
+    try:
+        for key, (offset, shape, dtype) in array_specs.items():
+            kwargs[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+        for key, name in object_names.items():
+            kwargs[key] = _worker_objects[name]
+        try:
+            return True, func(**kwargs), timer.stages
+        except Exception as e:
+            return False, e, timer.stages
+    finally:
+        timing.deactivate(previous)
+        kwargs.clear()
+        if shm is not None:
+            try:
+                shm.close()
+            except BufferError:
+                pass  # the result still references the block; it is released with the result
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forked children of a process that already ran torch/OpenMP threads can deadlock
+            _pool = ProcessPoolExecutor(max_workers=_settings['workers'], mp_context=get_context('spawn'),
+                                        initializer=_init_worker, initargs=(_settings['worker_objects'],))
+            print(f"🧵 Started per-pepper CV process pool ({_settings['workers']} workers)")
+        return _pool
+
+
+def _reset_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _run_locally(func, tasks, shared):
+    results = []
+    for kwargs in tasks:
+        try:
+            results.append((True, func(**kwargs, **shared)))
+        except Exception as e:
+            results.append((False, e))
+    return results
+
+
+def run_tasks(func, tasks, return_exceptions=False, shared=None):
+    """
+    Call func(**kwargs, **shared) for every kwargs dict in tasks and return the results in
+    task order. With the pool enabled and enough tasks, the calls run in worker processes and
+    every ndarray argument travels through shared memory; otherwise they run in this thread.
+    shared holds arguments common to all tasks: one named like a configured worker object is
+    replaced by the worker's own instance instead of being pickled per task.
+    func must be a module-level (picklable) function. A failing task raises its exception,
+    or with return_exceptions=True the exception takes the place of its result.
+    """
+    tasks = list(tasks)
+    shared = shared or {}
+    if enabled(len(tasks)):
+        outcomes = _run_in_pool(func, tasks, shared)
+    else:
+        outcomes = _run_locally(func, tasks, shared)
+
+    results = []
+    for ok, value in outcomes:
+        if not ok and not return_exceptions:
+            raise value
+        results.append(value)
+    return results
+
+
+def _run_in_pool(func, tasks, shared):
+    object_names = {key: key for key in shared if key in _settings['worker_objects']}
+    pickled = {key: value for key, value in shared.items() if key not in object_names}
+    arrays = [value for kwargs in tasks for value in kwargs.values() if isinstance(value, np.ndarray)]
+    with timing.stage(f'cv_pool.{func.__name__}'), SharedArrays(arrays) as block:
+        pool = _get_pool()
+        futures = []
+        try:
+            with _without_main_reimport():
+                for kwargs in tasks:
+                    array_specs = {key: block.spec(value) for key, value in kwargs.items()
+                                   if isinstance(value, np.ndarray)}
+                    plain = {key: value for key, value in kwargs.items() if key not in array_specs}
+                    plain.update(pickled)
+                    futures.append(pool.submit(_run_task, func, block.name, array_specs, object_names, plain))
+            # Every worker must be done with the block before it is unlinked
+            wait(futures)
+            outcomes = [future.result() for future in futures]
+        except BrokenProcessPool as e:
+            print(f"⚠️ CV process pool failed ({e}); running {len(tasks)} task(s) in-process")
+            _reset_pool(pool)
+            outcomes = None
+    if outcomes is None:
+        return _run_locally(func, tasks, shared)
+    # Stages timed inside the workers count towards this request like in-process ones
+    timer = timing.current_timer()
+    if timer is not None:
+        for _, _, stages in outcomes:
+            timer.merge(stages)
+    return [(ok, value) for ok, value, _ in outcomes]
@@ -0,0 +1,108 @@
+"""
+Fast image-quality pre-check for uploads.
+
+Blurry, badly exposed or tiny photos still pay for both YOLO passes, validation
+and quality analysis before they come back as "0 peppers found". assess()
+measures them on a small grayscale thumbnail in a few milliseconds, before any
+model runs:
+
+- sharpness: variance of the Laplacian (edges of an out-of-focus or shaken
+  photo are smeared, so the second derivative is flat)
+- exposure: mean brightness and the share of pixels crushed to black or
+  blown out to white (grayscale histogram)
+- resolution: short side of the original upload
+
+The thumbnail is about the size of the YOLO input, so blur that the detector
+would not notice does not reject a photo.
+"""
+
+import math
+import time
+from typing import Any, Dict, Sequence
+
+import cv2
+import numpy as np
+
+THUMBNAIL_SIDE = 640
+
+# Histogram levels counted as crushed black / blown-out white
+DARK_LEVEL = 16
+BRIGHT_LEVEL = 240
+
+DEFAULT_THRESHOLDS = {
+    'PRECHECK_MIN_SIDE': 320,
+    'PRECHECK_MIN_SHARPNESS': 25.0,
+    'PRECHECK_MIN_BRIGHTNESS': 35.0,
+    'PRECHECK_MAX_BRIGHTNESS': 225.0,
+    'PRECHECK_MAX_CLIPPED': 0.6,
+}
+
+
+def thumbnail(image: np.ndarray, side: int = THUMBNAIL_SIDE) -> np.ndarray:
+    """Grayscale copy of image with its long edge reduced to at most side (never enlarged)"""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    height, width = gray.shape[:2]
+    factor = math.ceil(max(height, width) / float(side))
+    if factor <= 1:
+        return gray
+    # Integer factors take OpenCV's fast block-averaging path of INTER_AREA
+    size = (max(1, width // factor), max(1, height // factor))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+
+def measure(gray: np.ndarray) -> Dict[str, float]:
+    """Sharpness and exposure metrics of a grayscale thumbnail"""
+    histogram = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+    pixels = float(histogram.sum()) or 1.0
+    levels = np.arange(256, dtype=np.float64)
+    return {
+        'sharpness': float(cv2.Laplacian(gray, cv2.CV_64F).var()),
+        'brightness': float((histogram * levels).sum() / pixels),
+        'dark_fraction': float(histogram[:DARK_LEVEL].sum() / pixels),
+        'bright_fraction': float(histogram[BRIGHT_LEVEL:].sum() / pixels),
+    }
+
+
+def assess(image: np.ndarray, source_shape: Sequence[int], config) -> Dict[str, Any]:
+    """
+    Check a decoded upload against the PRECHECK_* thresholds in config.
+    source_shape is the shape of the original upload (image may be a reduced decode).
+    Returns {'passed', 'issues': [{'check', 'message'}], 'metrics', 'elapsed_ms'}.
+    """
+    start = time.perf_counter()
+    limits = {key: config.get(key, default) for key, default in DEFAULT_THRESHOLDS.items()}
+    height, width = source_shape[:2]
+    metrics = measure(thumbnail(image))
+    metrics = {key: round(value, 3) for key, value in metrics.items()}
+    metrics['width'], metrics['height'] = int(width), int(height)
+
+    issues = []
+    if min(width, height) < limits['PRECHECK_MIN_SIDE']:
+        issues.append({'check': 'resolution',
+                       'message': f"Photo is too small ({width}x{height}). Use a photo at least "
+                                  f"{limits['PRECHECK_MIN_SIDE']}px on its short side."})
+    if metrics['brightness'] < limits['PRECHECK_MIN_BRIGHTNESS'] or \
+            metrics['dark_fraction'] > limits['PRECHECK_MAX_CLIPPED']:
+        issues.append({'check': 'underexposed',
+                       'message': 'Photo is too dark. Move to better light or turn on the flash and retake it.'})
+    elif metrics['brightness'] > limits['PRECHECK_MAX_BRIGHTNESS'] or \
+            metrics['bright_fraction'] > limits['PRECHECK_MAX_CLIPPED']:
+        issues.append({'check': 'overexposed',
+                       'message': 'Photo is overexposed. Avoid direct sunlight or glare on the peppers and retake it.'})
+    # A dark or blank photo has no edges either; only report blur for usable exposures
+    if not any(issue['check'].endswith('exposed') for issue in issues) and \
+            metrics['sharpness'] < limits['PRECHECK_MIN_SHARPNESS']:
+        issues.append({'check': 'blur',
+                       'message': 'Photo is too blurry. Hold the camera steady, tap to focus on the peppers and retake it.'})
+
+    return {
+        'passed': not issues,
+        'issues': issues,
+        'metrics': metrics,
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 2),
+    }
+
+
+def rejection_message(report: Dict[str, Any]) -> str:
+    """User-facing reason(s) a photo failed the pre-check"""
+    return ' '.join(issue['message'] for issue in report['issues'])
@@ -0,0 +1,90 @@
+"""
+Per-image index over YOLO segmentation masks.
+Built once per inference result: mask bounding boxes are computed at the native
+mask resolution, detections map to masks by their box index, and masks are only
+upsampled inside the region of interest that is actually used.
+"""
+
+import cv2
+import numpy as np
+from typing import Optional, Sequence, Tuple
+
+from . import box_ops
+
+
+class MaskIndex:
+    """
+    Lookup structure for the segmentation masks of a single YOLO result
+    """
+
+    def __init__(self, masks, image_shape: Tuple[int, ...], threshold: float = 0.5):
+        self.threshold = threshold
+        self.image_height, self.image_width = image_shape[:2]
+
+        # Single device transfer for all masks: (N, mh, mw) float32
+        if masks is None or len(masks) == 0:
+            self.data = np.zeros((0, 1, 1), dtype=np.float32)
+        else:
+            self.data = masks.data.cpu().numpy().astype(np.float32, copy=False)
+
+        count, mask_h, mask_w = self.data.shape
+        self.scale_x = self.image_width / float(mask_w)
+        self.scale_y = self.image_height / float(mask_h)
+
+        # Bounding boxes at mask resolution, vectorized over all masks
+        binary = self.data > threshold
+        rows = binary.any(axis=2)  # (N, mh)
+        cols = binary.any(axis=1)  # (N, mw)
+        self.valid = rows.any(axis=1)
+        y1 = np.argmax(rows, axis=1)
+        y2 = mask_h - 1 - np.argmax(rows[:, ::-1], axis=1)
+        x1 = np.argmax(cols, axis=1)
+        x2 = mask_w - 1 - np.argmax(cols[:, ::-1], axis=1)
+
+        # Scale to image coordinates (pixel edges, comparable with detection boxes)
+        self.bboxes = np.stack([
+            x1 * self.scale_x, y1 * self.scale_y,
+            (x2 + 1) * self.scale_x, (y2 + 1) * self.scale_y
+        ], axis=1).astype(np.float32) if count else np.zeros((0, 4), dtype=np.float32)
+        self.bboxes[~self.valid] = 0.0
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def index_for(self, box_index: Optional[int], bbox: Sequence[float]) -> int:
+        """
+        Mask index for a detection.
+        YOLO returns masks aligned with boxes, so the detection's box index is used
+        directly; otherwise the mask with the best bbox IoU (> 0) is chosen. -1 if none.
+        """
+        if box_index is not None and 0 <= box_index < len(self) and self.valid[box_index]:
+            return int(box_index)
+        if not self.valid.any():
+            return -1
+        candidates = np.flatnonzero(self.valid)
+        best_iou, best_idx = box_ops.best_overlap([bbox], self.bboxes[candidates])
+        return int(candidates[best_idx[0]]) if best_iou[0] > 0 else -1
+
+    def roi_mask(self, index: int, roi: Tuple[int, int, int, int]) -> np.ndarray:
+        """
+        Binary (0/1 uint8) mask for the ROI (x1, y1, x2, y2) in image coordinates.
+        Equivalent to resizing the mask to the full image and cropping, but only the
+        ROI pixels are interpolated.
+        """
+        x1, y1, x2, y2 = roi
+        roi_w, roi_h = max(0, x2 - x1), max(0, y2 - y1)
+        if roi_w == 0 or roi_h == 0:
+            return np.zeros((roi_h, roi_w), dtype=np.uint8)
+
+        # Inverse map: ROI pixel -> mask coordinate, using cv2.resize pixel-center convention
+        inv_sx, inv_sy = 1.0 / self.scale_x, 1.0 / self.scale_y
+        matrix = np.array([
+            [inv_sx, 0.0, (x1 + 0.5) * inv_sx - 0.5],
+            [0.0, inv_sy, (y1 + 0.5) * inv_sy - 0.5]
+        ], dtype=np.float64)
+        upsampled = cv2.warpAffine(
+            self.data[index], matrix, (roi_w, roi_h),
+            flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+            borderMode=cv2.BORDER_REPLICATE
+        )
+        return (upsampled > self.threshold).astype(np.uint8)
@@ -0,0 +1,76 @@
+"""
+Process memory breakdown for the pre-fork server profile.
+
+Forked workers share the master's model weights copy-on-write, so plain RSS
+counts the same pages once per worker. /proc/<pid>/smaps_rollup splits the
+resident set into pages still shared with other processes and pages this
+process owns alone (private, e.g. after writing to them), plus PSS (shared
+pages divided among their sharers), which adds up correctly across workers.
+"""
+
+import os
+from typing import Dict, Optional
+
+# smaps_rollup fields (kB) -> report keys
+_ROLLUP_FIELDS = {
+    'Rss': 'rss_mb',
+    'Pss': 'pss_mb',
+    'Shared_Clean': 'shared_clean_mb',
+    'Shared_Dirty': 'shared_dirty_mb',
+    'Private_Clean': 'private_clean_mb',
+    'Private_Dirty': 'private_dirty_mb',
+}
+
+
+def process_memory(pid='self') -> Optional[Dict[str, float]]:
+    """
+    Memory of a process in MB: rss, pss, shared and private (plus the clean/dirty split).
+    Falls back to rss/shared from /proc/<pid>/statm on kernels without smaps_rollup;
+    None where /proc is unavailable.
+    """
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            values = {}
+            for line in f:
+                name, _, rest = line.partition(':')
+                if name in _ROLLUP_FIELDS:
+                    values[_ROLLUP_FIELDS[name]] = round(int(rest.split()[0]) / 1024.0, 1)
+        values['shared_mb'] = round(values.get('shared_clean_mb', 0.0) + values.get('shared_dirty_mb', 0.0), 1)
+        values['private_mb'] = round(values.get('private_clean_mb', 0.0) + values.get('private_dirty_mb', 0.0), 1)
+        return values
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            _, resident, shared = (int(v) for v in f.read().split()[:3])
+        page_mb = os.sysconf('SC_PAGE_SIZE') / (1024.0 * 1024.0)
+        return {'rss_mb': round(resident * page_mb, 1), 'shared_mb': round(shared * page_mb, 1),
+                'private_mb': round((resident - shared) * page_mb, 1)}
+    except (OSError, ValueError):
+        return None
+
+
+def child_pids(pid):
+    """PIDs of the direct children of a process (e.g. the workers of a pre-fork master)"""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # pid (comm) state ppid ...; comm may contain spaces, so split after its closing paren
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue  # exited meanwhile
+        if ppid == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def describe(values: Optional[Dict[str, float]]) -> str:
+    """One-line summary for startup logs"""
+    if not values:
+        return 'memory unavailable'
+    pss = f", PSS {values['pss_mb']:.0f}MB" if 'pss_mb' in values else ''
+    return (f"RSS {values['rss_mb']:.0f}MB = shared {values['shared_mb']:.0f}MB + "
+            f"private {values['private_mb']:.0f}MB{pss}")
@@ -0,0 +1,149 @@
+"""
+Cross-request micro-batching for model inference.
+
+Under concurrent load every request runs its own batch-of-1 forward pass. A
+MicroBatcher collects the single-item calls made for one model within a short
+window (or until max_batch_size items are waiting), runs one batched forward
+pass on its own thread and hands each caller its own result. Callers block in
+submit() exactly as they would on a direct model call.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+# name -> MicroBatcher, for the stats endpoint
+BATCHERS: Dict[str, 'MicroBatcher'] = {}
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent submit(item) calls into batch_fn([item, ...]) calls.
+    batch_fn must return one result per item, in order.
+    """
+
+    def __init__(self, name: str, batch_fn: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 8, max_wait_ms: float = 10.0):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_s = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        BATCHERS[name] = self
+
+    def submit(self, item):
+        """Queue one item and block until its result (or the batch's exception) is available"""
+        future = Future()
+        self._ensure_thread()
+        self._queue.put((item, future))
+        return future.result()
+
+    def _ensure_thread(self):
+        # Started lazily (and restarted after a fork, where threads do not survive)
+        if self._thread is None or not self._thread.is_alive():
+            with self._thread_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._loop, name=f'microbatch-{self.name}', daemon=True)
+                    self._thread.start()
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait_s
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._run(batch)
+
+    def _run(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results = self.batch_fn(items)
+            if len(results) != len(items):
+                raise RuntimeError(f"{self.name}: batch returned {len(results)} results for {len(items)} items")
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        with self._stats_lock:
+            self.batches += 1
+            self.items += len(items)
+            self.largest_batch = max(self.largest_batch, len(items))
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                'batches': self.batches,
+                'items': self.items,
+                'avg_batch_size': round(self.items / self.batches, 2) if self.batches else 0.0,
+                'largest_batch': self.largest_batch,
+                'max_batch_size': self.max_batch_size,
+                'window_ms': self.max_wait_s * 1000.0
+            }
+
+
+class BatchedPredictor:
+    """
+    Drop-in wrapper for an ultralytics YOLO model. Single-image calls
+    (model(image, **kwargs)) are coalesced across requests into model([...]);
+    calls with different kwargs are batched separately. List inputs are already
+    batches and run directly. Every forward pass holds the model lock, so the
+    wrapped instance never runs two predictions at once.
+    """
+
+    def __init__(self, model, name: str, max_batch_size: int = 8, max_wait_ms: float = 10.0):
+        self.model = model
+        self.name = name
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._model_lock = threading.Lock()
+        self._batchers_lock = threading.Lock()
+        self._batchers: Dict[tuple, MicroBatcher] = {}
+
+    def __call__(self, source, **kwargs):
+        if not isinstance(source, np.ndarray):
+            with self._model_lock:
+                return self.model(source, **kwargs)
+        # YOLO returns a list of Results, one per image
+        return [self._batcher(kwargs).submit(source)]
+
+    def _batcher(self, kwargs) -> MicroBatcher:
+        key = tuple(sorted(kwargs.items()))
+        batcher = self._batchers.get(key)
+        if batcher is None:
+            with self._batchers_lock:
+                batcher = self._batchers.get(key)
+                if batcher is None:
+                    name = self.name if not self._batchers else f'{self.name}.{len(self._batchers)}'
+                    batcher = MicroBatcher(name, lambda images: self._predict(images, kwargs),
+                                           self.max_batch_size, self.max_wait_ms)
+                    self._batchers[key] = batcher
+        return batcher
+
+    def _predict(self, images, kwargs):
+        with self._model_lock:
+            return list(self.model(images, **kwargs))
+
+    def __getattr__(self, attr):
+        # names, task, etc. of the wrapped model
+        return getattr(self.model, attr)
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    """Batch statistics of every broker in this process"""
+    return {name: batcher.stats() for name, batcher in sorted(BATCHERS.items())}
@@ -0,0 +1,791 @@
+"""
+Per-pepper computer vision helpers for the analysis pipeline.
+Validation fallbacks, cutout mask refinement, ripeness estimation and the
+CV-only secondary estimates (nutrition, shelf life, market grade).
+Everything here works on NumPy images only (no Flask or model state), so it
+can run on any thread or worker process.
+"""
+
+import cv2
+import numpy as np
+
+from . import timing
+from .timing import timed
+
+def validate_pepper_color(crop_image):
+    """Check if crop has pepper-like colors (HSV filter) and reject skin tones"""
+    hsv = cv2.cvtColor(crop_image, cv2.COLOR_BGR2HSV)
+    
+    # First, check for skin tones and reject them
+    # Skin tone range in HSV (covers various skin colors)
+    lower_skin = np.array([0, 10, 60])
+    upper_skin = np.array([25, 150, 255])
+    skin_mask = cv2.inRange(hsv, lower_skin, upper_skin)
+    skin_percentage = (np.sum(skin_mask > 0) / (crop_image.shape[0] * crop_image.shape[1])) * 100
+    
+    # If more than 30% is skin-colored, reject it
+    if skin_percentage > 30:
+        print(f"  └─ Rejected: {skin_percentage:.1f}% skin tone detected")
+        return False
+    
+    # Pepper color ranges: red, yellow, orange, green (more saturated than skin)
+    lower_red1 = np.array([0, 80, 80])  # Increased saturation from 50 to 80
+    upper_red1 = np.array([10, 255, 255])
+    lower_red2 = np.array([170, 80, 80])  # Increased saturation
+    upper_red2 = np.array([180, 255, 255])
+    lower_yellow = np.array([20, 100, 100])  # Increased saturation and hue
+    upper_yellow = np.array([35, 255, 255])
+    lower_green = np.array([35, 50, 50])  # Keep green sensitive
+    upper_green = np.array([85, 255, 255])
+    lower_orange = np.array([10, 100, 100])  # Increased saturation
+    upper_orange = np.array([20, 255, 255])
+    
+    # Create masks
+    mask_red1 = cv2.inRange(hsv, lower_red1, upper_red1)
+    mask_red2 = cv2.inRange(hsv, lower_red2, upper_red2)
+    mask_yellow = cv2.inRange(hsv, lower_yellow, upper_yellow)
+    mask_green = cv2.inRange(hsv, lower_green, upper_green)
+    mask_orange = cv2.inRange(hsv, lower_orange, upper_orange)
+    
+    # Combine all pepper color masks
+    combined_mask = cv2.bitwise_or(cv2.bitwise_or(mask_red1, mask_red2),
+                                   cv2.bitwise_or(cv2.bitwise_or(mask_yellow, mask_green), mask_orange))
+    
+    # Calculate percentage of pepper-colored pixels
+    total_pixels = crop_image.shape[0] * crop_image.shape[1]
+    pepper_pixels = np.sum(combined_mask > 0)
+    pepper_percentage = (pepper_pixels / total_pixels) * 100
+    
+    # Require at least 50% pepper-colored pixels (increased from 40%)
+    is_valid = pepper_percentage >= 50.0
+    if not is_valid:
+        print(f"  └─ Rejected: Only {pepper_percentage:.1f}% pepper-colored pixels")
+    return is_valid
+
+def validate_pepper_texture(crop_image):
+    """Analyze texture and contour to detect bell pepper's characteristic wavy/lobed shape"""
+    if crop_image.size == 0:
+        return False
+    
+    # Convert to grayscale for texture analysis
+    gray = cv2.cvtColor(crop_image, cv2.COLOR_BGR2GRAY)
+    
+    # 1. Edge detection to find contours (peppers have distinct lobes)
+    edges = cv2.Canny(gray, 50, 150)
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    
+    if not contours:
+        print(f"  └─ Rejected: No clear contours detected")
+        return False
+    
+    # Get the largest contour
+    largest_contour = max(contours, key=cv2.contourArea)
+    
+    # 2. Analyze contour complexity (peppers have wavy edges, apples are smooth circles)
+    perimeter = cv2.arcLength(largest_contour, True)
+    area = cv2.contourArea(largest_contour)
+    
+    if area < 100:  # Too small to analyze
+        return True  # Give benefit of doubt for small crops
+    
+    # Circularity: 4π × area / perimeter²
+    # Perfect circle = 1.0, irregular shapes < 0.8
+    # Peppers are typically 0.5-0.8, apples 0.85-1.0
+    circularity = (4 * np.pi * area) / (perimeter * perimeter) if perimeter > 0 else 0
+    
+    # Reject very circular objects (likely apples/tomatoes, not peppers)
+    if circularity > 0.88:
+        print(f"  └─ Rejected: Too circular ({circularity:.3f}), likely apple/tomato")
+        return False
+    
+    # 3. Check for bell pepper's characteristic "blocky" shape using approximation
+    epsilon = 0.02 * perimeter
+    approx = cv2.approxPolyDP(largest_contour, epsilon, True)
+    num_vertices = len(approx)
+    
+    # Bell peppers when viewed from top/side have 4-8 vertices (blocky/lobed)
+    # Apples have many more vertices (smooth curve) or very few (circle)
+    # We want something in between
+    if num_vertices < 4:
+        print(f"  └─ Rejected: Too simple shape ({num_vertices} vertices)")
+        return False
+    
+    # 4. Texture variance (peppers have slight surface variations, apples are very smooth)
+    # Calculate standard deviation of intensity
+    std_dev = np.std(gray)
+    
+    # Very low variance suggests overly smooth surface (like a shiny apple)
+    if std_dev < 15:
+        print(f"  └─ Rejected: Surface too smooth (std: {std_dev:.1f}), likely apple")
+        return False
+    
+    print(f"  └─ Texture OK: circularity={circularity:.3f}, vertices={num_vertices}, texture_std={std_dev:.1f}")
+    return True
+
+def validate_pepper_shape(bbox, image_shape=None):
+    """Check if bounding box has pepper-like aspect ratio and reasonable size"""
+    x1, y1, x2, y2 = bbox
+    width = x2 - x1
+    height = y2 - y1
+    
+    if width == 0 or height == 0:
+        return False
+    
+    # Check minimum size (peppers should be reasonably sized, not tiny fragments)
+    min_dimension = min(width, height)
+    if min_dimension < 50:  # Minimum 50 pixels in smallest dimension
+        print(f"  └─ Rejected: Too small ({min_dimension:.0f}px)")
+        return False
+    
+    aspect_ratio = height / width
+    # Peppers are typically 0.8-2.0 (tightened range from 0.6-3.0)
+    # Fingers and hands often exceed these ratios
+    if not (0.8 <= aspect_ratio <= 2.0):
+        print(f"  └─ Rejected: Invalid aspect ratio ({aspect_ratio:.2f})")
+        return False
+    
+    # Check area relative to bounding box (peppers are fairly "solid")
+    # This helps reject thin/elongated objects like fingers
+    bbox_area = width * height
+    if image_shape is not None:
+        img_height, img_width = image_shape[:2]
+        # Reject if detection is too large (> 80% of image, likely not a single pepper)
+        if bbox_area > (img_height * img_width * 0.8):
+            print(f"  └─ Rejected: Too large relative to image")
+            return False
+    
+    return True
+
+@timed('mask.grabcut')
+def create_smart_mask_from_bbox(image, bbox, padding=5):
+    """Create a smart mask from bounding box using image processing"""
+    x1, y1, x2, y2 = map(int, bbox)
+    
+    # Add padding and ensure within image bounds
+    h, w = image.shape[:2]
+    x1 = max(0, x1 - padding)
+    y1 = max(0, y1 - padding)
+    x2 = min(w, x2 + padding)
+    y2 = min(h, y2 + padding)
+    
+    # Crop the region
+    roi = image[y1:y2, x1:x2]
+    
+    if roi.size == 0:
+        return np.zeros((h, w), dtype=np.uint8)
+    
+    # Convert to different color spaces for better segmentation
+    hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
+    lab = cv2.cvtColor(roi, cv2.COLOR_BGR2LAB)
+    
+    # 1) Create priors for GrabCut: mark probable background where leaf-green dominates
+    lower_green_bg = np.array([35, 60, 40])
+    upper_green_bg = np.array([85, 255, 255])
+    green_bg = cv2.inRange(hsv, lower_green_bg, upper_green_bg)
+    # probable foreground seeds: red/orange/yellow plus central area
+    lower_red1 = np.array([0, 70, 60]);  upper_red1 = np.array([10, 255, 255])
+    lower_red2 = np.array([170, 70, 60]); upper_red2 = np.array([180, 255, 255])
+    lower_orange = np.array([10, 70, 60]); upper_orange = np.array([25, 255, 255])
+    lower_yellow = np.array([25, 70, 60]); upper_yellow = np.array([35, 255, 255])
+    fg_color = cv2.inRange(hsv, lower_red1, upper_red1) | cv2.inRange(hsv, lower_red2, upper_red2) | cv2.inRange(hsv, lower_orange, upper_orange) | cv2.inRange(hsv, lower_yellow, upper_yellow)
+    # central ellipse seed
+    center_mask = np.zeros(roi.shape[:2], np.uint8)
+    cy, cx = roi.shape[0] // 2, roi.shape[1] // 2
+    ry, rx = max(8, roi.shape[0] // 4), max(8, roi.shape[1] // 4)
+    cv2.ellipse(center_mask, (cx, cy), (rx, ry), 0, 0, 360, 255, -1)
+    fg_seed = cv2.bitwise_or(fg_color, center_mask)
+    # Prepare GrabCut mask with seeds
+    GC_BGD, GC_FGD, GC_PR_BGD, GC_PR_FGD = 0, 1, 2, 3
+    gc_mask = np.full(roi.shape[:2], GC_PR_BGD, np.uint8)
+    gc_mask[green_bg > 0] = GC_BGD
+    gc_mask[fg_seed > 0] = GC_PR_FGD
+    try:
+        bgd_model = np.zeros((1, 65), np.float64)
+        fgd_model = np.zeros((1, 65), np.float64)
+        cv2.grabCut(roi, gc_mask, None, bgd_model, fgd_model, 4, cv2.GC_INIT_WITH_MASK)
+        grabcut_mask = np.where((gc_mask == GC_FGD) | (gc_mask == GC_PR_FGD), 1, 0).astype('uint8')
+    except Exception:
+        grabcut_mask = np.ones(roi.shape[:2], dtype=np.uint8)
+    
+    # 2) Edge emphasis to avoid including flat leaves
+    gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+    edges = cv2.Canny(gray, 50, 120)
+    edges = cv2.dilate(edges, np.ones((3,3), np.uint8), iterations=1)
+    edge_mask = cv2.threshold(edges, 0, 255, cv2.THRESH_BINARY)[1]
+    
+    # Combine: foreground must also overlap edge or fg_color to keep solid pepper, not flat leaf
+    color_or_edge = cv2.bitwise_or(fg_seed, edge_mask)
+    combined_mask = cv2.bitwise_and(grabcut_mask * 255, (color_or_edge > 0).astype(np.uint8) * 255)
+    
+    # Morphological operations to clean up the mask
+    kernel = np.ones((3, 3), np.uint8)
+    combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+    combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_OPEN, kernel, iterations=1)
+    
+    # Fill holes
+    combined_mask = cv2.medianBlur(combined_mask, 5)
+    try:
+        # keep largest component only
+        num_labels, labels, stats, _ = cv2.connectedComponentsWithStats((combined_mask > 0).astype(np.uint8), connectivity=8)
+        if num_labels > 1:
+            largest_label = 1 + np.argmax(stats[1:, cv2.CC_STAT_AREA])
+            combined_mask = (labels == largest_label).astype(np.uint8) * 255
+    except Exception:
+        pass
+    
+    # Create full-size mask
+    full_mask = np.zeros((h, w), dtype=np.uint8)
+    full_mask[y1:y2, x1:x2] = combined_mask
+    
+    return full_mask
+
+@timed('ripeness.fallback')  # only runs after the LAB estimator failed
+def ripeness_from_hsv(bgr_image):
+    """
+    Compute ripeness strictly from the cutout's HSV colors using detailed bands:
+    - Green (Unripe)
+    - Light Green → Yellowish-Green (Early Ripening)
+    - Yellow (Mid)
+    - Orange (Advanced)
+    - Red (Fully Ripe)
+    - Deep Red / Maroon (Very Ripe)
+    - Dull Red / Dark Brownish / Purplish (Overripe)
+    - Brown → Black Spots (Spoiling) -> penalty
+    Returns score 0-100 and stage label.
+    """
+    if bgr_image is None or bgr_image.size == 0:
+        return {'score': 0.0, 'stage': 'unknown', 'bands': {}}
+    hsv = cv2.cvtColor(bgr_image, cv2.COLOR_BGR2HSV)
+    h, s, v = cv2.split(hsv)
+    # Keep only sufficiently bright/saturated pixels to avoid noise
+    valid = (s >= 30) & (v >= 40)
+    total = int(np.count_nonzero(valid))
+    if total == 0:
+        return {'score': 0.0, 'stage': 'unknown', 'bands': {}}
+    # Band masks (Hue ranges in OpenCV: 0..180)
+    green = valid & (h >= 35) & (h <= 85) & (s >= 60)  # strong green
+    light_green = valid & (h >= 30) & (h < 35)  # yellowish-green
+    yellow = valid & (h >= 20) & (h < 30)
+    orange = valid & (h >= 10) & (h < 20)
+    red1 = valid & (h <= 10)
+    red2 = valid & (h >= 170)
+    red = red1 | red2
+    # Deep red/maroon: red with lower V or high S, moderate V
+    deep_red = red & (v < 120)
+    # Dull red / brownish / purplish (overripe): low saturation or very low V near red/purple
+    dull_red = (valid & (((h <= 15) | (h >= 165)) & (s < 50))) | (valid & (h >= 140) & (h < 165) & (v < 120))
+    # Spoiling dark spots: very low V regardless of hue but not background (use valid mask)
+    dark_spots = (v < 60) & (s < 80) & valid
+    # Percentages
+    pct = lambda m: (int(np.count_nonzero(m)) / total) * 100.0
+    bands = {
+        'green': pct(green),
+        'light_green': pct(light_green),
+        'yellow': pct(yellow),
+        'orange': pct(orange),
+        'red': pct(red),
+        'deep_red': pct(deep_red),
+        'dull_red': pct(dull_red),
+        'dark_spots': pct(dark_spots)
+    }
+    # Weighted score (0..100), later bands mean riper except dull/overripe which reduces
+    weights = {
+        'green': 10.0,
+        'light_green': 30.0,
+        'yellow': 45.0,
+        'orange': 65.0,
+        'red': 85.0,
+        'deep_red': 92.0,
+        'dull_red': 70.0  # overripe dull lowers perceived ripeness quality
+    }
+    score = 0.0
+    for k, w in weights.items():
+        score += bands[k] * (w / 100.0)
+    # Penalty for dark spots (spoilage)
+    score -= min(20.0, bands['dark_spots'] * 0.4)
+    score = float(max(0.0, min(100.0, score)))
+    # Aggregate coarse groups for dominance logic
+    green_total = bands['green'] + bands['light_green']
+    yellow_total = bands['yellow'] + bands['orange']
+    red_total = bands['red'] + bands['deep_red']
+    overripe_total = bands['dull_red']
+    # Find dominant and secondary
+    groups = {
+        'green': green_total,
+        'yellow_orange': yellow_total,
+        'red': red_total,
+        'overripe': overripe_total
+    }
+    dominant_group = max(groups.items(), key=lambda kv: kv[1])[0]
+    # secondary: highest among remaining
+    secondary_group = max({k:v for k,v in groups.items() if k != dominant_group}.items(), key=lambda kv: kv[1])[0]
+    # Determine stage label with mix rules
+    stage_label = 'unknown'
+    # thresholds to consider "significant" secondary
+    secondary_sig = groups[secondary_group] >= 15.0
+    if dominant_group == 'overripe':
+        stage_label = 'overripe'
+    elif dominant_group == 'red':
+        stage_label = 'ripe' if not secondary_sig else 'ripening'
+    elif dominant_group == 'yellow_orange':
+        stage_label = 'ripening'
+    elif dominant_group == 'green':
+        stage_label = 'unripe' if not secondary_sig else 'ripening'
+    details = {
+        'dominant': dominant_group,
+        'secondary': secondary_group,
+        'groups': groups
+    }
+    return {'score': score, 'stage': stage_label, 'bands': bands, 'details': details}
+
+def gray_world_white_balance(bgr):
+    """Simple gray-world white balance to normalize color cast."""
+    try:
+        b, g, r = cv2.split(bgr.astype(np.float32))
+        mean_b, mean_g, mean_r = np.mean(b), np.mean(g), np.mean(r)
+        mean_gray = (mean_b + mean_g + mean_r) / 3.0
+        scale_b = mean_gray / (mean_b + 1e-6)
+        scale_g = mean_gray / (mean_g + 1e-6)
+        scale_r = mean_gray / (mean_r + 1e-6)
+        b = np.clip(b * scale_b, 0, 255)
+        g = np.clip(g * scale_g, 0, 255)
+        r = np.clip(r * scale_r, 0, 255)
+        balanced = cv2.merge((b, g, r)).astype(np.uint8)
+        return balanced
+    except Exception:
+        return bgr
+
+@timed('ripeness')
+def ripeness_from_lab(bgr_image):
+    """
+    LAB-based ripeness estimator (more robust than HSV to lighting).
+    - White balance + CLAHE on L
+    - Use a* (green↔red) and b* (blue↔yellow) dominance
+    Returns {'score','stage','bands','details'}
+    """
+    if bgr_image is None or bgr_image.size == 0:
+        return {'score': 0.0, 'stage': 'unknown', 'bands': {}, 'details': {}}
+    # Pre-normalize
+    img = gray_world_white_balance(bgr_image)
+    lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
+    L, A, B = cv2.split(lab)
+    try:
+        # CLAHE on L to stabilize brightness
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        L = clahe.apply(L)
+        lab = cv2.merge((L, A, B))
+    except Exception:
+        pass
+    # Valid pixels: non-black in original
+    valid = np.any(img > 0, axis=2)
+    total = int(np.count_nonzero(valid))
+    if total == 0:
+        return {'score': 0.0, 'stage': 'unknown', 'bands': {}, 'details': {}}
+    # Center a*, b* around 0
+    a = A.astype(np.int16) - 128
+    b = B.astype(np.int16) - 128
+    l = L.astype(np.int16)
+    # Adaptive thresholds from percentiles
+    a_pos = np.percentile(a[valid], 60)  # positive a threshold
+    a_neg = -np.percentile((-a[valid]), 60)  # negative a threshold (green)
+    b_pos = np.percentile(b[valid], 60)  # yellow side
+    # Fixed floors to avoid too small thresholds
+    a_pos = max(a_pos, 8)
+    a_neg = min(a_neg, -8)
+    b_pos = max(b_pos, 6)
+    # Masks
+    red_mask = valid & (a > a_pos)
+    deep_red_mask = red_mask & (l < 120)
+    green_mask = valid & (a < a_neg)
+    yellow_mask = valid & (b > b_pos) & (a > 0)
+    dull_overripe_mask = valid & (np.abs(a) < 10) & (b < 5) & (l < 120)
+    dark_spots_mask = valid & (l < 60)
+    pct = lambda m: (int(np.count_nonzero(m)) / total) * 100.0
+    bands = {
+        'green': pct(green_mask),
+        'yellow_orange': pct(yellow_mask),
+        'red': pct(red_mask),
+        'deep_red': pct(deep_red_mask),
+        'dull_overripe': pct(dull_overripe_mask),
+        'dark_spots': pct(dark_spots_mask)
+    }
+    # Groups and dominance
+    green_total = bands['green']
+    yellow_total = bands['yellow_orange']
+    red_total = bands['red'] + 0.5 * bands['deep_red']  # bonus for deep red
+    overripe_total = bands['dull_overripe']
+    groups = {'green': green_total, 'yellow_orange': yellow_total, 'red': red_total, 'overripe': overripe_total}
+    dominant = max(groups.items(), key=lambda kv: kv[1])[0]
+    # Stage logic
+    if dominant == 'overripe':
+        stage = 'overripe'
+    elif dominant == 'red':
+        stage = 'ripe' if green_total < 15 and yellow_total < 20 else 'ripening'
+    elif dominant == 'yellow_orange':
+        stage = 'ripening'
+    else:
+        stage = 'unripe' if (red_total < 15 and yellow_total < 15) else 'ripening'
+    # Score 0..100 with penalties
+    score = 0.0
+    score += green_total * 0.15
+    score += yellow_total * 0.55
+    score += (bands['red'] * 0.85 + bands['deep_red'] * 0.95)
+    score -= min(20.0, bands['dull_overripe'] * 0.4)
+    score -= min(25.0, bands['dark_spots'] * 0.5)
+    score = float(max(0.0, min(100.0, score)))
+    details = {'groups': groups, 'dominant': dominant}
+    return {'score': score, 'stage': stage, 'bands': bands, 'details': details}
+
+@timed('secondary_estimates')
+def secondary_estimates(ripeness_pct, surface_quality, size_consistency, bgr_cutout, area_scale=1.0):
+    """
+    CV-only estimations for:
+      - Nutrition (vitamin C, calories, estimated weight)
+      - Shelf life (days for room/refrigerated/optimal)
+      - Market analysis (grade and price)
+    Inputs come from the SAME SOURCE as Ripeness Prediction:
+      - ripeness_pct: LAB-based ripeness score (0-100)
+      - surface_quality, size_consistency: from CV metrics (0-100)
+      - bgr_cutout: masked pepper cutout used for analysis
+      - area_scale: original-upload pixels per cutout pixel (cutout from a downscaled working image)
+    Returns nutrition, shelf, market objects matching the frontend schema.
+    """
+    # Weight proxy from non-zero cutout pixels (simple area heuristic)
+    try:
+        nonzero = int(np.count_nonzero(cv2.cvtColor(bgr_cutout, cv2.COLOR_BGR2GRAY)) * area_scale)
+        weight_g = int(np.clip(140 + nonzero // 1100, 120, 380))
+    except Exception:
+        weight_g = 200
+    # Vitamin C scales with ripeness and weight (bounded)
+    vitc_per_100 = 100 + ripeness_pct * 2.3  # mg per 100g
+    vitamin_c = float(np.clip(vitc_per_100 * (weight_g / 100.0), 80, 500))
+    calories = 62.0  # constant per pepper (approx)
+    highlights = []
+    if vitamin_c >= 250: highlights.append('Excellent vitamin C source (≥250mg)')
+    if ripeness_pct >= 55: highlights.append('High in antioxidants')
+    if size_consistency >= 70: highlights.append('Uniform size – good for packing')
+    nutrition = {
+        'per_pepper': {'vitamin_c': round(vitamin_c), 'calories': round(calories)},
+        'estimated_weight_g': int(weight_g),
+        'nutritional_highlights': highlights
+    }
+    # Shelf life base: decreases as ripeness and surface defects increase
+    room_days_base = float(np.clip(6.5 - ripeness_pct/22.0 - max(0.0, 70 - surface_quality)/60.0, 2.0, 8.0))
+    refrigerated_days_base = room_days_base * 2.5
+    optimal_days_base = np.clip((room_days_base + refrigerated_days_base)/2.0 + 5.0 - ripeness_pct/22.0, 4.0, 18.0)
+    # Defect severity bands based on surface quality
+    if surface_quality < 40:
+        severity = 'severe'
+        shelf_mult = 0.50
+        vitc_mult = 0.90
+        grade_penalty = 2
+    elif surface_quality < 60:
+        severity = 'moderate'
+        shelf_mult = 0.65
+        vitc_mult = 0.95
+        grade_penalty = 1
+    elif surface_quality < 75:
+        severity = 'minor'
+        shelf_mult = 0.80
+        vitc_mult = 1.00
+        grade_penalty = 1
+    else:
+        severity = 'none'
+        shelf_mult = 1.00
+        vitc_mult = 1.00
+        grade_penalty = 0
+    # Apply severity to shelf life
+    room_days = round(float(np.clip(room_days_base * shelf_mult, 1.0, 8.0)), 1)
+    refrigerated_days = round(float(np.clip(refrigerated_days_base * shelf_mult, 1.0, 18.0)), 1)
+    optimal_days = round(float(np.clip(optimal_days_base * shelf_mult, 4.0, 18.0)), 1)
+    if severity != 'none':
+        optimal_days = float(min(optimal_days, 12.0))
+    shelf = {
+        'room_temperature': {'days': round(room_days, 1)},
+        'refrigerated': {'days': refrigerated_days},
+        'optimal_storage': {'days': optimal_days}
+    }
+    # Market grade: combine CV scores (no price)
+    combined = 0.45 * ripeness_pct + 0.40 * surface_quality + 0.15 * size_consistency
+    if combined >= 85:
+        grade, desc = 'Grade A', 'Premium grade, fresh market'
+    elif combined >= 65:
+        grade, desc = 'Grade B', 'Commercial grade, processing'
+    else:
+        grade, desc = 'Grade C', 'Lower grade, food service'
+    # Apply grade penalty for defects
+    if grade_penalty > 0:
+        if grade == 'Grade A':
+            grade = 'Grade B' if grade_penalty == 1 else 'Grade C'
+            desc = 'Commercial grade, processing' if grade == 'Grade B' else 'Lower grade, food service'
+        elif grade == 'Grade B' and grade_penalty >= 1:
+            grade = 'Grade C'
+            desc = 'Lower grade, food service'
+    market = {'grade': grade, 'grade_description': desc}
+    # Carrier-based shelf life estimates (derived from ripeness and base days)
+    # Heuristics: truck (refrigerated) ~0.9*refrigerated, truck (non-refrig) ~0.7*room
+    # boat (slow/humid) ~0.6*refrigerated, air_cargo (fast/cool) ~min(1.3*refrigerated, 18)
+    carrier = {
+        'truck_refrigerated': {'days': round(float(np.clip(refrigerated_days * 0.9, 1.0, 18.0)), 1)},
+        'truck_non_refrigerated': {'days': round(float(np.clip(room_days * 0.7, 0.5, 12.0)), 1)},
+        'boat': {'days': round(float(np.clip(refrigerated_days * 0.6, 0.5, 14.0)), 1)},
+        'air_cargo': {'days': round(float(np.clip(refrigerated_days * 1.2, 1.0, 18.0)), 1)}
+    }
+    shelf['carrier'] = carrier
+    # Apply nutrition adjustment and highlights for defects
+    vitamin_c = float(np.clip(vitamin_c * vitc_mult, 80, 500))
+    nutrition['per_pepper']['vitamin_c'] = round(vitamin_c)
+    if severity != 'none':
+        # Remove size highlight if defects and add warning badge
+        nutrition['nutritional_highlights'] = [h for h in nutrition['nutritional_highlights'] if 'Uniform size' not in h]
+        nutrition['nutritional_highlights'].insert(0, 'Defects detected – inspect/trim; use soon')
+        # Add shelf note
+        shelf['note'] = 'Use soon – defects may accelerate spoilage'
+    return nutrition, shelf, market
+
+def refine_cutout_mask(pepper_crop, mask_crop):
+    """
+    Clean a raw pepper mask for the padded crop: smooth edges, drop leaf-green
+    pixels when the pepper is clearly red/orange, and keep the largest component.
+    Returns a 0/255 uint8 mask (solid when no usable mask was given).
+    """
+    if mask_crop is None or mask_crop.size == 0:
+        # If mask creation failed, use solid mask (no transparency)
+        mask_crop = np.ones(pepper_crop.shape[:2], dtype=np.uint8) * 255
+    else:
+        # Clean mask edges slightly
+        kernel = np.ones((3, 3), np.uint8)
+        mask_crop = cv2.morphologyEx(mask_crop, cv2.MORPH_CLOSE, kernel, iterations=1)
+        mask_crop = (mask_crop > 0).astype(np.uint8) * 255
+    
+    # Try removing leaf-green pixels if pepper shows strong red/orange
+    try:
+        hsv_crop = cv2.cvtColor(pepper_crop, cv2.COLOR_BGR2HSV)
+        # Color ranges
+        lower_red1 = np.array([0, 80, 60])
+        upper_red1 = np.array([10, 255, 255])
+        lower_red2 = np.array([170, 80, 60])
+        upper_red2 = np.array([180, 255, 255])
+        lower_orange = np.array([10, 80, 60])
+        upper_orange = np.array([25, 255, 255])
+        lower_green_leaf = np.array([35, 60, 40])
+        upper_green_leaf = np.array([85, 255, 255])
+        
+        red_mask = cv2.inRange(hsv_crop, lower_red1, upper_red1) | cv2.inRange(hsv_crop, lower_red2, upper_red2)
+        orange_mask = cv2.inRange(hsv_crop, lower_orange, upper_orange)
+        green_mask = cv2.inRange(hsv_crop, lower_green_leaf, upper_green_leaf)
+        
+        total = float(pepper_crop.shape[0] * pepper_crop.shape[1])
+        red_orange_pct = (np.sum((red_mask > 0) | (orange_mask > 0)) / total) if total > 0 else 0.0
+        green_pct = (np.sum(green_mask > 0) / total) if total > 0 else 0.0
+        
+        # If red/orange dominates, subtract green leaf regions from mask
+        if red_orange_pct > green_pct + 0.05:
+            mask_crop = cv2.bitwise_and(mask_crop, cv2.bitwise_not(green_mask))
+            # Re-clean after subtraction
+            kernel = np.ones((3, 3), np.uint8)
+            mask_crop = cv2.morphologyEx(mask_crop, cv2.MORPH_OPEN, kernel, iterations=1)
+            mask_crop = cv2.medianBlur(mask_crop, 3)
+    except Exception:
+        pass
+    
+    # Keep only the largest connected component to avoid stray leaves
+    try:
+        num_labels, labels, stats, _ = cv2.connectedComponentsWithStats((mask_crop > 0).astype(np.uint8), connectivity=8)
+        if num_labels > 1:
+            # Skip background (label 0)
+            largest_label = 1 + np.argmax(stats[1:, cv2.CC_STAT_AREA])
+            mask_crop = (labels == largest_label).astype(np.uint8) * 255
+    except Exception:
+        pass
+    
+    return mask_crop
+
+def cutout_mask(image, crop_box, mask_crop=None, padding=35):
+    """
+    Refined 0/255 mask for the padded crop_box (x1, y1, x2, y2) of image.
+    mask_crop is the segmentation mask for the crop when available; otherwise
+    GrabCut runs on the full image around the unpadded box.
+    """
+    x1, y1, x2, y2 = crop_box
+    if mask_crop is None:
+        # Fallback: create smart mask from bbox on the full image
+        mask_full = create_smart_mask_from_bbox(image, [x1 + padding, y1 + padding, x2 - padding, y2 - padding])
+        mask_crop = mask_full[y1:y2, x1:x2] if mask_full is not None else None
+    return refine_cutout_mask(image[y1:y2, x1:x2], mask_crop)
+
+def tight_mask_bounds(mask, margin=2):
+    """Inclusive (min_x, min_y, max_x, max_y) of the mask's non-zero pixels plus a margin, or None"""
+    ys, xs = np.where(mask > 0)
+    if len(xs) == 0 or len(ys) == 0:
+        return None
+    min_x = max(0, int(np.min(xs)) - margin)
+    min_y = max(0, int(np.min(ys)) - margin)
+    max_x = min(mask.shape[1] - 1, int(np.max(xs)) + margin)
+    max_y = min(mask.shape[0] - 1, int(np.max(ys)) + margin)
+    return min_x, min_y, max_x, max_y
+
+def feather_alpha(mask):
+    """Soft alpha channel for product-style cutouts"""
+    try:
+        # Blur only slightly to keep edges crisp but not jagged
+        feathered_alpha = cv2.GaussianBlur(mask, (0, 0), sigmaX=1.2, sigmaY=1.2)
+        # Re-normalize to 0-255
+        return np.clip(feathered_alpha, 0, 255).astype(np.uint8)
+    except Exception:
+        return mask
+
+def masked_cutout(crop, mask, min_pixels=25):
+    """
+    Definitive analysis input: the crop with the background blacked out.
+    Returns (cutout, binary_alpha), or (None, binary_alpha) when the mask is too small.
+    """
+    binary_alpha = (mask > 0).astype(np.uint8) * 255
+    if int(np.count_nonzero(binary_alpha)) < min_pixels:
+        return None, binary_alpha
+    return cv2.bitwise_and(crop, crop, mask=binary_alpha), binary_alpha
+
+def quality_category(score):
+    if score >= 80:
+        return "Excellent"
+    elif score >= 60:
+        return "Good"
+    elif score >= 40:
+        return "Fair"
+    return "Poor"
+
+def cv_quality(analysis_input, analyzer):
+    """
+    CV quality analysis of the masked cutout (BellPepperQualityAnalyzer) with LAB
+    ripeness (HSV fallback). Returns the response fragment; its quality_analysis
+    is None when the analysis failed.
+    """
+    fragment = {}
+    quality_analysis = None
+    try:
+        # Strict requirement: must analyze masked cutout only
+        if analysis_input is None:
+            raise ValueError("Empty/invalid mask for analysis")
+        with timing.stage('quality'):
+            metrics = analyzer.analyze_pepper_quality(analysis_input)
+        # Override/augment ripeness using robust LAB estimator (fallback to HSV)
+        try:
+            ripeness_lab = ripeness_from_lab(analysis_input)
+            metrics['ripeness_level'] = ripeness_lab['score']
+            fragment['ripeness_bands'] = ripeness_lab['bands']
+            fragment['ripeness_groups'] = ripeness_lab.get('details', {}).get('groups')
+            # Debug: print LAB groups and score
+            print(f"   [DBG] LAB ripeness score={metrics['ripeness_level']:.1f} groups={fragment['ripeness_groups']}")
+        except Exception as _:
+            try:
+                ripeness_hsv = ripeness_from_hsv(analysis_input)
+                metrics['ripeness_level'] = ripeness_hsv['score']
+                fragment['ripeness_bands'] = ripeness_hsv['bands']
+                fragment['ripeness_groups'] = ripeness_hsv.get('details', {}).get('groups')
+                print(f"   [DBG] HSV fallback ripeness score={metrics['ripeness_level']:.1f}")
+            except Exception:
+                print("   [DBG] Ripeness estimation failed (both LAB and HSV).")
+        recommendations = analyzer.get_quality_recommendations(metrics)
+
+        overall_score = metrics['overall_quality']
+        quality_analysis = {
+            'quality_score': overall_score,
+            'quality_category': quality_category(overall_score),
+            'color_uniformity': metrics['color_uniformity'],
+            'size_consistency': metrics['size_consistency'],
+            'surface_quality': metrics['surface_quality'],
+            'ripeness_level': metrics['ripeness_level'],
+            'recommendations': recommendations
+        }
+    except Exception as e:
+        print(f"CV Quality Analysis error: {e}")
+        quality_analysis = None
+    fragment['quality_analysis'] = quality_analysis
+    return fragment
+
+def predict_ripeness(analysis_input):
+    """CV-based ripeness prediction (LAB estimator) with a harvest recommendation"""
+    ripeness_est = ripeness_from_lab(analysis_input)
+    ripeness_pct = float(ripeness_est['score'])
+    stage = ripeness_est['stage']
+    # Days heuristic by stage and distance to 90 (ripe)
+    if stage == 'ripe':
+        harvest_note = 'Use soon – optimal quality'
+        days_to_optimal = 0.0
+    elif stage == 'ripening':
+        harvest_note = 'Approaching optimal harvest time'
+        days_to_optimal = max(0.0, (85 - ripeness_pct) / 5.0)
+    elif stage == 'overripe':
+        harvest_note = 'Past optimal – quality declining'
+        days_to_optimal = 0.0
+    else:
+        harvest_note = 'Early harvest time – good for storage'
+        days_to_optimal = max(0.0, (60 - ripeness_pct) / 3.5)
+    
+    return {
+        'current_stage': stage,
+        'ripeness_percentage': round(ripeness_pct, 1),
+        'harvest_recommendation': harvest_note,
+        'days_to_optimal_harvest': round(days_to_optimal, 1)
+    }
+
+def usage_recommendations(variety_name, ripeness_pct, surface_quality, disease_analysis=None):
+    """Salad / cooking / sauce suitability from the same ripeness and surface sources as the UI"""
+    variety_key = variety_name.split(' ')[0] if variety_name else 'Green'
+    
+    # Check disease status (same logic as other analyses)
+    is_healthy = True
+    if disease_analysis:
+        if isinstance(disease_analysis, dict):
+            is_healthy = disease_analysis.get('is_healthy', True)
+        elif isinstance(disease_analysis, str):
+            try:
+                import json
+                is_healthy = json.loads(disease_analysis).get('is_healthy', True)
+            except:
+                is_healthy = True
+    
+    # Criteria: ripeness >= 60%, surface quality >= 70%, healthy, and Red/Yellow/Orange varieties preferred
+    suitable_for_salad = (
+        ripeness_pct >= 60 and
+        surface_quality >= 70 and
+        is_healthy and
+        variety_key in ['Red', 'Yellow', 'Orange']
+    )
+    
+    usage_tags = []
+    if suitable_for_salad:
+        usage_tags.append('salad')
+    
+    # Best for cooking (medium ripeness: 30-80%)
+    if ripeness_pct >= 30 and ripeness_pct < 80:
+        usage_tags.append('cooking')
+    
+    # For sauces/seasoning (very ripe >=80% or low surface quality <50%)
+    if ripeness_pct >= 80 or surface_quality < 50:
+        usage_tags.append('sauce')
+    
+    # If no specific recommendations, default to cooking
+    if not usage_tags:
+        usage_tags.append('cooking')
+    
+    return {
+        'suitable_for_salad': suitable_for_salad,
+        'usage_tags': usage_tags,
+        'recommendations': {
+            'salad': suitable_for_salad,
+            'cooking': 'cooking' in usage_tags,
+            'sauce': 'sauce' in usage_tags
+        }
+    }
+
+# Returned when usage recommendations cannot be computed
+DEFAULT_USAGE_RECOMMENDATIONS = {
+    'suitable_for_salad': False,
+    'usage_tags': ['cooking'],
+    'recommendations': {
+        'salad': False,
+        'cooking': True,
+        'sauce': False
+    }
+}
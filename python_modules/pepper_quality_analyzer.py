@@ -15,6 +15,7 @@ from skimage.measure import regionprops
 from skimage.morphology import remove_small_objects
 import math
 from typing import Dict, Tuple, List
+from .timing import stage
 
 class BellPepperQualityAnalyzer:
     """
@@ -291,13 +292,18 @@ class BellPepperQualityAnalyzer:
             }
         
         # Preprocess image
-        hsv, mask = self.preprocess_image(image)
+        with stage('quality.preprocess'):
+            hsv, mask = self.preprocess_image(image)
         
         # Analyze each quality aspect
-        color_uniformity = self.analyze_color_uniformity(image, mask)
-        size_consistency = self.analyze_size_consistency(image, mask)
-        surface_quality = self.analyze_surface_quality(image, mask)
-        ripeness_level = self.analyze_ripeness_level(image, mask)
+        with stage('quality.color_uniformity'):
+            color_uniformity = self.analyze_color_uniformity(image, mask)
+        with stage('quality.size_consistency'):
+            size_consistency = self.analyze_size_consistency(image, mask)
+        with stage('quality.surface_quality'):
+            surface_quality = self.analyze_surface_quality(image, mask)
+        with stage('quality.ripeness_level'):
+            ripeness_level = self.analyze_ripeness_level(image, mask)
         
         # Calculate overall quality score (weighted average)
         overall_quality = (color_uniformity * 0.25 + 
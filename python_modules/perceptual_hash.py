@@ -0,0 +1,36 @@
+"""
+Perceptual hashing for near-duplicate uploads.
+
+dHash: the frame is reduced to a 9x8 grayscale thumbnail and every bit records
+whether a pixel is brighter than its right neighbour. Re-encoding, small
+exposure changes and slight hand movement between burst frames flip only a few
+of the 64 bits, so the Hamming distance between two hashes measures how alike
+two photos are.
+"""
+
+import cv2
+import numpy as np
+
+HASH_SIZE = 8  # 8x8 = 64-bit hashes
+
+
+def dhash(image: np.ndarray, hash_size: int = HASH_SIZE) -> int:
+    """Difference hash of a BGR or grayscale image as an int of hash_size**2 bits"""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    # INTER_AREA averages all source pixels, so the thumbnail ignores noise and JPEG artifacts
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(''.join('1' if bit else '0' for bit in bits), 2)
+
+
+def to_hex(value: int, hash_size: int = HASH_SIZE) -> str:
+    return f'{value:0{hash_size * hash_size // 4}x}'
+
+
+def from_hex(text: str) -> int:
+    return int(text, 16)
+
+
+def hamming(a: int, b: int) -> int:
+    """Number of differing bits"""
+    return bin(a ^ b).count('1')
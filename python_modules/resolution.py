@@ -0,0 +1,133 @@
+"""
+Working-resolution normalization for uploads.
+
+Phone photos reach 4000x3000 and more, but GrabCut, the HSV/LAB conversions,
+the annotation glow and the result JPEG gain nothing from that many pixels.
+normalize() caps the long edge of the image the analysis works on; the helpers
+below map working coordinates back to the original upload, which is only
+needed where full-resolution output is written (pepper crops) or reported.
+
+decode_reduced() goes one step earlier for large JPEGs: libjpeg scales the DCT
+blocks during decoding (1/2, 1/4, 1/8), so the full-size bitmap is never built
+unless a pepper crop needs it.
+"""
+
+import io
+import math
+from functools import partial
+from typing import Callable, NamedTuple, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# DCT scale factor -> OpenCV decode flag
+REDUCED_DECODE_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# A reduced decode may end up this much below max_side (a 4032px phone photo halves to 2016px)
+REDUCED_DECODE_TOLERANCE = 0.9
+
+# EXIF orientations that swap width and height (OpenCV applies them while decoding)
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+class DecodedImage(NamedTuple):
+    """An upload decoded for analysis (the AnalysisContext image inputs)"""
+    image: np.ndarray
+    original_shape: Optional[Tuple[int, ...]] = None            # set when image is a reduced decode
+    load_original: Optional[Callable[[], np.ndarray]] = None    # full-resolution decode, on demand
+
+
+def _decode_full(data: bytes) -> np.ndarray:
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError('Could not decode the full-resolution image')
+    return image
+
+
+def reduction_factor(width: int, height: int, max_side: int) -> int:
+    """Largest DCT scale factor that still leaves the long edge at about max_side or more (1 = full decode)"""
+    if not max_side:
+        return 1
+    long_side = max(width, height)
+    return next((factor for factor in sorted(REDUCED_DECODE_FLAGS, reverse=True)
+                 if long_side / factor >= max_side * REDUCED_DECODE_TOLERANCE), 1)
+
+
+def decode_reduced(data: bytes, max_side: int) -> Optional[DecodedImage]:
+    """
+    Decode a JPEG that is about twice max_side or larger (header size) at 1/2, 1/4
+    or 1/8 scale. Returns None for other images (the caller decodes them normally).
+    """
+    try:
+        # Only the header is parsed here
+        with Image.open(io.BytesIO(data)) as header:
+            if header.format != 'JPEG':
+                return None
+            width, height = header.size
+            orientation = header.getexif().get(0x0112, 1)
+    except Exception:
+        return None
+    if orientation in _TRANSPOSED_ORIENTATIONS:
+        width, height = height, width
+
+    factor = reduction_factor(width, height, max_side)
+    if factor == 1:
+        return None
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), REDUCED_DECODE_FLAGS[factor])
+    if image is None:
+        return None
+    if (image.shape[1] > image.shape[0]) != (width > height) and width != height:
+        width, height = height, width  # orientation handled differently than the header suggested
+    return DecodedImage(image, (height, width, image.shape[2]), partial(_decode_full, data))
+
+
+def normalize(image: np.ndarray, max_side: int) -> Tuple[np.ndarray, float]:
+    """
+    Downscale image so its long edge is at most max_side (0 disables the cap).
+    Returns (working_image, scale) with scale = working / original (1.0 when unchanged).
+    """
+    height, width = image.shape[:2]
+    long_side = max(height, width)
+    if not max_side or long_side <= max_side:
+        return image, 1.0
+    scale = max_side / float(long_side)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    # INTER_AREA averages the covered pixels (no aliasing on large reductions)
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA), scale
+
+
+def box_to_original(box: Sequence[float], scale: float) -> list:
+    """xyxy box in working coordinates -> original image coordinates (floats)"""
+    if scale == 1.0:
+        return list(box)
+    return [float(v) / scale for v in box]
+
+
+def crop_box_to_original(crop_box: Sequence[int], scale: float, shape) -> Tuple[int, int, int, int]:
+    """Integer (x1, y1, x2, y2) crop in working coordinates -> the covering crop in the original image"""
+    x1, y1, x2, y2 = crop_box
+    if scale == 1.0:
+        return int(x1), int(y1), int(x2), int(y2)
+    height, width = shape[:2]
+    return (max(0, int(math.floor(x1 / scale))), max(0, int(math.floor(y1 / scale))),
+            min(width, int(math.ceil(x2 / scale))), min(height, int(math.ceil(y2 / scale))))
+
+
+def mask_to_original(mask: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """Upsample a 0/255 mask to size (width, height) of the matching original crop, keeping it binary"""
+    if mask.shape[1] == size[0] and mask.shape[0] == size[1]:
+        return mask
+    resized = cv2.resize(mask, size, interpolation=cv2.INTER_LINEAR)
+    return np.where(resized >= 128, 255, 0).astype(np.uint8)
+
+
+def polygons_to_original(polygons: list, scale: float) -> list:
+    """Client overlay polygons ([[x, y], ...] lists) in working coordinates -> original image coordinates"""
+    if scale == 1.0:
+        return polygons
+    return [[[int(round(x / scale)), int(round(y / scale))] for x, y in polygon] for polygon in polygons]
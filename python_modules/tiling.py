@@ -0,0 +1,200 @@
+"""
+Sliced (tiled) inference for high-resolution images.
+
+YOLO letterboxes the whole photo down to its input size, so small peppers in a
+4000x3000 crate shot are missed or get poor boxes. Tiled inference runs the
+model on overlapping full-resolution tiles (as batches) plus one full-image
+pass for peppers larger than a tile, drops detections cut by an interior tile
+edge (the overlapping tile or the full pass sees them whole), and merges the
+rest globally with vectorized NMS.
+
+The analysis itself runs on a downscaled working copy; tiled_predict() tiles the
+full-resolution decode and maps the merged boxes and masks to the working image
+(output_scale), so the tiles keep their full detail.
+
+The merged output is a TiledResult, which offers the parts of an ultralytics
+Results object the analysis pipeline uses (boxes, names) plus a prebuilt
+mask index over the tile masks.
+"""
+
+import math
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import box_ops, timing
+from .mask_index import MaskIndex
+
+# Detections within this many pixels of an interior tile edge are treated as cut off
+EDGE_MARGIN = 2
+
+
+def should_tile(image_shape, config) -> bool:
+    """Tiled inference is on and the image's long side reaches TILED_MIN_SIZE"""
+    return bool(config.get('TILED_INFERENCE')) and max(image_shape[:2]) >= config.get('TILED_MIN_SIZE', 2500)
+
+
+def tile_grid(width: int, height: int, tile_size: int, overlap: float) -> List[Tuple[int, int, int, int]]:
+    """Overlapping (x1, y1, x2, y2) tiles covering the image; the last row/column is aligned to the edge"""
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        stride = max(1, int(tile_size * (1.0 - overlap)))
+        count = math.ceil((length - tile_size) / stride) + 1
+        return sorted({min(i * stride, length - tile_size) for i in range(count)})
+
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+            for y in starts(height) for x in starts(width)]
+
+
+class TiledBoxes:
+    """NumPy-backed stand-in for ultralytics Boxes: data columns x1, y1, x2, y2, conf, cls"""
+
+    def __init__(self, data: np.ndarray):
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+class TiledMaskIndex:
+    """
+    MaskIndex-compatible lookup for merged tile detections: each detection keeps
+    the mask of the tile (or full-image pass) it came from.
+    """
+
+    def __init__(self, sources: Sequence[Optional[tuple]], bboxes: np.ndarray):
+        # sources[i] = (MaskIndex of the source tile, mask index in that tile, tile (x1, y1, x2, y2)) or None
+        self.sources = list(sources)
+        self.bboxes = bboxes
+        self.valid = np.array([source is not None and bool(source[0].valid[source[1]])
+                               for source in self.sources], dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.sources)
+
+    def index_for(self, box_index: Optional[int], bbox: Sequence[float]) -> int:
+        if box_index is not None and 0 <= box_index < len(self) and self.valid[box_index]:
+            return int(box_index)
+        if not self.valid.any():
+            return -1
+        candidates = np.flatnonzero(self.valid)
+        best_iou, best_idx = box_ops.best_overlap([bbox], self.bboxes[candidates])
+        return int(candidates[best_idx[0]]) if best_iou[0] > 0 else -1
+
+    def roi_mask(self, index: int, roi: Tuple[int, int, int, int]) -> np.ndarray:
+        """Binary (0/1 uint8) mask for the ROI in image coordinates; zero outside the source tile"""
+        mask_index, local_index, (tx1, ty1, tx2, ty2) = self.sources[index]
+        x1, y1, x2, y2 = roi
+        out = np.zeros((max(0, y2 - y1), max(0, x2 - x1)), dtype=np.uint8)
+        cx1, cy1, cx2, cy2 = max(x1, tx1), max(y1, ty1), min(x2, tx2), min(y2, ty2)
+        if cx2 > cx1 and cy2 > cy1:
+            out[cy1 - y1:cy2 - y1, cx1 - x1:cx2 - x1] = mask_index.roi_mask(
+                local_index, (cx1 - tx1, cy1 - ty1, cx2 - tx1, cy2 - ty1)
+            )
+        return out
+
+
+class TiledResult:
+    """Merged detections of a tiled prediction (the subset of ultralytics Results used downstream)"""
+
+    def __init__(self, boxes: TiledBoxes, names, orig_shape, mask_index=None, tile_count=0):
+        self.boxes = boxes
+        self.names = names
+        self.masks = None  # masks live in mask_index (per source tile)
+        self.mask_index = mask_index
+        self.orig_shape = orig_shape
+        self.tile_count = tile_count
+
+
+def _edge_cut(xyxy: np.ndarray, tile, width: int, height: int) -> np.ndarray:
+    """Boxes (tile coordinates) touching a tile edge that lies inside the image"""
+    tx1, ty1, tx2, ty2 = tile
+    tile_w, tile_h = tx2 - tx1, ty2 - ty1
+    cut = np.zeros(len(xyxy), dtype=bool)
+    if tx1 > 0:
+        cut |= xyxy[:, 0] <= EDGE_MARGIN
+    if ty1 > 0:
+        cut |= xyxy[:, 1] <= EDGE_MARGIN
+    if tx2 < width:
+        cut |= xyxy[:, 2] >= tile_w - EDGE_MARGIN
+    if ty2 < height:
+        cut |= xyxy[:, 3] >= tile_h - EDGE_MARGIN
+    return cut
+
+
+def _scale_tile(tile, scale: float) -> Tuple[int, int, int, int]:
+    return tuple(int(round(v * scale)) for v in tile)
+
+
+def tiled_predict(model, image: np.ndarray, tile_size: int = 1024, overlap: float = 0.2,
+                  batch_size: int = 8, full_image_pass: bool = True, iou_threshold: float = 0.5,
+                  output_scale: float = 1.0, **kwargs) -> TiledResult:
+    """
+    Run model on overlapping tiles of image (batch_size tiles per forward pass) and
+    merge the detections into one TiledResult in image coordinates multiplied by
+    output_scale (e.g. full-resolution image in, working-image coordinates out).
+    kwargs are passed to every model call (conf, iou, ...).
+    """
+    height, width = image.shape[:2]
+    tiles = tile_grid(width, height, tile_size, overlap)
+    sources = [(tile, image[tile[1]:tile[3], tile[0]:tile[2]]) for tile in tiles]
+    if full_image_pass and len(tiles) > 1:
+        sources.append(((0, 0, width, height), image))
+
+    start = time.perf_counter()
+    results = []
+    with timing.stage('inference.tiled'):
+        batch_size = max(1, int(batch_size))
+        for i in range(0, len(tiles), batch_size):
+            results.extend(model([crop for _, crop in sources[i:min(i + batch_size, len(tiles))]], **kwargs))
+        # The full image has a different size from the tiles, so it gets its own call
+        for _, crop in sources[len(tiles):]:
+            results.extend(model(crop, **kwargs))
+
+        # Global merge: tile boxes -> image coordinates, drop cut-off boxes, class-agnostic NMS
+        all_xyxy, all_conf, all_cls, origin = [], [], [], []
+        for source_no, ((tile, _), result) in enumerate(zip(sources, results)):
+            xyxy, conf, cls = box_ops.boxes_to_numpy(result.boxes)
+            is_full = tile == (0, 0, width, height)
+            keep = np.ones(len(xyxy), dtype=bool) if is_full else ~_edge_cut(xyxy, tile, width, height)
+            local = np.flatnonzero(keep)
+            all_xyxy.append(xyxy[local] + np.array([tile[0], tile[1], tile[0], tile[1]], dtype=np.float32))
+            all_conf.append(conf[local])
+            all_cls.append(cls[local])
+            origin.extend((source_no, int(i)) for i in local)
+
+        xyxy = np.concatenate(all_xyxy) if all_xyxy else np.zeros((0, 4), dtype=np.float32)
+        conf = np.concatenate(all_conf) if all_conf else np.zeros((0,), dtype=np.float32)
+        cls = np.concatenate(all_cls) if all_cls else np.zeros((0,), dtype=np.int64)
+        keep = box_ops.nms(xyxy, conf, iou_threshold)
+        data = np.concatenate([xyxy[keep], conf[keep, None], cls[keep, None].astype(np.float32)], axis=1) \
+            if len(keep) else np.zeros((0, 6), dtype=np.float32)
+        if output_scale != 1.0:
+            data[:, :4] *= output_scale
+
+        # Masks stay at tile resolution; index only the tiles that contributed a detection
+        mask_index = None
+        if any(getattr(result, 'masks', None) is not None for result in results):
+            tile_indexes = {}
+            mask_sources = []
+            for k in keep:
+                source_no, local_index = origin[k]
+                result = results[source_no]
+                if getattr(result, 'masks', None) is None:
+                    mask_sources.append(None)
+                    continue
+                # Tile in output coordinates; its masks are interpolated straight to that size
+                tile = _scale_tile(sources[source_no][0], output_scale)
+                if source_no not in tile_indexes:
+                    tile_indexes[source_no] = MaskIndex(result.masks, (tile[3] - tile[1], tile[2] - tile[0]))
+                mask_sources.append((tile_indexes[source_no], local_index, tile))
+            mask_index = TiledMaskIndex(mask_sources, data[:, :4])
+
+    print(f"🧩 Tiled inference: {len(tiles)} tiles of {tile_size}px"
+          f"{' + full image' if len(sources) > len(tiles) else ''}, {len(xyxy)} -> {len(keep)} detections "
+          f"in {(time.perf_counter() - start) * 1000:.0f}ms")
+    names = getattr(results[0], 'names', None) if results else getattr(model, 'names', None)
+    return TiledResult(TiledBoxes(data), names, (int(round(height * output_scale)), int(round(width * output_scale))),
+                       mask_index, len(tiles))
@@ -0,0 +1,157 @@
+"""
+Per-stage timing instrumentation for the analysis pipeline.
+
+A StageTimer collects wall-clock durations per named stage for one request.
+The timer is activated for the current thread, so helper modules (validation
+pipeline, quality analyzer, CV helpers) can record stages with `stage()` or
+`@timed()` without passing the timer around. Finished timers are aggregated
+in-process into per-stage histograms.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Optional
+
+# Histogram bucket upper bounds in milliseconds (last bucket is +inf)
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+
+_local = threading.local()
+
+
+class StageTimer:
+    """
+    Accumulates durations (ms) per stage name; repeated stages (e.g. once per pepper) are summed
+    """
+
+    def __init__(self):
+        self.created = time.perf_counter()
+        self.stages: Dict[str, list] = {}  # name -> [total_ms, count]
+        self._lock = threading.Lock()
+
+    def add(self, name: str, elapsed_ms: float) -> None:
+        with self._lock:
+            entry = self.stages.setdefault(name, [0.0, 0])
+            entry[0] += elapsed_ms
+            entry[1] += 1
+
+    def merge(self, stages: Dict[str, list]) -> None:
+        """Add the stage totals of another timer (e.g. one that ran in a worker process)"""
+        with self._lock:
+            for name, (total_ms, count) in stages.items():
+                entry = self.stages.setdefault(name, [0.0, 0])
+                entry[0] += total_ms
+                entry[1] += count
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000.0)
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.created) * 1000.0
+
+    def as_dict(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {name: {'ms': round(total, 2), 'count': count}
+                    for name, (total, count) in self.stages.items()}
+
+
+def activate(timer: Optional[StageTimer]) -> Optional[StageTimer]:
+    """Make timer the current thread's timer; returns the previous one (pass it to deactivate)"""
+    previous = getattr(_local, 'timer', None)
+    _local.timer = timer
+    return previous
+
+
+def deactivate(previous: Optional[StageTimer] = None) -> None:
+    _local.timer = previous
+
+
+def current_timer() -> Optional[StageTimer]:
+    return getattr(_local, 'timer', None)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block against the current thread's timer (no-op when none is active)"""
+    timer = current_timer()
+    if timer is None:
+        yield None
+        return
+    with timer.stage(name):
+        yield timer
+
+
+def add(name: str, elapsed_ms: float) -> None:
+    """Record an already measured duration against the current thread's timer"""
+    timer = current_timer()
+    if timer is not None:
+        timer.add(name, elapsed_ms)
+
+
+def timed(name: str):
+    """Decorator form of stage()"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TimingHistograms:
+    """
+    Thread-safe in-process aggregation of stage timings into fixed-bucket histograms
+    """
+
+    def __init__(self, buckets_ms=HISTOGRAM_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self._lock = threading.Lock()
+        self._stages: Dict[str, dict] = {}
+
+    def observe(self, name: str, elapsed_ms: float) -> None:
+        with self._lock:
+            entry = self._stages.get(name)
+            if entry is None:
+                entry = {'count': 0, 'sum_ms': 0.0, 'max_ms': 0.0,
+                         'buckets': [0] * (len(self.buckets_ms) + 1)}
+                self._stages[name] = entry
+            entry['count'] += 1
+            entry['sum_ms'] += elapsed_ms
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            entry['buckets'][bisect_left(self.buckets_ms, elapsed_ms)] += 1
+
+    def record(self, timer: StageTimer, total_name: str = 'total') -> None:
+        """Add one request's stage totals (and its overall duration) to the histograms"""
+        for name, values in timer.as_dict().items():
+            self.observe(name, values['ms'])
+        self.observe(total_name, timer.total_ms())
+
+    def snapshot(self) -> Dict[str, dict]:
+        labels = [f'le_{b}' for b in self.buckets_ms] + ['le_inf']
+        with self._lock:
+            return {
+                name: {
+                    'count': entry['count'],
+                    'sum_ms': round(entry['sum_ms'], 2),
+                    'avg_ms': round(entry['sum_ms'] / entry['count'], 2) if entry['count'] else 0.0,
+                    'max_ms': round(entry['max_ms'], 2),
+                    'buckets': dict(zip(labels, entry['buckets']))
+                }
+                for name, entry in sorted(self._stages.items())
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+
+
+# Process-wide aggregate
+HISTOGRAMS = TimingHistograms()
@@ -0,0 +1,231 @@
+"""
+Content-addressed result cache for /upload.
+
+Users often re-upload the same photo (retries, photos shared between team
+members, re-analysis). The upload bytes are hashed with SHA-256 before they are
+decoded; when a completed analysis of the same bytes exists for the same
+request options and the same model/config version, it is re-linked to the new
+request instead of recomputed: a new history entry (with copies of its pepper
+rows) pointing at the existing upload, result and crop files, and the stored
+response. No model runs and no files are written.
+
+Entries live in the database, so web and job worker processes share them. They
+are evicted least-recently-used beyond a maximum count and after a TTL. The
+version covers the registered models, their weight files and the config that
+changes results, so entries stop matching as soon as the weights change.
+
+Camera bursts from the PWA are near-identical frames with different bytes.
+Each analysis also records a perceptual hash (dHash) per user; an upload whose
+hash is within a Hamming distance of one analyzed by the same user in the last
+few seconds reuses that analysis the same way (burst coalescing). Frames that
+arrive while a similar frame of the same user is still being analyzed in this
+process wait for that analysis instead of starting their own.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+from models import db, AnalysisCacheEntry, AnalysisHistory, BellPepperDetection, UploadFingerprint
+from python_modules import perceptual_hash
+
+# App config keys that change analysis results
+VERSION_CONFIG_KEYS = (
+    'INFERENCE_MODE', 'CASCADE_MIN_CONFIDENCE', 'CASCADE_ROI_PADDING',
+    'WORKING_MAX_SIDE', 'REDUCED_DECODE',
+    'TILED_INFERENCE', 'TILED_MIN_SIZE', 'TILE_SIZE', 'TILE_OVERLAP', 'TILED_FULL_IMAGE_PASS',
+)
+
+# BellPepperDetection columns that are not copied when re-linking
+_DETECTION_KEYS = ('id', 'analysis_id', 'user_id', 'created_at')
+
+# Analyses running in this process: user_id -> [(perceptual hash, options, done event)]
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def content_hash(data):
+    """SHA-256 hex digest of the upload bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def model_version(weight_paths, config, model_keys):
+    """
+    Fingerprint of the models and result-relevant config: size and mtime of every
+    weight file that exists, the registered model keys, and VERSION_CONFIG_KEYS.
+    Nothing is loaded; a model whose weight file is missing shows up in the weights.
+    """
+    weights = []
+    for path in weight_paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        weights.append([path, stat.st_size, stat.st_mtime_ns])
+    state = {
+        'weights': weights,
+        'models': sorted(model_keys),
+        'config': {key: config.get(key) for key in VERSION_CONFIG_KEYS},
+    }
+    return hashlib.sha256(json.dumps(state, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def options_key(overlay_mode, skip_stages, precheck_mode):
+    """Request options that change the response (the pre-check mode decides whether image_quality is attached)"""
+    return f"overlay={overlay_mode};skip={','.join(sorted(skip_stages))};precheck={precheck_mode}"
+
+
+def _files_exist(analysis, results_folder):
+    """Upload, result and pepper crop files of analysis are all still on disk"""
+    paths = [analysis.image_path, analysis.result_path]
+    paths += [os.path.join(results_folder, crop_path) for (crop_path,) in
+              db.session.query(BellPepperDetection.crop_path).filter_by(analysis_id=analysis.id)]
+    return all(os.path.exists(path) for path in paths if path)
+
+
+def lookup(digest, options, version, user_id, ttl_s, results_folder):
+    """
+    Re-link the cached analysis of digest for user_id (crop files are looked up in results_folder). Returns the cached response
+    with the new analysis_id and a 'reused' block naming the source analysis, or None on a miss (expired entries and entries whose
+    analysis or files are gone are removed). Commits on a hit.
+    """
+    entry = AnalysisCacheEntry.query.filter_by(content_hash=digest, options=options, version=version) \
+        .order_by(AnalysisCacheEntry.last_used_at.desc()).first()
+    if entry is None:
+        return None
+    now = datetime.utcnow()
+    source = entry.analysis
+    if entry.created_at < now - timedelta(seconds=ttl_s) or source is None or not _files_exist(source, results_folder):
+        db.session.delete(entry)
+        db.session.commit()
+        return None
+
+    analysis = _relink(source, user_id)
+    entry.hits = (entry.hits or 0) + 1
+    entry.last_used_at = now
+    db.session.commit()
+
+    response = json.loads(entry.response)
+    response['analysis_id'] = analysis.id
+    response['reused'] = {'source': 'result_cache', 'analysis_id': source.id}
+    return response
+
+
+def _relink(source, user_id):
+    """New history entry (and pepper rows) for user_id sharing the files of source; added and flushed, not committed"""
+    analysis = AnalysisHistory(
+        user_id=user_id,
+        image_path=source.image_path,
+        result_path=source.result_path,
+        peppers_found=source.peppers_found,
+        avg_quality=source.avg_quality,
+        analysis_data=source.analysis_data
+    )
+    db.session.add(analysis)
+    db.session.flush()  # Get analysis.id before copying the peppers
+    for row in BellPepperDetection.query.filter_by(analysis_id=source.id).order_by(BellPepperDetection.id):
+        values = {column.name: getattr(row, column.name) for column in BellPepperDetection.__table__.columns
+                  if column.name not in _DETECTION_KEYS}
+        db.session.add(BellPepperDetection(analysis_id=analysis.id, user_id=user_id, **values))
+    return analysis
+
+
+def store(digest, options, version, analysis_id, response, max_entries, ttl_s):
+    """Remember a completed analysis and evict old entries"""
+    payload = {key: value for key, value in response.items() if key not in ('analysis_id', 'timings')}
+    db.session.add(AnalysisCacheEntry(
+        content_hash=digest,
+        options=options,
+        version=version,
+        analysis_id=analysis_id,
+        response=json.dumps(payload)
+    ))
+    db.session.commit()
+    prune(version, max_entries, ttl_s)
+
+
+def prune(version, max_entries, ttl_s):
+    """Delete expired entries, entries of other model/config versions, and the least recently used beyond max_entries"""
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl_s)
+    AnalysisCacheEntry.query.filter(
+        (AnalysisCacheEntry.created_at < cutoff) | (AnalysisCacheEntry.version != version)
+    ).delete(synchronize_session=False)
+    evicted = [entry_id for (entry_id,) in db.session.query(AnalysisCacheEntry.id)
+               .order_by(AnalysisCacheEntry.last_used_at.desc()).offset(max_entries)]
+    if evicted:
+        AnalysisCacheEntry.query.filter(AnalysisCacheEntry.id.in_(evicted)).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def lookup_similar(phash, options, version, user_id, max_distance, window_s, results_folder):
+    """
+    Re-link the most similar analysis of user_id from the last window_s seconds whose
+    perceptual hash is within max_distance bits of phash. Returns the response (with the
+    new analysis_id and a 'reused' block naming the source analysis) or None. Commits on a hit.
+    """
+    since = datetime.utcnow() - timedelta(seconds=window_s)
+    recent = UploadFingerprint.query.filter(
+        UploadFingerprint.user_id == user_id,
+        UploadFingerprint.options == options,
+        UploadFingerprint.version == version,
+        UploadFingerprint.created_at >= since
+    ).order_by(UploadFingerprint.created_at.desc()).all()
+    best, best_distance = None, max_distance + 1
+    for fingerprint in recent:
+        distance = perceptual_hash.hamming(phash, perceptual_hash.from_hex(fingerprint.perceptual_hash))
+        if distance < best_distance:
+            best, best_distance = fingerprint, distance
+    if best is None or best.analysis is None or not _files_exist(best.analysis, results_folder):
+        return None
+
+    analysis = _relink(best.analysis, user_id)
+    db.session.commit()
+    response = json.loads(best.response)
+    response['analysis_id'] = analysis.id
+    response['reused'] = {'source': 'burst', 'analysis_id': best.analysis_id, 'hamming_distance': best_distance}
+    return response
+
+
+def remember_upload(phash, options, version, user_id, analysis_id, response, window_s):
+    """Index a completed analysis for burst coalescing and drop fingerprints older than the window"""
+    payload = {key: value for key, value in response.items() if key not in ('analysis_id', 'timings')}
+    db.session.add(UploadFingerprint(
+        user_id=user_id,
+        perceptual_hash=perceptual_hash.to_hex(phash),
+        options=options,
+        version=version,
+        analysis_id=analysis_id,
+        response=json.dumps(payload)
+    ))
+    UploadFingerprint.query.filter(
+        UploadFingerprint.created_at < datetime.utcnow() - timedelta(seconds=window_s)
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def begin_analysis(user_id, phash, options, max_distance):
+    """
+    Register a running analysis in this process. Returns (registration, events): pass the
+    registration to end_analysis(); events belong to similar analyses of the same user
+    registered earlier, which the caller can wait for and then reuse.
+    """
+    token = (phash, options, threading.Event())
+    with _in_flight_lock:
+        running = _in_flight.setdefault(user_id, [])
+        events = [event for other, other_options, event in running
+                  if other_options == options and perceptual_hash.hamming(phash, other) <= max_distance]
+        running.append(token)
+    return (user_id, token), events
+
+
+def end_analysis(registration):
+    user_id, token = registration
+    with _in_flight_lock:
+        running = _in_flight.get(user_id, [])
+        if token in running:
+            running.remove(token)
+        if not running:
+            _in_flight.pop(user_id, None)
+    token[2].set()
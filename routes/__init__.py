@@ -9,6 +9,7 @@ statistics_bp = Blueprint('statistics', __name__)
 export_bp = Blueprint('export', __name__)
 pepper_database_bp = Blueprint('pepper_database', __name__)
 notifications_bp = Blueprint('notifications', __name__)
+jobs_bp = Blueprint('jobs', __name__)
 
 # Import route handlers
 from . import history
@@ -16,4 +17,5 @@ from . import statistics
 from . import export
 from . import pepper_database
 from . import notifications
+from . import jobs
 
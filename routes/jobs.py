@@ -0,0 +1,74 @@
+"""
+Asynchronous analysis job routes: status polling and a Server-Sent Events stream
+"""
+import json
+import time
+from flask import Response, current_app, jsonify, session, stream_with_context
+from functools import wraps
+from models import db, AnalysisJob
+from analysis_jobs import FINISHED_STATUSES
+from . import jobs_bp
+
+# Login required decorator (JSON API)
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return jsonify({'error': 'Authentication required'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+def _get_user_job(job_id):
+    """The job if it belongs to the current user (admins can see every job)"""
+    job = AnalysisJob.query.get(job_id)
+    if job is None:
+        return None
+    if job.user_id != session['user_id'] and session.get('role') != 'admin':
+        return None
+    return job
+
+@jobs_bp.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    """Job status; once done the payload carries the same result JSON as a synchronous /upload"""
+    job = _get_user_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@jobs_bp.route('/jobs/<job_id>/events')
+@login_required
+def job_events(job_id):
+    """Server-Sent Events: 'status' on every status change, then 'done' or 'failed' with the job payload"""
+    if _get_user_job(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    poll_interval = current_app.config['JOB_POLL_INTERVAL']
+    timeout = current_app.config['JOB_EVENTS_TIMEOUT']
+    
+    def stream():
+        last_status = None
+        last_send = time.time()
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            # Drop cached rows so every poll sees the worker's latest commit
+            db.session.expire_all()
+            job = AnalysisJob.query.get(job_id)
+            if job.status != last_status:
+                last_status = job.status
+                last_send = time.time()
+                yield f"event: status\ndata: {json.dumps({'job_id': job.id, 'status': job.status})}\n\n"
+            if job.status in FINISHED_STATUSES:
+                yield f"event: {job.status}\ndata: {json.dumps(job.to_dict())}\n\n"
+                return
+            if time.time() - last_send > 15:
+                # Comment line keeps proxies from closing an idle stream
+                last_send = time.time()
+                yield ": keep-alive\n\n"
+            time.sleep(poll_interval)
+        yield f"event: timeout\ndata: {json.dumps({'job_id': job_id, 'status': last_status})}\n\n"
+    
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # disable nginx response buffering for this stream
+    })
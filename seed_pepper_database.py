@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 """Seed pepper database with initial data"""
-from app import app, db
-from models import PepperType, PepperVariety, PepperDisease
+from app_factory import create_app
+from models import db, PepperType, PepperVariety, PepperDisease
 import json
 
+app = create_app()  # config and database only, no ML models
+
 with app.app_context():
     print("🌶️ Seeding pepper database...")
     
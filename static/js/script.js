@@ -252,6 +252,65 @@
         function clearOverlays() {
             const overlay = document.getElementById('imageOverlay');
             if (overlay) overlay.remove();
+            const maskCanvas = document.getElementById('maskCanvas');
+            if (maskCanvas) maskCanvas.remove();
+        }
+        
+        // Client-side overlay: draw server-provided mask polygons on a canvas over the original upload
+        function renderMaskPolygons(imgEl, peppers, originalWidth, originalHeight) {
+            clearOverlays();
+            if (!imgEl || !peppers || peppers.length === 0 || !originalWidth || !originalHeight) return;
+            
+            const wrapper = imgEl.parentElement || imageContainer;
+            if (!wrapper) return;
+            if (getComputedStyle(wrapper).position === 'static') {
+                wrapper.style.position = 'relative';
+            }
+            
+            const displayWidth = imgEl.clientWidth || imgEl.width;
+            const displayHeight = imgEl.clientHeight || imgEl.height;
+            if (!displayWidth || !displayHeight) return;
+            
+            const maskCanvas = document.createElement('canvas');
+            maskCanvas.id = 'maskCanvas';
+            maskCanvas.width = displayWidth;
+            maskCanvas.height = displayHeight;
+            maskCanvas.style.cssText = `
+                position: absolute;
+                left: ${imgEl.offsetLeft}px;
+                top: ${imgEl.offsetTop}px;
+                width: ${displayWidth}px;
+                height: ${displayHeight}px;
+                pointer-events: none;
+            `;
+            wrapper.appendChild(maskCanvas);
+            
+            const ctx = maskCanvas.getContext('2d');
+            const scaleX = displayWidth / originalWidth;
+            const scaleY = displayHeight / originalHeight;
+            
+            // Same look as the server-rendered highlight: soft body tint plus outer glow
+            ctx.fillStyle = 'rgba(105, 108, 255, 0.25)';
+            ctx.strokeStyle = 'rgba(105, 108, 255, 0.6)';
+            ctx.lineWidth = 2;
+            ctx.shadowColor = 'rgba(105, 108, 255, 0.8)';
+            ctx.shadowBlur = 12;
+            
+            peppers.forEach(p => {
+                if (!p || !Array.isArray(p.mask_polygons)) return;
+                p.mask_polygons.forEach(poly => {
+                    if (!Array.isArray(poly) || poly.length < 3) return;
+                    ctx.beginPath();
+                    poly.forEach(([x, y], idx) => {
+                        const px = x * scaleX;
+                        const py = y * scaleY;
+                        if (idx === 0) ctx.moveTo(px, py); else ctx.lineTo(px, py);
+                    });
+                    ctx.closePath();
+                    ctx.fill();
+                    ctx.stroke();
+                });
+            });
         }
         
         function renderBreathingOverlays(imgEl, peppers, originalWidth, originalHeight) {
@@ -1197,15 +1256,20 @@
         }
 
         // Upload functions
+        // Ask the server for vector masks and draw the overlay here instead of fetching a rendered res_*.jpg
+        const OVERLAY_MODE = 'client';
+        
         async function uploadBlob(blob) {
             const fd = new FormData();
             fd.append('image', blob, 'capture.jpg');
+            fd.append('overlay', OVERLAY_MODE);
             await sendForm(fd);
         }
 
         async function uploadFile(file) {
             const fd = new FormData();
             fd.append('image', file);
+            fd.append('overlay', OVERLAY_MODE);
             await sendForm(fd);
         }
 
@@ -1334,6 +1398,26 @@
             }
         }
 
+        // 422 from the image-quality pre-check: reasons plus the option to analyze the photo anyway
+        function showPrecheckRejection(data, fd) {
+            statusDiv.className = 'error';
+            statusDiv.innerHTML = '<i class="fas fa-exclamation-triangle"></i> ';
+            const message = document.createElement('span');
+            message.textContent = data.error || 'This photo did not pass the image-quality check. Please retake it.';
+            statusDiv.appendChild(message);
+            
+            const analyzeAnyway = document.createElement('button');
+            analyzeAnyway.type = 'button';
+            analyzeAnyway.className = 'btn-analyze-anyway';
+            analyzeAnyway.textContent = 'Analyze anyway';
+            analyzeAnyway.addEventListener('click', () => {
+                fd.set('precheck', 'warn');
+                sendForm(fd);
+            });
+            statusDiv.appendChild(document.createTextNode(' '));
+            statusDiv.appendChild(analyzeAnyway);
+        }
+
         async function sendForm(fd) {
             processingStartTime = Date.now();
             updateStatus('Processing image...', 'info', true);
@@ -1355,28 +1439,29 @@
                 
                 const resp = await fetch('/upload', { method: 'POST', body: fd });
                 
-                // Check if upload failed due to offline
-                if (!resp.ok) {
-                    const errorData = await resp.json().catch(() => ({}));
-                    if (errorData.offline || errorData.queued) {
-                        hideProgressBar();
-                        await queueUploadForLater(fd);
-                        return;
-                    }
-                }
-                
                 // Update progress during fetch
                 updateProgress(2, 60, 'Analyzing quality with ANFIS...');
                 
-                const data = await resp.json();
-                
-                updateProgress(3, 90, 'Saving to database...');
+                // The body can only be read once; error responses carry JSON too
+                const data = await resp.json().catch(() => ({}));
                 
                 if (!resp.ok) {
                     hideProgressBar();
+                    // Check if upload failed due to offline
+                    if (data.offline || data.queued) {
+                        await queueUploadForLater(fd);
+                        return;
+                    }
+                    // Photo rejected by the image-quality pre-check: show the retake advice
+                    if (data.rejected && data.image_quality) {
+                        showPrecheckRejection(data, fd);
+                        return;
+                    }
                     throw new Error(data.error || `Server error: ${resp.status}`);
                 }
                 
+                updateProgress(3, 90, 'Saving to database...');
+                
                 updateProgress(4, 100, 'Complete!');
                 
                 // Save to offline cache
@@ -1413,8 +1498,12 @@
                         imageContainer.classList.add('portrait');
                     }
                     
-                    // Render breathing overlays aligned to displayed size
-                    renderBreathingOverlays(previewImg, peppersLocal, this.naturalWidth, this.naturalHeight);
+                    // Render overlays aligned to displayed size
+                    if (data.overlay_mode === 'client') {
+                        renderMaskPolygons(previewImg, peppersLocal, this.naturalWidth, this.naturalHeight);
+                    } else {
+                        renderBreathingOverlays(previewImg, peppersLocal, this.naturalWidth, this.naturalHeight);
+                    }
                 };
                 
                 showImageContainer();
@@ -1451,7 +1540,20 @@
                     statusMessage += ` | Avg Quality: ${avgQuality}/100`;
                 }
                 
-                updateStatus(statusMessage, 'success');
+                // Result cache or burst coalescing answered with an earlier analysis
+                if (data.reused) {
+                    statusMessage += data.reused.source === 'burst'
+                        ? ' | Reused the analysis of a near-identical photo'
+                        : ' | Reused the analysis of this same photo';
+                }
+                
+                // Analyzed despite a failed pre-check (precheck=warn): keep the retake advice visible
+                if (data.image_quality && !data.image_quality.passed) {
+                    const advice = (data.image_quality.issues || []).map(issue => issue.message).join(' ');
+                    updateStatus(`${statusMessage} | Photo quality: ${advice}`, 'info');
+                } else {
+                    updateStatus(statusMessage, 'success');
+                }
                 
                 // Auto-scroll to Bell Pepper Detection section if peppers were found
                 if (data.bell_peppers && data.bell_peppers.length > 0) {
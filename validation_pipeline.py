@@ -9,6 +9,7 @@ import torch
 import torchvision.models as models
 import torchvision.transforms as transforms
 from PIL import Image
+from python_modules.timing import stage
 
 class BellPepperValidationPipeline:
     """
@@ -50,8 +51,28 @@ class BellPepperValidationPipeline:
         # Class names for debugging
         self.imagenet_classes = self._load_imagenet_classes()
         
+        # Cross-request micro-batching of classifier calls (see enable_micro_batching)
+        self._batcher = None
+        
         print("[SUCCESS] Pre-trained MobileNetV2 classifier loaded")
     
+    def enable_micro_batching(self, max_batch_size=8, max_wait_ms=10.0):
+        """Coalesce concurrent classifier calls (one per crop, from any request) into batched forward passes"""
+        from python_modules.micro_batch import MicroBatcher
+        self._batcher = MicroBatcher('mobilenet_v2', self._classify_batch, max_batch_size, max_wait_ms)
+    
+    def _classify_batch(self, input_tensors):
+        """Softmax ImageNet probabilities for a list of preprocessed crops"""
+        with torch.no_grad():
+            output = self.classifier(torch.stack(input_tensors))
+        return list(torch.nn.functional.softmax(output, dim=1))
+    
+    def classify(self, input_tensor):
+        """Softmax ImageNet probabilities for one preprocessed crop"""
+        if self._batcher is not None:
+            return self._batcher.submit(input_tensor)
+        return self._classify_batch([input_tensor])[0]
+    
     def _load_imagenet_classes(self):
         """Load ImageNet class labels"""
         # Simplified - just the ones we care about
@@ -80,14 +101,11 @@ class BellPepperValidationPipeline:
             
             # Preprocess
             input_tensor = self.transform(pil_image)
-            input_batch = input_tensor.unsqueeze(0)  # Add batch dimension
             
-            # Run inference
-            with torch.no_grad():
-                output = self.classifier(input_batch)
+            # Run inference (batched with other requests' crops when micro-batching is enabled)
+            probabilities = self.classify(input_tensor)
             
             # Get top-k predictions
-            probabilities = torch.nn.functional.softmax(output[0], dim=0)
             top_probs, top_indices = torch.topk(probabilities, top_k)
             
             # Convert to lists
@@ -273,19 +291,27 @@ class BellPepperValidationPipeline:
         print(f"\n  [VALIDATION] Running layered validation pipeline...")
         
         # Stage 1: Pre-trained model validation (most important)
-        if not self.validate_with_pretrained_model(crop_image):
+        with stage('validation.pretrained_model'):
+            passed = self.validate_with_pretrained_model(crop_image)
+        if not passed:
             return False, "pretrained_model"
         
         # Stage 2: Shape validation (fast)
-        if not self.validate_shape(bbox, image_shape):
+        with stage('validation.shape'):
+            passed = self.validate_shape(bbox, image_shape)
+        if not passed:
             return False, "shape"
         
         # Stage 3: Color validation
-        if not self.validate_color(crop_image):
+        with stage('validation.color'):
+            passed = self.validate_color(crop_image)
+        if not passed:
             return False, "color"
         
         # Stage 4: Texture validation
-        if not self.validate_texture(crop_image):
+        with stage('validation.texture'):
+            passed = self.validate_texture(crop_image)
+        if not passed:
             return False, "texture"
         
         print(f"  [SUCCESS] All validation stages passed!")